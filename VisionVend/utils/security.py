@@ -0,0 +1,222 @@
+"""
+security.py - Message signing and verification for VisionVend MQTT traffic
+
+This module provides:
+- A key ring with one precomputed HMAC-SHA256 state per key id. Each message
+  copies that state instead of re-deriving the padded key.
+- A compact binary envelope: version, key id, nonce and timestamp, then the
+  payload, then a truncated MAC over all of it.
+- Constant-time digest comparison throughout
+- Key rotation: any key in the ring verifies, while the active key signs
+- A replay guard that rejects stale timestamps and repeated nonces
+
+Envelope layout (big-endian):
+
+    version:u8 | key_id:u8 | nonce:8s | timestamp:u32 | payload | mac:16s
+
+The ESP32 firmware carries a MicroPython port of the same format in
+src/esp32_s3/signing.py.
+
+Usage:
+    from VisionVend.utils.security import KeyRing, Signer, Verifier
+
+    keys = KeyRing.from_config(config["mqtt"])
+    envelope = Signer(keys).sign(b"tx123:pi_456")
+    payload = Verifier(keys).open(envelope)
+"""
+
+import hashlib
+import hmac
+import os
+import struct
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Mapping, Optional, Tuple, Union
+
+ENVELOPE_VERSION = 1
+HEADER = struct.Struct(">BB8sI")
+NONCE_SIZE = 8
+MAC_SIZE = 16
+DEFAULT_KEY_ID = 1
+DEFAULT_MAX_SKEW = 60
+
+BytesLike = Union[bytes, bytearray, memoryview]
+
+
+class EnvelopeError(ValueError):
+    """Message could not be authenticated"""
+
+
+class ReplayError(EnvelopeError):
+    """Authentic message that is too old, from the future, or already seen"""
+
+
+def _as_bytes(value: Union[str, BytesLike]) -> bytes:
+    return value.encode() if isinstance(value, str) else bytes(value)
+
+
+class KeyRing:
+    """HMAC keys by id, each with a precomputed keyed state"""
+
+    def __init__(self, keys: Mapping[int, Union[str, bytes]], active_key_id: Optional[int] = None):
+        if not keys:
+            raise ValueError("KeyRing needs at least one key")
+        self._states = {
+            int(key_id): hmac.new(_as_bytes(secret), digestmod=hashlib.sha256)
+            for key_id, secret in keys.items()
+        }
+        for key_id in self._states:
+            if not 0 <= key_id <= 255:
+                raise ValueError(f"Key id {key_id} does not fit in the envelope")
+        self.active_key_id = int(active_key_id) if active_key_id is not None else max(self._states)
+        if self.active_key_id not in self._states:
+            raise ValueError(f"Active key id {self.active_key_id} is not in the key ring")
+
+    @classmethod
+    def from_config(cls, mqtt_config: Mapping[str, Any]) -> "KeyRing":
+        """
+        Build from the ``mqtt`` config section.
+
+        ``hmac_keys`` maps key ids to secrets. ``hmac_key_id`` picks the signing
+        key. A bare ``hmac_secret`` is used as that key when ``hmac_keys`` doesn't
+        define it. To rotate, add the new key everywhere first, then switch
+        ``hmac_key_id``.
+        """
+        active = int(mqtt_config.get("hmac_key_id", DEFAULT_KEY_ID))
+        keys: Dict[int, Union[str, bytes]] = {
+            int(key_id): secret for key_id, secret in (mqtt_config.get("hmac_keys") or {}).items() if secret
+        }
+        if active not in keys and mqtt_config.get("hmac_secret"):
+            keys[active] = mqtt_config["hmac_secret"]
+        return cls(keys, active)
+
+    def __contains__(self, key_id: int) -> bool:
+        return key_id in self._states
+
+    def mac(self, key_id: int, data: BytesLike) -> bytes:
+        """Full HMAC-SHA256 of data under key_id."""
+        state = self._states[key_id].copy()
+        state.update(data)
+        return state.digest()
+
+    def verify_hex(self, data: BytesLike, received_hex: str) -> bool:
+        """Check a legacy ``payload|hexdigest`` MAC against every key in the ring."""
+        received = _as_bytes(received_hex.strip().lower())
+        matched = False
+        for key_id in self._states:
+            matched |= hmac.compare_digest(self.mac(key_id, data).hex().encode(), received)
+        return matched
+
+
+class ReplayGuard:
+    """Remembers nonces for the length of the timestamp window"""
+
+    def __init__(self, max_skew: float = DEFAULT_MAX_SKEW, max_entries: int = 100000):
+        self.max_skew = max_skew
+        self.max_entries = max_entries
+        self._seen: "OrderedDict[Tuple[int, bytes], float]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def check(self, key_id: int, nonce: bytes, timestamp: int, now: Optional[float] = None):
+        now = time.time() if now is None else now
+        if abs(now - timestamp) > self.max_skew:
+            raise ReplayError(f"Timestamp {timestamp} outside the {self.max_skew}s window")
+        key = (key_id, nonce)
+        with self._lock:
+            # A nonce can only be replayed while its timestamp is still inside the window
+            while self._seen:
+                oldest_key, expires = next(iter(self._seen.items()))
+                if expires > now and len(self._seen) < self.max_entries:
+                    break
+                del self._seen[oldest_key]
+            if key in self._seen:
+                raise ReplayError("Nonce already used")
+            self._seen[key] = timestamp + self.max_skew
+
+
+class Signer:
+    """Wraps payloads in signed envelopes using the ring's active key"""
+
+    def __init__(self, keys: KeyRing):
+        self.keys = keys
+
+    def sign(self, payload: Union[str, BytesLike], timestamp: Optional[int] = None,
+             nonce: Optional[bytes] = None) -> bytes:
+        header = HEADER.pack(
+            ENVELOPE_VERSION,
+            self.keys.active_key_id,
+            nonce if nonce is not None else os.urandom(NONCE_SIZE),
+            int(time.time()) if timestamp is None else timestamp,
+        )
+        message = header + _as_bytes(payload)
+        return message + self.keys.mac(self.keys.active_key_id, message)[:MAC_SIZE]
+
+
+class Verifier:
+    """Authenticates envelopes and rejects replays"""
+
+    def __init__(self, keys: KeyRing, max_skew: float = DEFAULT_MAX_SKEW,
+                 replay_guard: Optional[ReplayGuard] = None, accept_legacy: bool = False):
+        self.keys = keys
+        self.replay_guard = replay_guard or ReplayGuard(max_skew)
+        self.accept_legacy = accept_legacy
+        self.verified = 0
+        self.rejected = 0
+        self.replays = 0
+
+    def open(self, message: BytesLike, now: Optional[float] = None) -> bytes:
+        """Return the authenticated payload of an envelope, or raise EnvelopeError."""
+        try:
+            payload = self._open(bytes(message), now)
+        except ReplayError:
+            self.replays += 1
+            raise
+        except EnvelopeError:
+            self.rejected += 1
+            raise
+        self.verified += 1
+        return payload
+
+    def _open(self, message: bytes, now: Optional[float]) -> bytes:
+        if message[:1] != bytes((ENVELOPE_VERSION,)):
+            if self.accept_legacy:
+                return self._open_legacy(message)
+            raise EnvelopeError("Unsupported envelope version")
+        if len(message) < HEADER.size + MAC_SIZE:
+            raise EnvelopeError("Envelope too short")
+
+        body, received_mac = message[:-MAC_SIZE], message[-MAC_SIZE:]
+        _, key_id, nonce, timestamp = HEADER.unpack_from(body)
+        if key_id not in self.keys:
+            raise EnvelopeError(f"Unknown key id {key_id}")
+        if not hmac.compare_digest(self.keys.mac(key_id, body)[:MAC_SIZE], received_mac):
+            raise EnvelopeError("Bad MAC")
+        self.replay_guard.check(key_id, nonce, timestamp, now)
+        return body[HEADER.size:]
+
+    def _open_legacy(self, message: bytes) -> bytes:
+        """``payload|hexdigest`` messages from firmware that predates envelopes. No replay protection."""
+        payload, sep, received_hex = message.rpartition(b"|")
+        if not sep:
+            raise EnvelopeError("Malformed legacy message")
+        try:
+            received = received_hex.decode("ascii")
+        except UnicodeDecodeError:
+            raise EnvelopeError("Malformed legacy message")
+        if not self.keys.verify_hex(payload, received):
+            raise EnvelopeError("Bad MAC")
+        return payload
+
+    def stats(self) -> Dict[str, int]:
+        return {"verified": self.verified, "rejected": self.rejected, "replays": self.replays}
+
+
+def generate_hmac(payload: Union[str, BytesLike], secret: Union[str, bytes]) -> str:
+    """Hex HMAC-SHA256 in the legacy ``payload|hexdigest`` format."""
+    return hmac.new(_as_bytes(secret), _as_bytes(payload), hashlib.sha256).hexdigest()
+
+
+def verify_hmac(payload: Union[str, BytesLike], received_hex: str, secret: Union[str, bytes]) -> bool:
+    """Constant-time check of a legacy hex HMAC."""
+    return hmac.compare_digest(generate_hmac(payload, secret).encode(), _as_bytes(received_hex.strip().lower()))
@@ -0,0 +1,201 @@
+"""
+wire.py - Compact binary encoding for VisionVend MQTT payloads
+
+Replaces the colon/comma-joined strings and JSON telemetry with small
+little-endian struct records. SKUs may contain any character, and a status
+update is about 10 bytes on the LTE link instead of about 50. Signed messages
+are wrapped in the security.py envelope. Telemetry goes out bare.
+
+Every message starts with one byte: the format version in the high nibble and
+the message type in the low nibble. Strings are a u8 length followed by UTF-8.
+
+    UNLOCK     server -> device  tx:str | payment_intent:str
+    DOOR       device -> server  tx:str | delta_g:f32 | n:u8 | n x (sku:str | qty:u8)
+    RESULT     server -> device  tx:str | status:u8 | total_cents:u32
+    TELEMETRY  device -> server  flags:u8 | vcc_mv:u16 | n:u8 | n x mass_g:f32
+    TELEMETRY_WINDOW
+               device -> server  flags:u8 | samples:u16 | mass_g min/max/mean:3 x f32
+                                 | vcc_mv min/max/mean:3 x u16
+
+The ESP32 firmware carries a MicroPython port in src/esp32_s3/wire.py.
+
+Usage:
+    from VisionVend.utils import wire
+
+    data = wire.encode(wire.DoorEvent("tx1", (("cola", 2),), 660.0))
+    event = wire.decode(data)
+"""
+
+import struct
+from typing import NamedTuple, Tuple, Union
+
+WIRE_VERSION = 1
+
+UNLOCK = 1
+DOOR = 2
+RESULT = 3
+TELEMETRY = 4
+TELEMETRY_WINDOW = 5
+
+# RESULT status codes
+CAPTURED = 1
+CANCELLED = 2
+ERROR = 3
+
+FLAG_DOOR_OPEN = 0x01
+
+_U8 = struct.Struct("<B")
+_F32 = struct.Struct("<f")
+_RESULT_TAIL = struct.Struct("<BI")
+_TELEMETRY_HEAD = struct.Struct("<BHB")
+_TELEMETRY_WINDOW = struct.Struct("<BH3f3H")
+
+
+class WireError(ValueError):
+    """Payload is not a valid wire message"""
+
+
+class Unlock(NamedTuple):
+    transaction_id: str
+    payment_intent_id: str
+
+
+class DoorEvent(NamedTuple):
+    transaction_id: str
+    items: Tuple[Tuple[str, int], ...]  # (sku, quantity) pairs
+    delta_mass: float
+
+
+class Result(NamedTuple):
+    transaction_id: str
+    status: int
+    total_cents: int = 0
+
+
+class Telemetry(NamedTuple):
+    door_open: bool
+    vcc: float  # volts
+    masses: Tuple[float, ...]  # grams
+
+
+class TelemetryWindow(NamedTuple):
+    """Aggregated samples since the previous publish"""
+    door_open: bool
+    samples: int
+    mass: Tuple[float, float, float]  # min, max, mean grams
+    vcc: Tuple[float, float, float]  # min, max, mean volts
+
+
+Message = Union[Unlock, DoorEvent, Result, Telemetry, TelemetryWindow]
+
+
+def _millivolts(volts: float) -> int:
+    return max(0, min(int(round(volts * 1000)), 0xFFFF))
+
+
+def _header(message_type: int) -> bytes:
+    return _U8.pack((WIRE_VERSION << 4) | message_type)
+
+
+def _pack_str(value: str) -> bytes:
+    data = value.encode()
+    if len(data) > 255:
+        raise WireError(f"String too long for the wire format: {value[:32]}...")
+    return _U8.pack(len(data)) + data
+
+
+def _unpack_str(data: bytes, offset: int) -> Tuple[str, int]:
+    length = data[offset]
+    end = offset + 1 + length
+    if end > len(data):
+        raise WireError("Truncated string")
+    return data[offset + 1:end].decode(), end
+
+
+def encode(message: Message) -> bytes:
+    if isinstance(message, Unlock):
+        return _header(UNLOCK) + _pack_str(message.transaction_id) + _pack_str(message.payment_intent_id)
+    if isinstance(message, DoorEvent):
+        if len(message.items) > 255:
+            raise WireError("Too many SKUs in one door event")
+        parts = [_header(DOOR), _pack_str(message.transaction_id), _F32.pack(message.delta_mass),
+                 _U8.pack(len(message.items))]
+        for sku, quantity in message.items:
+            if not 0 <= quantity <= 255:
+                raise WireError(f"Quantity out of range for {sku}: {quantity}")
+            parts.append(_pack_str(sku))
+            parts.append(_U8.pack(int(quantity)))
+        return b"".join(parts)
+    if isinstance(message, Result):
+        return _header(RESULT) + _pack_str(message.transaction_id) + _RESULT_TAIL.pack(message.status, message.total_cents)
+    if isinstance(message, Telemetry):
+        flags = FLAG_DOOR_OPEN if message.door_open else 0
+        vcc_mv = _millivolts(message.vcc)
+        return (_header(TELEMETRY) + _TELEMETRY_HEAD.pack(flags, vcc_mv, len(message.masses))
+                + struct.pack(f"<{len(message.masses)}f", *message.masses))
+    if isinstance(message, TelemetryWindow):
+        return _header(TELEMETRY_WINDOW) + _TELEMETRY_WINDOW.pack(
+            FLAG_DOOR_OPEN if message.door_open else 0,
+            min(message.samples, 0xFFFF),
+            *message.mass,
+            *(_millivolts(v) for v in message.vcc),
+        )
+    raise TypeError(f"Cannot encode {type(message).__name__}")
+
+
+def message_type(data: bytes) -> int:
+    """Type code of an encoded message, or raise WireError if it isn't one."""
+    if not data or data[0] >> 4 != WIRE_VERSION:
+        raise WireError("Unsupported wire version")
+    return data[0] & 0x0F
+
+
+def decode(data: bytes) -> Message:
+    data = bytes(data)
+    kind = message_type(data)
+    try:
+        if kind == UNLOCK:
+            transaction_id, offset = _unpack_str(data, 1)
+            payment_intent_id, _ = _unpack_str(data, offset)
+            return Unlock(transaction_id, payment_intent_id)
+        if kind == DOOR:
+            transaction_id, offset = _unpack_str(data, 1)
+            (delta_mass,) = _F32.unpack_from(data, offset)
+            count = data[offset + 4]
+            offset += 5
+            items = []
+            for _ in range(count):
+                sku, offset = _unpack_str(data, offset)
+                items.append((sku, data[offset]))
+                offset += 1
+            return DoorEvent(transaction_id, tuple(items), delta_mass)
+        if kind == RESULT:
+            transaction_id, offset = _unpack_str(data, 1)
+            status, total_cents = _RESULT_TAIL.unpack_from(data, offset)
+            return Result(transaction_id, status, total_cents)
+        if kind == TELEMETRY:
+            flags, vcc_mv, count = _TELEMETRY_HEAD.unpack_from(data, 1)
+            masses = struct.unpack_from(f"<{count}f", data, 1 + _TELEMETRY_HEAD.size)
+            return Telemetry(bool(flags & FLAG_DOOR_OPEN), vcc_mv / 1000, masses)
+        if kind == TELEMETRY_WINDOW:
+            flags, samples, *values = _TELEMETRY_WINDOW.unpack_from(data, 1)
+            return TelemetryWindow(bool(flags & FLAG_DOOR_OPEN), samples, tuple(values[:3]),
+                                   tuple(mv / 1000 for mv in values[3:]))
+    except (struct.error, IndexError, UnicodeDecodeError) as e:
+        raise WireError(f"Malformed message of type {kind}: {e}")
+    raise WireError(f"Unknown message type {kind}")
+
+
+def parse_legacy_door(text: str) -> DoorEvent:
+    """``transaction_id:sku1,sku2:delta_mass`` from firmware that predates the wire format."""
+    try:
+        transaction_id, items_str, delta_mass = text.split(":")
+        delta = float(delta_mass) if delta_mass else 0.0
+    except ValueError:
+        raise WireError(f"Malformed legacy door event: {text!r}")
+    counts = {}
+    for sku in items_str.split(","):
+        sku = sku.strip()
+        if sku:
+            counts[sku] = counts.get(sku, 0) + 1
+    return DoorEvent(transaction_id, tuple(counts.items()), delta)
@@ -0,0 +1,138 @@
+"""
+door.py - Event-driven door lifecycle for the ESP32 controller
+
+The unlock handler used to poll the hall sensor from inside the MQTT callback
+for up to lock.timeout seconds. While it did, no other MQTT message was
+handled and no telemetry went out. DoorController is a uasyncio task instead:
+
+    IDLE -> UNLOCKED -> OPEN -> (closed) -> IDLE
+                 \\-----------> (timeout) -> IDLE
+
+Hall sensor edges arrive through a pin interrupt that sets a ThreadSafeFlag.
+The task wakes, debounces, and reads the pin, so nothing busy-waits. A wait
+also times out every poll_interval, which catches an edge the IRQ missed. On
+boards or simulators without IRQ support this polling is all there is.
+Unlock requests that arrive during a session are queued and run back to back.
+"""
+
+import time
+
+try:
+    import uasyncio as asyncio
+except ImportError:
+    import asyncio
+
+try:
+    from time import ticks_ms, ticks_diff
+except ImportError:
+    def ticks_ms():
+        return int(time.monotonic() * 1000)
+
+    def ticks_diff(a, b):
+        return a - b
+
+IDLE = "idle"
+UNLOCKED = "unlocked"
+OPEN = "open"
+
+
+def _edge_flag():
+    # ThreadSafeFlag may be set from an IRQ; plain Event is enough without one
+    flag_type = getattr(asyncio, "ThreadSafeFlag", None)
+    return flag_type() if flag_type else asyncio.Event()
+
+
+class DoorController:
+    """Runs one unlock session at a time from a queue of transaction ids"""
+
+    def __init__(self, lock, hall, weigh, on_closed, on_timeout, on_state=None, timeout=10,
+                 max_queue=4, debounce=0.02, poll_interval=0.5):
+        self.lock = lock
+        self.hall = hall
+        self.weigh = weigh  # () -> current weight
+        self.on_closed = on_closed  # (transaction_id, delta_mass)
+        self.on_timeout = on_timeout  # (transaction_id)
+        self.on_state = on_state  # (state, transaction_id)
+        self.timeout = timeout
+        self.max_queue = max_queue
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+
+        self.state = IDLE
+        self.transaction_id = None
+        self._queue = []
+        self._wake = asyncio.Event()
+        self._edge = _edge_flag()
+        self.sessions = 0
+        self.timeouts = 0
+
+    def door_open(self):
+        # Hall sensor reads low while the door is open
+        return not self.hall.value()
+
+    def _on_edge(self, _pin):
+        self._edge.set()  # IRQ context: no allocation, no logic
+
+    def request(self, transaction_id):
+        """Queue an unlock. Returns False for a duplicate or when the queue is full."""
+        if transaction_id == self.transaction_id or transaction_id in self._queue:
+            return False
+        if len(self._queue) >= self.max_queue:
+            return False
+        self._queue.append(transaction_id)
+        self._wake.set()
+        return True
+
+    def pending(self):
+        return len(self._queue)
+
+    def _set_state(self, state):
+        self.state = state
+        if self.on_state:
+            self.on_state(state, self.transaction_id)
+
+    async def _wait_edge(self, timeout_ms):
+        try:
+            await asyncio.wait_for(self._edge.wait(), min(timeout_ms / 1000, self.poll_interval))
+        except asyncio.TimeoutError:
+            return
+        if hasattr(self._edge, "clear"):
+            self._edge.clear()
+        await asyncio.sleep(self.debounce)  # let the reed contact settle
+
+    async def _session(self, transaction_id):
+        self.transaction_id = transaction_id
+        baseline_weight = self.weigh()
+        self.lock.value(1)
+        self._set_state(UNLOCKED)
+        started = ticks_ms()
+        try:
+            while True:
+                remaining = int(self.timeout * 1000) - ticks_diff(ticks_ms(), started)
+                if remaining <= 0:
+                    self.timeouts += 1
+                    self.on_timeout(transaction_id)
+                    return
+                await self._wait_edge(remaining)
+                if self.door_open():
+                    if self.state != OPEN:
+                        self._set_state(OPEN)
+                elif self.state == OPEN:  # opened and shut again
+                    self.lock.value(0)
+                    self.on_closed(transaction_id, baseline_weight - self.weigh())
+                    return
+        finally:
+            self.lock.value(0)
+            self.sessions += 1
+            self.transaction_id = None
+            self._set_state(IDLE)
+
+    async def run(self):
+        if hasattr(self.hall, "irq"):
+            self.hall.irq(trigger=self.hall.IRQ_FALLING | self.hall.IRQ_RISING, handler=self._on_edge)
+        self._set_state(IDLE)
+        while True:
+            await self._wake.wait()
+            self._wake.clear()
+            while self._queue:
+                await self._session(self._queue.pop(0))
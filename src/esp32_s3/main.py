@@ -49,9 +49,11 @@ else:
 
 import time
 import yaml
-import hmac
-import hashlib
-import ujson
+import wire
+from telemetry import TelemetryAggregator
+from weight import WeightSampler
+from door import DoorController, IDLE, UNLOCKED, OPEN
+from signing import KeyRing, Signer, Verifier, EnvelopeError, sync_clock
 
 # Load config
 with open("config/config.yaml", "r") as f:
@@ -64,6 +66,13 @@ wlan.connect(config["wifi"]["ssid"], config["wifi"]["password"])
 while not wlan.isconnected():
     time.sleep(1)
 
+sync_clock()
+
+# Message signing: keys are set up once, not per message
+message_keys = KeyRing.from_config(config["mqtt"])
+signer = Signer(message_keys)
+verifier = Verifier(message_keys)
+
 # MQTT setup
 mqtt_client = MQTTClient(config["mqtt"]["client_id"]+"_controller", config["mqtt"]["broker"], config["mqtt"]["port"])
 mqtt_client.connect()
@@ -82,29 +91,54 @@ adc.atten(ADC.ATTN_11DB)
 pi_signal = Pin(config["pins"]["pi_signal"], Pin.OUT)
 
 # Feedback functions
+# Last values written to the LED and OLED; unchanged writes are skipped
+_led_color = None
+_display_text = None
+
 def set_led(color):
+    global _led_color
     if isinstance(color, str):
         colors = {"green": (0, 255, 0), "blue": (0, 0, 255), "red": (255, 0, 0), "off": (0, 0, 0)}
-        neopixel[0] = colors.get(color, (0, 0, 0))
-    elif isinstance(color, tuple):
-        neopixel[0] = color
+        color = colors.get(color, (0, 0, 0))
+    if color == _led_color:
+        return
+    neopixel[0] = color
     neopixel.write()
+    _led_color = color
 
-def beep(duration=0.1):
+async def _beep(duration):
     buzzer.value(1)
-    time.sleep(duration)
+    await asyncio.sleep(duration)
     buzzer.value(0)
 
+def beep(duration=0.1):
+    asyncio.create_task(_beep(duration))
+
 def display_message(message):
+    global _display_text
+    if message == _display_text:
+        return
+    _display_text = message
     oled.fill(0)
     for i, line in enumerate(message.split("\n")):
         oled.text(line, 0, i * 10)
     oled.show()
 
-# Weight measurement
+# Weight measurement: sampled in the background, filtered estimate served instantly
+weight_config = config.get("weight", {})
+weight_sampler = WeightSampler(
+    hx711, hx711_dt,
+    window=weight_config.get("median_window", 5),
+    process_noise=weight_config.get("process_noise", 1.0),
+    measurement_noise=weight_config.get("measurement_noise", 100.0),
+)
+
 def read_weight():
-    samples = [hx711.read() for _ in range(10)]
-    return sum(samples) / len(samples)
+    weight = weight_sampler.estimate()
+    if weight is None:  # nothing sampled yet; fall back to one blocking conversion
+        weight_sampler.add(hx711.read())
+        weight = weight_sampler.estimate()
+    return weight
 
 # Battery monitoring
 def read_voltage():
@@ -139,64 +173,98 @@ async def autolabel_workflow(sku):
         for task in tasks:
             task.cancel()
 
-# MQTT callback
-def on_message(topic, msg):
-    payload, received_hmac = msg.decode().split("|")
-    if hmac.new(config["mqtt"]["hmac_secret"].encode(), payload.encode(), hashlib.sha256).hexdigest() == received_hmac:
-        if payload.startswith("unlock:"):
-            transaction_id = payload.split(":")[1]
-            baseline_weight = read_weight()
-            pi_signal.value(1)  # Signal Pi to start
-            mosfet.value(1)  # Unlock
-            display_message("Door Unlocked")
-            set_led("blue")
-            beep()
-            start_time = time.time()
-            door_was_open = False
-            while time.time() - start_time < config["lock"]["timeout"]:
-                if not hall_sensor.value():  # Door open
-                    door_was_open = True
-                elif door_was_open and hall_sensor.value():  # Door closed
-                    pi_signal.value(0)  # Signal Pi to stop
-                    final_weight = read_weight()
-                    delta_mass = baseline_weight - final_weight
-                    # Get items from Pi (simplified, assume GPIO/serial)
-                    removed_items = ["cola"]  # Placeholder for your main application logic
-                    payload = f"{transaction_id}:{','.join(removed_items) if removed_items else ''}:{delta_mass}"
-                    hmac_val = hmac.new(config["mqtt"]["hmac_secret"].encode(), payload.encode(), hashlib.sha256).hexdigest()
-                    mqtt_client.publish(config["mqtt"]["door_topic"], f"{payload}|{hmac_val}")
-                    break
-                time.sleep(0.1)
-            mosfet.value(0)  # Lock
-            pi_signal.value(0)
-            if time.time() - start_time >= config["lock"]["timeout"]:
-                payload = f"{transaction_id}::0"
-                hmac_val = hmac.new(config["mqtt"]["hmac_secret"].encode(), payload.encode(), hashlib.sha256).hexdigest()
-                mqtt_client.publish(config["mqtt"]["door_topic"], f"{payload}|{hmac_val}")
-        elif topic == config["mqtt"]["status_topic"].encode():
-            transaction_id, items_total = payload.split(":")
-            items, total = items_total.split("$")
-            if items == "No items":
-                display_message("No Charge")
-            else:
-                display_message(f"Items: {items}\nTotal: ${total}")
+# Door lifecycle
+def publish_door(transaction_id, item_counts, delta_mass):
+    payload = wire.encode_door(transaction_id, item_counts, delta_mass)
+    mqtt_client.publish(config["mqtt"]["door_topic"], signer.sign(payload))
+
+def door_closed(transaction_id, delta_mass):
+    # Get items from Pi (simplified, assume GPIO/serial)
+    removed_items = {"cola": 1}  # Placeholder until the Pi link forwards its basket
+    publish_door(transaction_id, removed_items, delta_mass)
+
+def door_timed_out(transaction_id):
+    publish_door(transaction_id, {}, 0.0)
+
+def door_state_changed(state, transaction_id):
+    if state == UNLOCKED:
+        pi_signal.value(1)  # Signal Pi to start
+        display_message("Door Unlocked")
+        set_led("blue")
+        beep()
+    elif state == OPEN:
+        display_message("Door Open")
+    else:
+        pi_signal.value(0)  # Signal Pi to stop
+        if not door.pending():
+            display_message("Tap to Unlock")
             set_led("off")
-            beep()
+
+door = DoorController(
+    mosfet, hall_sensor, read_weight,
+    on_closed=door_closed,
+    on_timeout=door_timed_out,
+    on_state=door_state_changed,
+    timeout=config["lock"]["timeout"],
+    max_queue=config["lock"].get("max_queue", 4),
+)
+
+async def show_result(text):
+    display_message(text)
+    set_led("off")
+    beep()
+    await asyncio.sleep(5)
+    if door.state == IDLE and not door.pending():
+        display_message("Tap to Unlock")
+
+# MQTT callback: runs inside check_msg(), so it must never block
+def on_message(topic, msg):
+    try:
+        message = wire.decode(verifier.open(msg))
+    except (EnvelopeError, wire.WireError, UnicodeError):
+        return  # unsigned, replayed, or our own telemetry echoed back on the status topic
+    if message[0] == wire.UNLOCK:
+        if not door.request(message[1]):
+            print(f"Unlock {message[1]} ignored: duplicate or queue full")
+    elif message[0] == wire.RESULT:
+        _, transaction_id, status, total_cents = message
+        if status == wire.CAPTURED:
+            text = f"Thank you!\nTotal: ${total_cents / 100:.2f}"
+        elif status == wire.CANCELLED:
+            text = "No Charge"
+        else:
+            text = "Payment error"
+        asyncio.create_task(show_result(text))
 
 mqtt_client.set_callback(on_message)
 mqtt_client.subscribe(config["mqtt"]["unlock_topic"])
 mqtt_client.subscribe(config["mqtt"]["status_topic"])
 
-# Main loop
-while True:
-    mqtt_client.check_msg()
-    door_open = not hall_sensor.value()
-    voltage = read_voltage()
-    mqtt_client.publish(config["mqtt"]["status_topic"], ujson.dumps({
-        "door": "open" if door_open else "closed",
-        "mass": [read_weight()],
-        "vcc": voltage
-    }))
-    display_message("Tap to Unlock")
-    set_led("off")
-    time.sleep(0.25)
+telemetry_config = config.get("telemetry", {})
+telemetry = TelemetryAggregator(
+    heartbeat=telemetry_config.get("heartbeat", 60),
+    mass_delta=telemetry_config.get("mass_delta", 5.0),
+    vcc_delta=telemetry_config.get("vcc_delta", 0.05),
+)
+
+# Tasks: MQTT, telemetry, weight sampling and the door each run on their own,
+# so a door session never stalls message handling or status publishing
+async def mqtt_loop():
+    while True:
+        mqtt_client.check_msg()
+        await asyncio.sleep(0.05)
+
+async def telemetry_loop():
+    while True:
+        telemetry.add(door.door_open(), read_weight(), read_voltage())
+        if telemetry.due():
+            mqtt_client.publish(config["mqtt"]["status_topic"], telemetry.flush())
+        await asyncio.sleep(0.25)
+
+async def main():
+    asyncio.create_task(weight_sampler.run())
+    asyncio.create_task(door.run())
+    asyncio.create_task(telemetry_loop())
+    await mqtt_loop()
+
+asyncio.run(main())
@@ -0,0 +1,151 @@
+"""
+signing.py - MicroPython side of the VisionVend message envelope
+
+Byte-for-byte compatible with VisionVend/utils/security.py:
+
+    version:u8 | key_id:u8 | nonce:8s | timestamp:u32 | payload | mac:16s
+
+MicroPython's hashlib objects can't be copied, so instead of a copied HMAC
+state each key keeps its ipad/opad blocks precomputed, and a message costs two
+SHA-256 passes and no key setup. Also runs under CPython for SIMULATE=1.
+"""
+
+import os
+import time
+
+try:
+    import ustruct as struct
+except ImportError:
+    import struct
+
+try:
+    import uhashlib as hashlib
+except ImportError:
+    import hashlib
+
+ENVELOPE_VERSION = 1
+HEADER_FORMAT = ">BB8sI"
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+NONCE_SIZE = 8
+MAC_SIZE = 16
+BLOCK_SIZE = 64
+DEFAULT_KEY_ID = 1
+
+# Boards count seconds from 2000-01-01 rather than the Unix epoch
+EPOCH_OFFSET = 946684800 if time.gmtime(0)[0] == 2000 else 0
+# Before NTP sync the RTC sits near its epoch; skip the timestamp window until then
+MIN_SYNCED_TIME = 1704067200  # 2024-01-01
+
+
+class EnvelopeError(ValueError):
+    pass
+
+
+def unix_time():
+    return int(time.time()) + EPOCH_OFFSET
+
+
+def sync_clock():
+    """Best-effort NTP sync so our timestamps pass the server's replay window."""
+    try:
+        import ntptime
+        ntptime.settime()
+        return True
+    except Exception:
+        return False
+
+
+def _as_bytes(value):
+    return value.encode() if isinstance(value, str) else bytes(value)
+
+
+def _compare(a, b):
+    """Constant-time equality for equal-length byte strings."""
+    if len(a) != len(b):
+        return False
+    result = 0
+    for x, y in zip(a, b):
+        result |= x ^ y
+    return result == 0
+
+
+class _Key:
+    def __init__(self, secret):
+        secret = _as_bytes(secret)
+        if len(secret) > BLOCK_SIZE:
+            secret = hashlib.sha256(secret).digest()
+        secret = secret + b"\x00" * (BLOCK_SIZE - len(secret))
+        self.ipad = bytes(b ^ 0x36 for b in secret)
+        self.opad = bytes(b ^ 0x5C for b in secret)
+
+    def mac(self, data):
+        inner = hashlib.sha256(self.ipad)
+        inner.update(data)
+        outer = hashlib.sha256(self.opad)
+        outer.update(inner.digest())
+        return outer.digest()
+
+
+class KeyRing:
+    def __init__(self, keys, active_key_id=None):
+        self._keys = {int(key_id): _Key(secret) for key_id, secret in keys.items()}
+        self.active_key_id = int(active_key_id) if active_key_id is not None else max(self._keys)
+
+    @classmethod
+    def from_config(cls, mqtt_config):
+        """Same ``hmac_keys`` / ``hmac_key_id`` / ``hmac_secret`` rules as the server."""
+        active = int(mqtt_config.get("hmac_key_id", DEFAULT_KEY_ID))
+        keys = {}
+        for key_id, secret in (mqtt_config.get("hmac_keys") or {}).items():
+            if secret:
+                keys[int(key_id)] = secret
+        if active not in keys and mqtt_config.get("hmac_secret"):
+            keys[active] = mqtt_config["hmac_secret"]
+        return cls(keys, active)
+
+    def __contains__(self, key_id):
+        return key_id in self._keys
+
+    def mac(self, key_id, data):
+        return self._keys[key_id].mac(data)
+
+
+class Signer:
+    def __init__(self, keys):
+        self.keys = keys
+
+    def sign(self, payload):
+        header = struct.pack(HEADER_FORMAT, ENVELOPE_VERSION, self.keys.active_key_id,
+                             os.urandom(NONCE_SIZE), unix_time())
+        message = header + _as_bytes(payload)
+        return message + self.keys.mac(self.keys.active_key_id, message)[:MAC_SIZE]
+
+
+class Verifier:
+    """Authenticates server envelopes; remembers a small window of nonces"""
+
+    def __init__(self, keys, max_skew=60, max_nonces=32):
+        self.keys = keys
+        self.max_skew = max_skew
+        self.max_nonces = max_nonces
+        self._nonces = []
+
+    def open(self, message):
+        message = _as_bytes(message)
+        if len(message) < HEADER_SIZE + MAC_SIZE or message[0] != ENVELOPE_VERSION:
+            raise EnvelopeError("not an envelope")
+        body, received_mac = message[:-MAC_SIZE], message[-MAC_SIZE:]
+        _, key_id, nonce, timestamp = struct.unpack(HEADER_FORMAT, body[:HEADER_SIZE])
+        if key_id not in self.keys:
+            raise EnvelopeError("unknown key")
+        if not _compare(self.keys.mac(key_id, body)[:MAC_SIZE], received_mac):
+            raise EnvelopeError("bad mac")
+        now = unix_time()
+        if now >= MIN_SYNCED_TIME and abs(now - timestamp) > self.max_skew:
+            raise EnvelopeError("stale")
+        if nonce in self._nonces:
+            raise EnvelopeError("replay")
+        self._nonces.append(nonce)
+        if len(self._nonces) > self.max_nonces:
+            self._nonces.pop(0)
+        return body[HEADER_SIZE:]
@@ -0,0 +1,85 @@
+"""
+telemetry.py - On-device telemetry aggregation
+
+The main loop still samples door, weight and battery every tick. Instead of
+publishing each sample, TelemetryAggregator folds samples into a min/max/mean
+window. It only asks to publish when something meaningful changes: the door
+opens or closes, the mean weight or voltage moves past a threshold, or the
+heartbeat interval expires. An idle machine sends one small packet per
+heartbeat instead of four a second.
+"""
+
+import time
+
+import wire
+
+
+class _Window:
+    __slots__ = ("count", "low", "high", "total")
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.low = None
+        self.high = None
+        self.total = 0.0
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        if self.low is None or value < self.low:
+            self.low = value
+        if self.high is None or value > self.high:
+            self.high = value
+
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+
+class TelemetryAggregator:
+    def __init__(self, heartbeat=60, mass_delta=5.0, vcc_delta=0.05):
+        self.heartbeat = heartbeat
+        self.mass_delta = mass_delta
+        self.vcc_delta = vcc_delta
+        self.mass = _Window()
+        self.vcc = _Window()
+        self.door_open = False
+        self._published_door = None
+        self._published_mass = None
+        self._published_vcc = None
+        self._published_at = None
+
+    def add(self, door_open, mass, vcc):
+        self.door_open = door_open
+        self.mass.add(mass)
+        self.vcc.add(vcc)
+
+    def due(self, now=None):
+        """True when the current window is worth sending."""
+        if self.mass.count == 0:
+            return False
+        now = time.time() if now is None else now
+        if self._published_at is None or now - self._published_at >= self.heartbeat:
+            return True
+        if self.door_open != self._published_door:
+            return True
+        if abs(self.mass.mean() - self._published_mass) >= self.mass_delta:
+            return True
+        return abs(self.vcc.mean() - self._published_vcc) >= self.vcc_delta
+
+    def flush(self, now=None):
+        """Encode the window as a TELEMETRY_WINDOW message and start a new one."""
+        payload = wire.encode_telemetry_window(
+            self.door_open, self.mass.count,
+            (self.mass.low, self.mass.high, self.mass.mean()),
+            (self.vcc.low, self.vcc.high, self.vcc.mean()),
+        )
+        self._published_door = self.door_open
+        self._published_mass = self.mass.mean()
+        self._published_vcc = self.vcc.mean()
+        self._published_at = time.time() if now is None else now
+        self.mass.reset()
+        self.vcc.reset()
+        return payload
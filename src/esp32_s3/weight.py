@@ -0,0 +1,88 @@
+"""
+weight.py - Background HX711 sampling with median + Kalman filtering
+
+read_weight() used to block for ten HX711 conversions each time it was
+called. WeightSampler reads one conversion at a time, and only when the HX711
+signals data-ready (DT pulled low), so a read never waits on the ADC. Raw
+readings go into a small ring buffer. The median of the buffer removes
+door-slam spikes, and a scalar Kalman filter smooths what is left.
+estimate() returns the current filtered value immediately.
+
+When the weight steps (an item is taken out), the innovation jumps far outside
+the filter's expected noise. The filter then reopens its variance, so the
+estimate settles on the new level within a few samples instead of creeping
+towards it.
+"""
+
+try:
+    import uasyncio as asyncio
+except ImportError:
+    import asyncio
+
+
+class WeightSampler:
+    def __init__(self, hx711, dt_pin, window=5, process_noise=1.0, measurement_noise=100.0,
+                 step_sigma=4.0, period=0.02):
+        self.hx711 = hx711
+        self.dt_pin = dt_pin
+        self.window = window
+        self.q = process_noise
+        self.r = measurement_noise
+        self.step_sigma = step_sigma
+        self.period = period
+
+        self._ring = [0.0] * window
+        self._filled = 0
+        self._next = 0
+        self._x = None
+        self._p = measurement_noise
+        self.samples = 0
+        self._running = False
+
+    def ready(self):
+        # HX711 pulls DT low when a conversion is waiting
+        return self.dt_pin.value() == 0
+
+    def poll(self):
+        """Take one reading if the HX711 has one ready. Never waits. Returns True if it did."""
+        if not self.ready():
+            return False
+        self.add(self.hx711.read())
+        return True
+
+    def _median(self):
+        values = sorted(self._ring[:self._filled])
+        return values[len(values) // 2]
+
+    def add(self, raw):
+        """Feed one raw HX711 reading through the median and Kalman stages."""
+        self._ring[self._next] = raw
+        self._next = (self._next + 1) % self.window
+        if self._filled < self.window:
+            self._filled += 1
+        self.samples += 1
+
+        z = self._median()
+        if self._x is None:
+            self._x = z
+            return
+        p = self._p + self.q
+        innovation = z - self._x
+        if innovation * innovation > self.step_sigma * self.step_sigma * (p + self.r):
+            p += innovation * innovation  # real step change: trust the new level
+        gain = p / (p + self.r)
+        self._x += gain * innovation
+        self._p = (1 - gain) * p
+
+    def estimate(self):
+        """Current filtered reading, or None before the first sample."""
+        return self._x
+
+    async def run(self):
+        self._running = True
+        while self._running:
+            self.poll()
+            await asyncio.sleep(self.period)
+
+    def stop(self):
+        self._running = False
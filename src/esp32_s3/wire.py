@@ -0,0 +1,109 @@
+"""
+wire.py - MicroPython side of the VisionVend binary wire format
+
+Byte-compatible with VisionVend/utils/wire.py; see that module for the
+layout. Messages are plain tuples here to keep allocations down on the board.
+"""
+
+try:
+    import ustruct as struct
+except ImportError:
+    import struct
+
+WIRE_VERSION = 1
+
+UNLOCK = 1
+DOOR = 2
+RESULT = 3
+TELEMETRY = 4
+TELEMETRY_WINDOW = 5
+
+CAPTURED = 1
+CANCELLED = 2
+ERROR = 3
+
+FLAG_DOOR_OPEN = 0x01
+
+
+class WireError(ValueError):
+    pass
+
+
+# ustruct raises ValueError; CPython's struct.error is a separate type
+_DECODE_ERRORS = (IndexError, ValueError, getattr(struct, "error", ValueError))
+
+
+def _header(message_type):
+    return bytes(((WIRE_VERSION << 4) | message_type,))
+
+
+def _pack_str(value):
+    data = value.encode()
+    if len(data) > 255:
+        raise WireError("string too long")
+    return bytes((len(data),)) + data
+
+
+def _unpack_str(data, offset):
+    end = offset + 1 + data[offset]
+    if end > len(data):
+        raise WireError("truncated")
+    return data[offset + 1:end].decode(), end
+
+
+def encode_door(transaction_id, item_counts, delta_mass):
+    """item_counts: dict of sku -> quantity."""
+    if len(item_counts) > 255:
+        raise WireError("too many skus")
+    parts = [_header(DOOR), _pack_str(transaction_id), struct.pack("<fB", delta_mass, len(item_counts))]
+    for sku, quantity in item_counts.items():
+        if not 0 <= quantity <= 255:
+            raise WireError("quantity out of range")
+        parts.append(_pack_str(sku))
+        parts.append(bytes((int(quantity),)))
+    return b"".join(parts)
+
+
+def _millivolts(volts):
+    return max(0, min(int(volts * 1000 + 0.5), 0xFFFF))
+
+
+def encode_telemetry(door_open, masses, vcc):
+    vcc_mv = _millivolts(vcc)
+    return (_header(TELEMETRY)
+            + struct.pack("<BHB", FLAG_DOOR_OPEN if door_open else 0, vcc_mv, len(masses))
+            + struct.pack("<%df" % len(masses), *masses))
+
+
+def encode_telemetry_window(door_open, samples, mass, vcc):
+    """mass: (min, max, mean) grams; vcc: (min, max, mean) volts."""
+    return _header(TELEMETRY_WINDOW) + struct.pack(
+        "<BH3f3H", FLAG_DOOR_OPEN if door_open else 0, min(samples, 0xFFFF),
+        mass[0], mass[1], mass[2], _millivolts(vcc[0]), _millivolts(vcc[1]), _millivolts(vcc[2]))
+
+
+def decode(data):
+    """
+    Returns (UNLOCK, transaction_id, payment_intent_id),
+    (RESULT, transaction_id, status, total_cents) or
+    (TELEMETRY, door_open, vcc, masses). Raises WireError otherwise.
+    """
+    if not data or data[0] >> 4 != WIRE_VERSION:
+        raise WireError("version")
+    kind = data[0] & 0x0F
+    try:
+        if kind == UNLOCK:
+            transaction_id, offset = _unpack_str(data, 1)
+            payment_intent_id, _ = _unpack_str(data, offset)
+            return (UNLOCK, transaction_id, payment_intent_id)
+        if kind == RESULT:
+            transaction_id, offset = _unpack_str(data, 1)
+            status, total_cents = struct.unpack("<BI", data[offset:offset + 5])
+            return (RESULT, transaction_id, status, total_cents)
+        if kind == TELEMETRY:
+            flags, vcc_mv, count = struct.unpack("<BHB", data[1:5])
+            masses = struct.unpack("<%df" % count, data[5:5 + 4 * count])
+            return (TELEMETRY, bool(flags & FLAG_DOOR_OPEN), vcc_mv / 1000, masses)
+    except _DECODE_ERRORS as e:
+        raise WireError(str(e))
+    raise WireError("type")
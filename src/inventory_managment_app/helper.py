@@ -4,7 +4,8 @@ helper.py  – keeps Google-Sheet ⇄ fridge config.yaml in sync
              and records every sale coming from the fridge
 """
 
-import time, threading, yaml, datetime, os
+import time, threading, yaml, datetime, os, sys, asyncio
+from collections import Counter
 from fastapi import FastAPI, Request
 from fastapi.responses import JSONResponse
 import uvicorn
@@ -13,6 +14,11 @@ from google.oauth2.service_account import Credentials
 from dotenv import load_dotenv
 import re
 
+# The change-detecting sheet poller and SalesLog batcher are shared with the server
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "server"))
+from sheets_sync import ConfigFileWriter, ProductSheetSync
+from sales_log import SalesLogBatcher
+
 # Load environment variables from .env
 load_dotenv()
 
@@ -48,20 +54,18 @@ SALES_TAB = SHEET.worksheet("SalesLog")
 app = FastAPI()
 
 # -----------------------------------------------------
-def products_to_config():
-    """
-    Reads Products tab and writes a compact YAML block
-    inventory:
-      cola:  {price: 2.0, weight: 355, tolerance: 5}
-      chips: {price: 1.5, weight: 70,  tolerance: 4}
-    """
-    rows = PROD_TAB.get_all_values()[1:]  # skip header
-    inv = {}
-    for sku, name, price, weight, *_ in rows:
-        if not sku:  # ignore blank lines
-            continue
+product_sync = ProductSheetSync(PROD_TAB, SHEET)
+config_writer = ConfigFileWriter(CONFIG_YAML_PATH)
+inventory = {}
+
+def apply_product_diff(diff):
+    if diff.complete:
+        inventory.clear()
+    for sku in diff.removed:
+        inventory.pop(sku, None)
+    for sku, (_, name, price, weight, *_) in diff.upserts.items():
         try:
-            inv[sku] = {
+            inventory[sku] = {
                 "price": float(price),
                 "weight": float(weight),
                 "tolerance": 5  # hard-coded or add a column
@@ -69,28 +73,43 @@ def products_to_config():
         except ValueError:
             print(f"⚠️  bad numeric value in row with SKU={sku}; skipped")
 
-    data = {"inventory": inv}
-    with open(CONFIG_YAML_PATH, "w") as f:
-        yaml.dump(data, f)
+    if config_writer.write({"inventory": inventory}):
+        print(f"✅ config.yaml updated ({len(inventory)} SKUs)")
 
-    print(f"✅ config.yaml updated ({len(inv)} SKUs)")
+def products_to_config(force=False):
+    """
+    Reads changed rows of the Products tab and writes a compact YAML block
+    inventory:
+      cola:  {price: 2.0, weight: 355, tolerance: 5}
+      chips: {price: 1.5, weight: 70,  tolerance: 4}
+    The file is only rewritten when its content changes.
+    """
+    diff = product_sync.poll(force=force)
+    if diff:
+        apply_product_diff(diff)
 
 # -----------------------------------------------------
-def periodic_sync(interval=30):
-    while True:
-        try:
-            products_to_config()
-        except Exception as e:
-            print("Sync error →", e)
-        time.sleep(interval)
+def periodic_sync():
+    # polls every 30 s while the sheet changes, backing off to 5 min when quiet
+    try:
+        products_to_config(force=True)
+    except Exception as e:
+        print("Sync error →", e)
+    product_sync.run_forever(apply_product_diff)
 
 # -----------------------------------------------------
-def append_sale_row(sku: str, qty: int, tx_id: str):
-    """
-    Append (-qty) to SalesLog. Google-Sheet formulas update stock automatically.
-    """
-    now_iso = datetime.datetime.utcnow().isoformat(" ", timespec="seconds")
-    SALES_TAB.append_row([now_iso, sku, -abs(qty), tx_id], value_input_option="USER_ENTERED")
+# Sales are written to a local WAL and appended to SalesLog in batches.
+# Google-Sheet formulas update stock automatically.
+sales_log = SalesLogBatcher(SALES_TAB, "sales_log.wal")
+
+@app.on_event("startup")
+async def start_sales_log():
+    app.state.sales_log_task = asyncio.create_task(sales_log.run())
+
+@app.on_event("shutdown")
+async def stop_sales_log():
+    await sales_log.close()
+    await app.state.sales_log_task
 
 # -----------------------------------------------------
 from pydantic import BaseModel
@@ -107,18 +126,23 @@ class TransactionRequest(BaseModel):
 @app.post("/transaction")
 async def transaction_endpoint(payload: TransactionRequest):
     tx_id = payload.transaction_id or "NA"
+    if tx_id == "NA":
+        # rows are deduplicated per (tx_id, sku), so anonymous sales need their own id
+        tx_id = f"NA-{os.urandom(4).hex()}"
     items = payload.items or []
+    item_counts = Counter()
     for item in items:
         sku = item.sku
         qty = int(item.qty)
         if sku and qty:
-            append_sale_row(sku, qty, tx_id)
+            item_counts[sku] += qty
+    await sales_log.record(tx_id, item_counts)
     print(f"🛒 logged transaction {tx_id}: {items}")
     return {"status": "ok", "items_logged": len(items)}
 
 # -----------------------------------------------------
 if __name__ == "__main__":
-    # start background thread that refreshes config.yaml every 30 s
+    # start background thread that keeps config.yaml in sync with the sheet
     threading.Thread(target=periodic_sync, daemon=True).start()
     # Start FastAPI server using uvicorn
     uvicorn.run("helper:app", host="0.0.0.0", port=5001, reload=False)
@@ -0,0 +1,132 @@
+"""
+backends.py - Interchangeable detector runtimes for the inference worker
+
+The Pi now runs the same RT-DETRv2 (PekingU/rtdetr_v2_r18vd) that
+ProductTracker uses. src/utils/download_rt_detr.py saves it to
+src/models/rtdetr. A backend only turns a preprocessed float32 batch
+(N x 3 x H x W) into raw RT-DETR outputs: per-query class logits and
+normalized cxcywh boxes. Resizing, normalization and post-processing live in
+DetectionService and are shared, so the backends give the same answers.
+
+    TorchBackend  transformers model under torch.inference_mode()
+    OnnxBackend   ONNX Runtime on CPU, fed the graph written by
+                  src/utils/export_rt_detr_onnx.py (int8 by default)
+
+Neither torch nor onnxruntime is imported until its backend is created. The
+Pi only needs whichever runtime it actually uses.
+"""
+
+import abc
+import json
+import logging
+from pathlib import Path
+from typing import Dict, Sequence, Tuple
+
+import numpy as np
+
+DEFAULT_MODEL_DIR = Path(__file__).resolve().parent.parent / "models" / "rtdetr"
+ONNX_FILE = "model.onnx"
+ONNX_INT8_FILE = "model.int8.onnx"
+
+
+class DetectorBackend(abc.ABC):
+    """Runs a preprocessed batch; subclasses implement forward()"""
+
+    name = "base"
+
+    def __init__(self, model_dir: Path):
+        self.model_dir = Path(model_dir)
+        config = json.loads((self.model_dir / "config.json").read_text())
+        preprocessing = json.loads((self.model_dir / "preprocessor_config.json").read_text())
+        self.id2label: Dict[int, str] = {int(k): v for k, v in config["id2label"].items()}
+        size = preprocessing.get("size") or {}
+        self.input_size: Tuple[int, int] = (size.get("height", 640), size.get("width", 640))
+        if preprocessing.get("do_normalize", False):
+            self.mean = np.array(preprocessing["image_mean"], dtype=np.float32) * 255
+            self.std = np.array(preprocessing["image_std"], dtype=np.float32) * 255
+        else:  # RT-DETR only rescales to [0, 1]
+            self.mean = np.zeros(3, dtype=np.float32)
+            self.std = np.full(3, 255.0, dtype=np.float32)
+
+    @abc.abstractmethod
+    def forward(self, pixels: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """(logits N x Q x C, boxes N x Q x 4 as normalized cx, cy, w, h)."""
+
+
+class TorchBackend(DetectorBackend):
+    name = "torch"
+
+    def __init__(self, model_dir: Path, threads: int = 0):
+        super().__init__(model_dir)
+        import torch
+        from transformers import AutoModelForObjectDetection
+
+        if threads:
+            torch.set_num_threads(threads)
+        self._torch = torch
+        self.model = AutoModelForObjectDetection.from_pretrained(str(self.model_dir), local_files_only=True).eval()
+
+    def forward(self, pixels: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        with self._torch.inference_mode():
+            outputs = self.model(pixel_values=self._torch.from_numpy(pixels))
+        return outputs.logits.numpy(), outputs.pred_boxes.numpy()
+
+
+class OnnxBackend(DetectorBackend):
+    name = "onnx"
+
+    def __init__(self, model_dir: Path, onnx_file: str = ONNX_INT8_FILE, threads: int = 0):
+        super().__init__(model_dir)
+        import onnxruntime
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.path = self.model_dir / onnx_file
+        self.session = onnxruntime.InferenceSession(str(self.path), options, providers=["CPUExecutionProvider"])
+        self._input = self.session.get_inputs()[0].name
+
+    def forward(self, pixels: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        logits, boxes = self.session.run(["logits", "pred_boxes"], {self._input: pixels})
+        return logits, boxes
+
+
+def create_backend(detection_config) -> DetectorBackend:
+    """Backend named by ``detection.backend``; falls back to torch if the ONNX graph was never exported."""
+    model_dir = Path(detection_config.get("model_dir") or DEFAULT_MODEL_DIR)
+    if not (model_dir / "config.json").exists():
+        raise FileNotFoundError(f"No saved model in {model_dir}; run src/utils/download_rt_detr.py first")
+    threads = detection_config.get("threads", 0)
+    if detection_config.get("backend", "onnx") == "onnx":
+        onnx_file = detection_config.get("onnx_file", ONNX_INT8_FILE)
+        if (model_dir / onnx_file).exists():
+            return OnnxBackend(model_dir, onnx_file, threads)
+        logging.warning(f"{model_dir / onnx_file} not found; using the PyTorch backend "
+                        f"(run src/utils/export_rt_detr_onnx.py to create it)")
+    return TorchBackend(model_dir, threads)
+
+
+def _sigmoid(x: np.ndarray) -> np.ndarray:
+    return 1.0 / (1.0 + np.exp(-x))
+
+
+def post_process(logits: np.ndarray, boxes: np.ndarray, target_sizes: Sequence[Tuple[int, int]],
+                 threshold: float):
+    """
+    RT-DETR post-processing (same as RTDetrImageProcessor with use_focal_loss):
+    sigmoid scores, top-Q over all query/class pairs, cxcywh -> xyxy in
+    source-frame pixels. Yields (scores, labels, boxes) per image.
+    """
+    batch, queries, classes = logits.shape
+    scores = _sigmoid(logits).reshape(batch, -1)
+    for i in range(batch):
+        top = np.argpartition(-scores[i], queries - 1)[:queries]
+        top = top[scores[i, top] > threshold]
+        top = top[np.argsort(-scores[i, top])]
+        query, label = np.divmod(top, classes)
+        cx, cy, w, h = boxes[i, query].T
+        height, width = target_sizes[i]
+        xyxy = np.stack([(cx - w / 2) * width, (cy - h / 2) * height,
+                         (cx + w / 2) * width, (cy + h / 2) * height], axis=1)
+        yield scores[i, top], label, xyxy
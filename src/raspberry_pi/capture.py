@@ -1,58 +1,357 @@
 """
 capture.py
 Handles camera capture, background subtraction, mask cleaning, and hand polygon detection for dual-camera auto-labeling.
+
+Each camera runs in its own process (capture_process). It publishes frame,
+foreground mask and hand polygons into a shared-memory FrameRing. CameraFeed
+reads them back in the tracking process without pickling anything. The ring
+has a fixed number of slots and drops the oldest frames, so a slow tracker
+costs frames, not memory. Capture and MediaPipe hand masking use their own
+cores instead of sharing the event loop with tracking.
+
+Inside a camera process a FrameGrabber thread keeps calling cap.read(),
+which releases the GIL while it waits on V4L2. The processing loop always
+takes the newest frame, so the camera runs at its own rate and a slow mask
+pass skips stale frames instead of queueing them. MediaPipe hand detection
+runs on a helper thread at the same time as MOG2 and blob filtering;
+both spend their time in native code. MOG2 and MediaPipe tracking keep
+per-camera state between frames, so each camera keeps its own process
+rather than sharing a pool.
+
+Masking runs on a downscaled copy of each frame. MOG2 and connected-component
+filtering run at `mask_scale` of the camera resolution, and the ring stores
+the mask at that size. CameraFeed.get() returns that small mask; consumers
+(the tracker, the autolabel writer) call crop_mask() to upsample only the
+region they crop. get(full_mask=True) upsamples the whole mask, for callers
+that really need it at frame size.
+
+HandRegionTracker decides when MediaPipe runs. Detection looks only at the
+full-resolution crop around the previous frame's motion ROI and the last
+known hands, padded by `hand_margin`. While a hand is known, its polygons
+are reused for as long as the downscaled grey frame barely changes inside
+the hand's box (mean difference under `hand_motion`). A moving hand is
+re-detected every `hand_every` frames; a still one once per `hand_max_age`
+frames. With no hand known, MediaPipe runs every `hand_every` frames, and
+only while there is motion. MediaPipe runs in static-image mode: every
+call is a fresh crop with its own origin and size, so its video-mode
+landmark tracking would carry ROIs from one crop into another crop's
+coordinates.
 """
 import cv2
 import mediapipe as mp
 import numpy as np
-from skimage import morphology
 from pathlib import Path
 import asyncio
 import logging
+import multiprocessing
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 from VisionVend.config import config as CFG
+from VisionVend.raspberry_pi.frame_ring import FrameRing
 
 AUTO = CFG["training"]["autolabel"]
+MAX_HANDS = 2
+MASK_SCALE = AUTO.get("mask_scale", 0.5)
+HAND_EVERY = max(1, AUTO.get("hand_every", 3))
+HAND_MARGIN = AUTO.get("hand_margin", 0.25)
+HAND_MOTION = AUTO.get("hand_motion", 6.0)  # mean grey-level change inside a hand box
+HAND_MAX_AGE = AUTO.get("hand_max_age", 30)
+MIN_BLOB = AUTO.get("min_blob", 100)  # px² at full resolution
 
-mp_hands = mp.solutions.hands.Hands(
-    static_image_mode=False,
-    max_num_hands=2,
-    min_detection_confidence=0.5,
-    min_tracking_confidence=0.5,
-)
+_hands = None
 
-def hand_polygons(rgb):
-    """Returns list of np.ndarray polygons (N,2) in pixel coords for each detected hand."""
+def _hand_tracker():
+    # Created on first use, inside the capture process, not at import
+    global _hands
+    if _hands is None:
+        _hands = mp.solutions.hands.Hands(
+            static_image_mode=True,  # fed ROI crops of varying origin and size, not a video
+            max_num_hands=MAX_HANDS,
+            min_detection_confidence=0.5,
+            min_tracking_confidence=0.5,
+        )
+    return _hands
+
+def hand_polygons(rgb, offset=(0, 0)):
+    """Returns list of np.ndarray polygons (N,2) in pixel coords for each detected hand.
+    `offset` is the (x, y) of `rgb` inside the full frame when it is a crop."""
     h, w, _ = rgb.shape
-    results = mp_hands.process(rgb)
+    results = _hand_tracker().process(rgb)
     polys = []
     if results.multi_hand_landmarks:
         for hand in results.multi_hand_landmarks:
-            pts = [(lm.x * w, lm.y * h) for lm in hand.landmark]
+            pts = [(lm.x * w + offset[0], lm.y * h + offset[1]) for lm in hand.landmark]
             polys.append(np.array(pts, dtype=np.int32))
     return polys
 
-async def capture_frames(cam_id, frame_queue, stop_event, log_queue=None):
+def mask_shape(shape, scale=MASK_SCALE):
+    """(height, width) of the downscaled mask for frames of `shape`."""
+    H, W = shape[:2]
+    return (max(1, round(H * scale)), max(1, round(W * scale)))
+
+def clean_mask(mask, min_area):
+    """
+    Drop foreground blobs smaller than `min_area` px² in place of
+    skimage remove_small_objects, without the bool round trip.
+    Returns the cleaned mask and the (x, y, w, h) box around what is left, or None.
+    """
+    count, labels, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+    keep = stats[:, cv2.CC_STAT_AREA] >= min_area
+    keep[0] = False  # background label
+    if not keep.any():
+        return np.zeros_like(mask), None
+    lut = np.where(keep, 255, 0).astype(np.uint8)
+    boxes = stats[keep]
+    x0, y0 = boxes[:, cv2.CC_STAT_LEFT].min(), boxes[:, cv2.CC_STAT_TOP].min()
+    x1 = (boxes[:, cv2.CC_STAT_LEFT] + boxes[:, cv2.CC_STAT_WIDTH]).max()
+    y1 = (boxes[:, cv2.CC_STAT_TOP] + boxes[:, cv2.CC_STAT_HEIGHT]).max()
+    return lut[labels], (int(x0), int(y0), int(x1 - x0), int(y1 - y0))
+
+def roi_hands(frame, roi, scale, margin=HAND_MARGIN):
+    """Hand polygons inside a mask-space ROI, detected on the full-resolution crop around it."""
+    H, W = frame.shape[:2]
+    x, y, w, h = (v / scale for v in roi)
+    pad_x, pad_y = w * margin, h * margin
+    x0, y0 = max(0, int(x - pad_x)), max(0, int(y - pad_y))
+    x1, y1 = min(W, int(x + w + pad_x) + 1), min(H, int(y + h + pad_y) + 1)
+    crop = cv2.cvtColor(frame[y0:y1, x0:x1], cv2.COLOR_BGR2RGB)
+    return hand_polygons(crop, offset=(x0, y0))
+
+def _pad(box, margin, shape):
+    if box is None:
+        return None
+    x, y, w, h = box
+    x0, y0 = max(0, int(x - w * margin)), max(0, int(y - h * margin))
+    x1, y1 = min(shape[1], int(x + w + w * margin) + 1), min(shape[0], int(y + h + h * margin) + 1)
+    if x1 <= x0 or y1 <= y0:
+        return None
+    return (x0, y0, x1 - x0, y1 - y0)
+
+def _union(a, b):
+    if a is None or b is None:
+        return a if b is None else b
+    x0, y0 = min(a[0], b[0]), min(a[1], b[1])
+    x1, y1 = max(a[0] + a[2], b[0] + b[2]), max(a[1] + a[3], b[1] + b[3])
+    return (x0, y0, x1 - x0, y1 - y0)
+
+class HandRegionTracker:
+    """Holds the last hand polygons and decides per frame whether MediaPipe must look again"""
+
+    def __init__(self, scale, every=HAND_EVERY, margin=HAND_MARGIN, motion=HAND_MOTION, max_age=HAND_MAX_AGE):
+        self.scale = scale
+        self.every = every
+        self.margin = margin
+        self.motion = motion
+        self.max_age = max_age
+        self.polys = []
+        self.since = every  # frames since the last detection; first motion is checked at once
+        self._gray = None
+        self._region = None
+        self.detections = 0
+        self.reused = 0
+
+    def _hand_box(self, shape):
+        """Mask-space (x, y, w, h) around the known hands, padded by `margin`."""
+        if not self.polys:
+            return None
+        pts = np.concatenate(self.polys) * self.scale
+        x0, y0 = pts.min(axis=0)
+        x1, y1 = pts.max(axis=0)
+        return _pad((x0, y0, x1 - x0, y1 - y0), self.margin, shape)
+
+    def due(self, gray, roi):
+        """
+        Whether to run detection on this frame. `gray` is the downscaled grey frame and `roi`
+        the previous frame's motion box. Sets the region detect() will search.
+        """
+        self.since += 1
+        hand_box = self._hand_box(gray.shape)
+        moved = True
+        if hand_box is not None and self._gray is not None:
+            x, y, w, h = hand_box
+            diff = cv2.absdiff(gray[y:y + h, x:x + w], self._gray[y:y + h, x:x + w])
+            moved = float(diff.mean()) > self.motion
+        self._gray = gray
+        self._region = _union(_pad(roi, self.margin, gray.shape), hand_box)
+        if self._region is None:
+            return False
+        if hand_box is not None:
+            stale = self.since >= self.max_age or (moved and self.since >= self.every)
+        else:
+            stale = roi is not None and self.since >= self.every
+        if not stale:
+            self.reused += 1
+        return stale
+
+    def detect(self, frame):
+        """Runs MediaPipe on the region due() chose; safe to call from the helper thread."""
+        polys = roi_hands(frame, self._region, self.scale, margin=0)
+        self.polys = polys
+        self.since = 0
+        self.detections += 1
+        return polys
+
+    def fill(self, mask):
+        """Blank every known hand out of a downscaled mask in one rasterization pass."""
+        if self.polys:
+            cv2.fillPoly(mask, list(np.round(np.stack(self.polys) * self.scale).astype(np.int32)), 0)
+        return mask
+
+class FrameGrabber(threading.Thread):
+    """Reads a camera as fast as it delivers; latest() hands out the newest frame only"""
+
+    def __init__(self, cap, cam_id):
+        super().__init__(name=f"grab-cam{cam_id}", daemon=True)
+        self.cap = cap
+        self.cam_id = cam_id
+        self._cond = threading.Condition()
+        self._frame = None
+        self._count = 0
+        self._taken = 0
+        self.skipped = 0
+        self.failed = False
+        self.running = True
+
+    def run(self):
+        while self.running:
+            ret, frame = self.cap.read()
+            with self._cond:
+                if not ret:
+                    self.failed = True
+                    self._cond.notify_all()
+                    return
+                self._frame = frame
+                self._count += 1
+                self._cond.notify_all()
+
+    def latest(self, timeout=1.0):
+        """Newest frame not handed out yet, or None on timeout or camera failure."""
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._count > self._taken or self.failed, timeout):
+                return None
+            if self._count == self._taken:
+                return None
+            self.skipped += self._count - self._taken - 1
+            self._taken = self._count
+            return self._frame
+
+def capture_process(cam_id, ring_name, shape, slots, stop_event, framerate=None, mask_shape=None):
+    """Process target: read one camera, mask background and hands, publish into the ring."""
+    ring = FrameRing(ring_name, shape, slots, masks=True, max_hands=MAX_HANDS, mask_shape=mask_shape)
+    H, W = shape[:2]
     cap = cv2.VideoCapture(cam_id, cv2.CAP_V4L2)
-    W = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-    H = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    cap.set(cv2.CAP_PROP_FRAME_WIDTH, W)
+    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, H)
+    if framerate:
+        cap.set(cv2.CAP_PROP_FPS, framerate)
     back = cv2.createBackgroundSubtractorMOG2(AUTO.get("history", 400), AUTO.get("varThreshold", 40), False)
-    
-    while not stop_event.is_set():
-        ret, frame = cap.read()
-        if not ret:
-            if log_queue:
-                await log_queue.put({"level": "error", "msg": f"Camera {cam_id} failed to read frame."})
-            break
-        mask = back.apply(frame)
-        mask = morphology.remove_small_objects(mask.astype(bool), 100).astype('uint8')*255
-        hand_polys = hand_polygons(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
-        for poly in hand_polys:
-            cv2.fillPoly(mask, [poly], 0)
-        await frame_queue.put((frame, mask, hand_polys, W, H))
-        await asyncio.sleep(0.01)
-    cap.release()
-    if log_queue:
-        await log_queue.put({"level": "info", "msg": f"Camera {cam_id} released."})
+    mH, mW = ring.mask_shape
+    scale = mW / W
+    min_area = max(1, round(MIN_BLOB * scale * scale))
+    grabber = FrameGrabber(cap, cam_id)
+    grabber.start()
+    hands_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"hands-cam{cam_id}")
+    hands = HandRegionTracker(scale)
+    roi = None
+    try:
+        while not stop_event.is_set():
+            frame = grabber.latest()
+            if frame is None:
+                if grabber.failed:
+                    logging.error(f"Camera {cam_id} failed to read frame.")
+                    break
+                continue
+            if frame.shape != ring.shape:
+                frame = cv2.resize(frame, (W, H))
+            small = cv2.resize(frame, (mW, mH), interpolation=cv2.INTER_AREA) if scale != 1 else frame
+            # Hands are looked for where the previous frame moved, alongside this frame's mask
+            hands_future = None
+            if hands.due(cv2.cvtColor(small, cv2.COLOR_BGR2GRAY), roi):
+                hands_future = hands_pool.submit(hands.detect, frame)
+            mask, roi = clean_mask(back.apply(small), min_area)
+            if hands_future is not None:
+                hands_future.result()
+            ring.publish(frame, hands.fill(mask), hands.polys)
+    finally:
+        grabber.running = False
+        hands_pool.shutdown(wait=True)
+        cap.release()
+        grabber.join(timeout=1.0)
+        ring.close()
+        logging.info(f"Camera {cam_id} released; {grabber.skipped} frames arrived faster than they could be masked, "
+                     f"MediaPipe ran {hands.detections} times and hands were reused {hands.reused} times.")
+
+class CameraFeed:
+    """One camera captured in a child process; get() reads it back from the ring like a queue"""
+
+    def __init__(self, cam_id, shape, slots=8, poll_interval=0.005, framerate=None, mask_scale=MASK_SCALE):
+        self.cam_id = cam_id
+        self.shape = tuple(shape)
+        self.slots = slots
+        self.framerate = framerate
+        self.poll_interval = poll_interval
+        self.mask_shape = mask_shape(self.shape, mask_scale)
+        self.ring = FrameRing(f"visionvend_cam{cam_id}", self.shape, slots, create=True,
+                              masks=True, max_hands=MAX_HANDS, mask_shape=self.mask_shape)
+        # spawn: MediaPipe and V4L2 handles must not be inherited through fork
+        self._context = multiprocessing.get_context("spawn")
+        self._stop = self._context.Event()
+        self._process = None
+        self.last_seq = 0
+        self.dropped = 0
+
+    def start(self):
+        self._process = self._context.Process(
+            target=capture_process,
+            args=(self.cam_id, self.ring.name, self.shape, self.slots, self._stop, self.framerate,
+                  self.mask_shape),
+            daemon=True,
+        )
+        self._process.start()
+
+    def stop(self, timeout=2.0):
+        self._stop.set()
+        if self._process is not None:
+            self._process.join(timeout)
+            if self._process.is_alive():
+                self._process.terminate()
+        self.ring.close()
+
+    def valid(self):
+        """True while the frame last returned by get() has not been overwritten."""
+        return self.ring.valid(self.last_seq)
+
+    async def get(self, full_mask=False):
+        """
+        Next frame as (frame, mask, hand_polys, W, H), the tuple the old queue carried.
+        The frame and polygons are views into the ring, good until the camera laps
+        it (`slots` frames later); copy anything kept longer. The mask is the ring's
+        `mask_shape` view; use crop_mask() for full-resolution regions of it. With
+        full_mask=True it is upsampled to W x H into a new array instead.
+        """
+        H, W = self.shape[:2]
+        while True:
+            seq = self.ring.next_seq(self.last_seq)
+            if seq is None:
+                await asyncio.sleep(self.poll_interval)
+                continue
+            self.dropped += seq - self.last_seq - 1
+            self.last_seq = seq
+            frame, mask, hands = self.ring.frame(seq), self.ring.mask(seq), self.ring.hands(seq)
+            if full_mask and mask.shape != (H, W):
+                mask = cv2.resize(mask, (W, H), interpolation=cv2.INTER_NEAREST)
+            if self.ring.valid(seq):  # not mid-overwrite while we read the slot
+                return frame, mask, hands, W, H
+
+    def crop_mask(self, mask, x, y, w, h):
+        """Frame-space box (x, y, w, h) of a downscaled mask, upsampled to w x h."""
+        H, W = self.shape[:2]
+        mH, mW = mask.shape[:2]
+        sx, sy = mW / W, mH / H
+        x0, y0 = int(x * sx), int(y * sy)
+        x1, y1 = max(x0 + 1, int(np.ceil((x + w) * sx))), max(y0 + 1, int(np.ceil((y + h) * sy)))
+        region = mask[y0:y1, x0:x1]
+        return cv2.resize(region, (w, h), interpolation=cv2.INTER_NEAREST)
 
 # Optionally, add a calibration function here for future expansion.
@@ -0,0 +1,84 @@
+"""
+detection.py - Batched RT-DETR inference for both cameras
+
+detect_objects() used to run one forward pass per frame, and only on
+camera1. DetectionService stacks frames from both cameras, and from several
+timesteps if the caller has them, into one batch. A single forward pass on
+the Pi's CPU costs well under twice one frame, and we get the second
+viewpoint almost for free.
+
+The input batch is allocated once at max_batch x 3 x H x W. Each frame is
+resized into a reusable uint8 buffer, then copied and normalized in place
+into its slot, so steady-state inference allocates nothing for inputs. The
+forward pass belongs to a backend (backends.py: PyTorch or ONNX Runtime).
+Results come back per frame, in input order.
+"""
+
+from typing import Collection, List, NamedTuple, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+from VisionVend.raspberry_pi.backends import DetectorBackend, post_process
+
+
+class Detection(NamedTuple):
+    label: str
+    score: float
+    box: Tuple[float, float, float, float]  # x0, y0, x1, y1 in source-frame pixels
+
+
+class DetectionService:
+    """One batched forward pass for any number of frames"""
+
+    def __init__(self, backend: DetectorBackend, labels: Optional[Collection[str]] = None,
+                 threshold: float = 0.7, max_batch: int = 4):
+        self.backend = backend
+        self.labels = set(labels) if labels is not None else None
+        self.threshold = threshold
+        self.max_batch = max_batch
+        self.height, self.width = backend.input_size
+
+        self._resized = np.empty((max_batch, self.height, self.width, 3), dtype=np.uint8)
+        self._pixels = np.empty((max_batch, 3, self.height, self.width), dtype=np.float32)
+        self._mean = backend.mean.reshape(3, 1, 1)
+        self._std = backend.std.reshape(3, 1, 1)
+        self.batches = 0
+        self.frames = 0
+
+    def _load(self, slot: int, frame: np.ndarray) -> None:
+        resized = self._resized[slot]
+        cv2.resize(frame, (self.width, self.height), dst=resized, interpolation=cv2.INTER_LINEAR)
+        pixels = self._pixels[slot]
+        pixels[...] = resized.transpose(2, 0, 1)
+        pixels -= self._mean
+        pixels /= self._std
+
+    def _run(self, frames: Sequence[np.ndarray], threshold: float) -> List[List[Detection]]:
+        count = len(frames)
+        for slot, frame in enumerate(frames):
+            self._load(slot, frame)
+        logits, boxes = self.backend.forward(self._pixels[:count])
+        id2label = self.backend.id2label
+        detections = []
+        for scores, labels, xyxy in post_process(logits, boxes, [f.shape[:2] for f in frames], threshold):
+            found = []
+            for score, label, box in zip(scores, labels, xyxy):
+                name = id2label[int(label)]
+                if self.labels is None or name in self.labels:
+                    found.append(Detection(name, float(score), tuple(float(v) for v in box)))
+            detections.append(found)
+        self.batches += 1
+        self.frames += count
+        return detections
+
+    def detect(self, frames: Sequence[np.ndarray], threshold: Optional[float] = None) -> List[List[Detection]]:
+        """Detections for each frame, in input order; batches of up to max_batch frames."""
+        threshold = self.threshold if threshold is None else threshold
+        detections = []
+        for start in range(0, len(frames), self.max_batch):
+            detections.extend(self._run(frames[start:start + self.max_batch], threshold))
+        return detections
+
+    def labels_per_frame(self, frames: Sequence[np.ndarray], threshold: Optional[float] = None) -> List[List[str]]:
+        return [[d.label for d in found] for found in self.detect(frames, threshold)]
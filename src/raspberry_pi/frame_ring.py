@@ -0,0 +1,192 @@
+"""
+frame_ring.py - Fixed-size camera frames in shared memory
+
+Camera frames cross process boundaries here without pickling: a 1280x720
+RGB frame is 2.7 MB, and pushing it through a pipe or queue copies it twice.
+The ring is one named SharedMemory block of `slots` preallocated frames, so
+its memory stays flat however far a reader falls behind. It supports two
+modes.
+
+Request/response (inference worker): the writer acquire()s a free slot,
+writes into it, and sends the slot number. The reader answers, and the writer
+then release()s the slot. Ownership is handed over by those messages.
+
+Streaming (capture -> hand masking -> tracking): publish() stamps every
+frame with an increasing sequence number and always overwrites the oldest
+slot. A reader that falls more than `slots` frames behind skips ahead
+instead of stalling the camera. That is drop-oldest: the camera never
+waits. Each slot's sequence number is set negative while the slot is being
+written, like a seqlock. A reader checks valid(seq) after using a zero-copy
+view to know whether the frame was overwritten underneath it.
+
+Optional planes ride along in the same block: a uint8 mask per frame, and up
+to `max_hands` hand polygons of HAND_POINTS points each. Masks default to
+the frame's height and width; pass `mask_shape` to store them smaller.
+
+The creating process unlinks the block on close. Other processes attach by
+name, so restarting them leaves the ring alone.
+"""
+
+from multiprocessing import resource_tracker, shared_memory
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+HAND_POINTS = 21  # MediaPipe hand landmarks
+_HEAD = 0  # header[0]: sequence number of the newest published frame
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    # Attaching must not register the block with a resource tracker, or the
+    # block is unlinked under its owner when the attaching process exits
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)  # Python 3.13+
+    except TypeError:
+        pass
+    register = resource_tracker.register
+    resource_tracker.register = lambda *args, **kwargs: None
+    try:
+        return shared_memory.SharedMemory(name=name)
+    finally:
+        resource_tracker.register = register
+
+
+class FrameRing:
+    """`slots` frames of `shape` uint8, shared between processes by name"""
+
+    def __init__(self, name: str, shape: Sequence[int], slots: int = 8, create: bool = False,
+                 masks: bool = False, max_hands: int = 0, mask_shape: Optional[Sequence[int]] = None):
+        self.shape = tuple(shape)
+        self.mask_shape = tuple(mask_shape) if mask_shape is not None else self.shape[:2]
+        self.slots = slots
+        self.max_hands = max_hands
+        self.frame_bytes = int(np.prod(self.shape))
+
+        # Layout: int64 header (head, then per-slot sequence and hand count) | frames | masks | hands
+        header_bytes = 8 * (1 + 2 * slots)
+        mask_bytes = int(np.prod(self.mask_shape)) * slots if masks else 0
+        hand_bytes = 4 * max_hands * HAND_POINTS * 2 * slots
+        size = header_bytes + self.frame_bytes * slots + mask_bytes + hand_bytes
+
+        if create:
+            try:
+                # A worker that crashed can leave its block behind; start clean
+                stale = shared_memory.SharedMemory(name=name)
+                stale.close()
+                stale.unlink()
+            except FileNotFoundError:
+                pass
+            self._shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        else:
+            self._shm = _attach(name)
+            if self._shm.size < size:
+                self._shm.close()
+                raise ValueError(f"Frame ring {name} is smaller than {slots} x {self.shape}")
+        self._owner = create
+
+        buf = self._shm.buf
+        header = np.ndarray((1 + 2 * slots,), dtype=np.int64, buffer=buf)
+        self._head = header[_HEAD:_HEAD + 1]
+        self._seqs = header[1:1 + slots]
+        self._hand_counts = header[1 + slots:]
+        offset = header_bytes
+        self._frames = np.ndarray((slots,) + self.shape, dtype=np.uint8, buffer=buf, offset=offset)
+        offset += self.frame_bytes * slots
+        self._masks = None
+        if masks:
+            self._masks = np.ndarray((slots,) + self.mask_shape, dtype=np.uint8, buffer=buf, offset=offset)
+            offset += mask_bytes
+        self._hands = None
+        if max_hands:
+            self._hands = np.ndarray((slots, max_hands, HAND_POINTS, 2), dtype=np.int32, buffer=buf, offset=offset)
+        if create:
+            header[:] = 0
+            self._seqs[:] = -1
+        self._free: List[int] = list(range(slots))
+
+    @property
+    def name(self) -> str:
+        return self._shm.name
+
+    # --- request/response ---
+
+    def view(self, slot: int) -> np.ndarray:
+        """The frame in ``slot``, without copying."""
+        return self._frames[slot]
+
+    def acquire(self) -> Optional[int]:
+        """Writer side: a slot nobody is reading, or None if all are in flight."""
+        return self._free.pop() if self._free else None
+
+    def release(self, slot: int) -> None:
+        self._free.append(slot)
+
+    def write(self, frame: np.ndarray) -> int:
+        """Copy ``frame`` into a free slot and return the slot number."""
+        if frame.shape != self.shape:
+            raise ValueError(f"Frame shape {frame.shape} does not match ring shape {self.shape}")
+        slot = self.acquire()
+        if slot is None:
+            raise RuntimeError("Frame ring is full")
+        np.copyto(self._frames[slot], frame)
+        return slot
+
+    # --- streaming ---
+
+    def head(self) -> int:
+        """Sequence number of the newest published frame (0 before the first)."""
+        return int(self._head[0])
+
+    def publish(self, frame: np.ndarray, mask: Optional[np.ndarray] = None,
+                hands: Sequence[np.ndarray] = ()) -> int:
+        """Single writer: overwrite the oldest slot with this frame and return its sequence number."""
+        seq = int(self._head[0]) + 1
+        slot = seq % self.slots
+        self._seqs[slot] = -seq  # readers holding this slot now see it as invalid
+        np.copyto(self._frames[slot], frame)
+        if mask is not None:
+            np.copyto(self._masks[slot], mask)
+        if self._hands is not None:
+            count = 0
+            for polygon in hands[:self.max_hands]:
+                self._hands[slot, count] = polygon[:HAND_POINTS]
+                count += 1
+            self._hand_counts[slot] = count
+        self._seqs[slot] = seq
+        self._head[0] = seq
+        return seq
+
+    def next_seq(self, after: int) -> Optional[int]:
+        """Oldest frame newer than ``after`` still in the ring, or None if there isn't one yet."""
+        head = int(self._head[0])
+        if head <= after:
+            return None
+        return max(after + 1, head - self.slots + 1)
+
+    def valid(self, seq: int) -> bool:
+        """True while frame ``seq`` has not been overwritten."""
+        return int(self._seqs[seq % self.slots]) == seq
+
+    def frame(self, seq: int) -> np.ndarray:
+        return self._frames[seq % self.slots]
+
+    def mask(self, seq: int) -> np.ndarray:
+        return self._masks[seq % self.slots]
+
+    def hands(self, seq: int) -> List[np.ndarray]:
+        slot = seq % self.slots
+        return [self._hands[slot, i] for i in range(int(self._hand_counts[slot]))]
+
+    def close(self) -> None:
+        # Views into the buffer must go before the mapping can close
+        self._frames = self._masks = self._hands = None
+        self._head = self._seqs = self._hand_counts = None
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
+
+
+def frame_shape(camera_config) -> Tuple[int, int, int]:
+    """(height, width, 3) for the configured camera resolution, which is given as [width, height]."""
+    width, height = camera_config["resolution"]
+    return (height, width, 3)
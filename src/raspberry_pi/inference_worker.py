@@ -0,0 +1,184 @@
+"""
+inference_worker.py - Long-lived object detection process for the Pi
+
+Loading the detector used to happen when main.py was imported, next to the
+GPIO and camera setup. Every restart of the capture loop paid tens of seconds
+for the model. This worker is started once, for example as its own service.
+It loads the weights from the local cache that src/utils/download_rt_detr.py
+writes, on the ONNX Runtime or PyTorch backend (backends.py). It runs one
+warm-up batch and only then opens its socket. Capture processes connect,
+write frames into the shared FrameRing, and send slot numbers. Restarting a
+capture process costs a reconnect, not a model load.
+
+Protocol (multiprocessing.connection, authenticated):
+    worker -> client on connect   ("ready", {"ring": name, "shape": shape, "slots": n})
+    client -> worker              ("detect", request_id, [slot, ...], threshold or None)
+    worker -> client              ("ok", request_id, [[Detection, ...], ...])  (detection.py)
+                                  ("error", request_id, message)
+
+Run with:  python src/raspberry_pi/inference_worker.py
+"""
+
+import itertools
+import logging
+import os
+import time
+from multiprocessing.connection import Client, Listener
+from pathlib import Path
+from typing import List, Optional, Sequence
+
+import numpy as np
+import yaml
+
+from VisionVend.raspberry_pi.frame_ring import FrameRing, frame_shape
+
+CONFIG_FILE_PATH = Path(__file__).parent.parent / "config" / "config.yaml"
+DEFAULT_ADDRESS = "/tmp/visionvend-inference.sock"
+DEFAULT_RING_NAME = "visionvend_frames"
+
+
+def _authkey(settings) -> bytes:
+    return (os.getenv("INFERENCE_AUTHKEY") or settings.get("authkey") or "visionvend-inference").encode()
+
+
+def load_detector(config):
+    """Build the DetectionService on the configured backend (backends.py)."""
+    # torch / onnxruntime are only ever imported here, so capture processes start fast
+    from VisionVend.raspberry_pi.backends import create_backend
+    from VisionVend.raspberry_pi.detection import DetectionService
+
+    detection_config = config.get("detection", {})
+    started = time.monotonic()
+    backend = create_backend(detection_config)
+    logging.info(f"Loaded {backend.name} detector from {backend.model_dir} in {time.monotonic() - started:.1f}s")
+    return DetectionService(
+        backend,
+        labels=config["inventory"],
+        threshold=detection_config.get("threshold", 0.7),
+        max_batch=detection_config.get("max_batch", 4),
+    )
+
+
+def _serve_connection(conn, detector, ring: FrameRing) -> None:
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, ConnectionError):
+            return
+        if message[0] != "detect":
+            conn.send(("error", None, f"Unknown request {message[0]!r}"))
+            continue
+        _, request_id, slots, threshold = message
+        try:
+            frames = [ring.view(slot) for slot in slots]
+            conn.send(("ok", request_id, detector.detect(frames, threshold)))
+        except Exception as e:
+            logging.error(f"Inference request {request_id} failed: {e}")
+            conn.send(("error", request_id, str(e)))
+
+
+def serve(config) -> None:
+    settings = config.get("inference", {})
+    address = settings.get("address", DEFAULT_ADDRESS)
+    shape = frame_shape(config["camera"])
+    slots = settings.get("ring_slots", 8)
+
+    detector = load_detector(config)
+    ring = FrameRing(settings.get("ring_name", DEFAULT_RING_NAME), shape, slots, create=True)
+    started = time.monotonic()
+    detector.detect([ring.view(slot) for slot in range(min(slots, detector.max_batch))])
+    logging.info(f"Warm-up batch took {time.monotonic() - started:.2f}s")
+
+    if os.path.exists(address):
+        os.unlink(address)  # left over from a worker that did not shut down cleanly
+    listener = Listener(address, family="AF_UNIX", authkey=_authkey(settings))
+    logging.info(f"Inference worker ready on {address}")
+    try:
+        while True:
+            conn = listener.accept()
+            logging.info("Capture process connected")
+            conn.send(("ready", {"ring": ring.name, "shape": shape, "slots": slots}))
+            try:
+                _serve_connection(conn, detector, ring)
+            finally:
+                conn.close()
+                logging.info("Capture process disconnected")
+    finally:
+        listener.close()
+        ring.close()
+
+
+class InferenceClient:
+    """Capture-process side: frames go into the ring, detections come back over the socket"""
+
+    def __init__(self, settings=None):
+        settings = settings or {}
+        self.address = settings.get("address", DEFAULT_ADDRESS)
+        self._authkey = _authkey(settings)
+        self.connect_timeout = settings.get("connect_timeout", 60)
+        self._conn = None
+        self._ring: Optional[FrameRing] = None
+        self._ids = itertools.count()
+
+    def connect(self) -> None:
+        """Wait for the worker (it may still be loading its model) and attach to its ring."""
+        deadline = time.monotonic() + self.connect_timeout
+        while True:
+            try:
+                self._conn = Client(self.address, family="AF_UNIX", authkey=self._authkey)
+                break
+            except (FileNotFoundError, ConnectionRefusedError):
+                if time.monotonic() >= deadline:
+                    raise
+                time.sleep(0.2)
+        _, info = self._conn.recv()
+        self._ring = FrameRing(info["ring"], info["shape"], info["slots"])
+
+    def _request(self, frames: Sequence[np.ndarray], threshold: Optional[float]) -> List[list]:
+        slots = []
+        try:
+            for frame in frames:
+                slots.append(self._ring.write(frame))
+            request_id = next(self._ids)
+            self._conn.send(("detect", request_id, slots, threshold))
+            status, reply_id, result = self._conn.recv()
+        finally:
+            for slot in slots:
+                self._ring.release(slot)
+        if status != "ok" or reply_id != request_id:
+            raise RuntimeError(f"Inference worker error: {result}")
+        return result
+
+    def detect(self, frames: Sequence[np.ndarray], threshold: Optional[float] = None) -> List[list]:
+        """Detections per frame, in input order. Reconnects once if the worker restarted."""
+        if self._conn is None:
+            self.connect()
+        step = self._ring.slots
+        detections = []
+        for start in range(0, len(frames), step):
+            chunk = frames[start:start + step]
+            try:
+                detections.extend(self._request(chunk, threshold))
+            except (EOFError, ConnectionError):
+                logging.warning("Lost the inference worker; reconnecting")
+                self.close()
+                self.connect()
+                detections.extend(self._request(chunk, threshold))
+        return detections
+
+    def labels_per_frame(self, frames: Sequence[np.ndarray], threshold: Optional[float] = None) -> List[List[str]]:
+        return [[d.label for d in found] for found in self.detect(frames, threshold)]
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+        if self._ring is not None:
+            self._ring.close()
+            self._ring = None
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    with open(CONFIG_FILE_PATH, "r") as f:
+        serve(yaml.safe_load(f))
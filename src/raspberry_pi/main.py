@@ -9,7 +9,8 @@ if SIM:
     import cv2                                     # we will use your laptop webcam
     GPIO = type("GPIO", (), {"input":lambda *_:0, "setup":lambda *_:None,
                              "setmode":lambda *_:None, "BCM":None, "cleanup":lambda :None,
-                             "IN": 0, "OUT": 1, "PUD_UP": 0})
+                             "add_event_detect":lambda *_, **__:None, "remove_event_detect":lambda *_:None,
+                             "IN": 0, "OUT": 1, "PUD_UP": 0, "BOTH": 3})
     
     # Stub for picamera2
     class Picamera2:
@@ -30,13 +31,12 @@ else:
     import cv2
     import picamera2
     from libcamera import controls
-    from transformers import DetrImageProcessor, DetrForObjectDetection
-    import torch
     import RPi.GPIO as GPIO
 
 import time
 import yaml
 import logging
+from collections import Counter
 
 logging.basicConfig(level=logging.INFO)
 
@@ -60,13 +60,25 @@ camera_config = camera1.create_video_configuration(
 )
 camera1.configure(camera_config)
 camera2.configure(camera_config)
-camera1.set_controls({"FrameRate": config["camera"]["framerate"]})
-camera2.set_controls({"FrameRate": config["camera"]["framerate"]})
+
+# PIR and unlock edges drive the cameras: warm preview on motion, full rate while unlocked
+from VisionVend.raspberry_pi.session import SessionScheduler
+session_config = config.get("session", {})
+scheduler = SessionScheduler(
+    GPIO, [camera1, camera2], PIR_PIN, SIGNAL_PIN, config["camera"]["framerate"],
+    warm_framerate=session_config.get("warm_framerate", 5),
+    preroll=session_config.get("preroll_frames", 15),
+    idle_timeout=session_config.get("idle_timeout", 30),
+    bouncetime=session_config.get("bouncetime", 50),
+)
 
 # --- Auto-labeling (dual-cam, async) ---
 import asyncio
-from VisionVend.raspberry_pi.capture import capture_frames
+from VisionVend.raspberry_pi.capture import CameraFeed
+from VisionVend.raspberry_pi.frame_ring import frame_shape
 from VisionVend.raspberry_pi.tracker import track_and_save
+from VisionVend.raspberry_pi.reconcile import Reconciler, removed_counts, reinfer_clip
+from VisionVend.raspberry_pi.inference_worker import InferenceClient
 
 RESTOCK_PIN = config["training"]["autolabel"]["restock_pin"]
 LED_PIN = config["training"]["autolabel"]["led_pin"]
@@ -74,6 +86,7 @@ LED_GREEN = tuple(config["training"]["autolabel"]["led_green"])
 LED_RED = tuple(config["training"]["autolabel"]["led_red"])
 CAM_IDS = config["training"]["autolabel"]["cam_ids"]
 TIMEOUT = config["training"]["autolabel"]["timeout_sec"]
+RING_SLOTS = config["training"]["autolabel"].get("ring_slots", 8)
 
 GPIO.setup(RESTOCK_PIN, GPIO.IN, pull_up_down=GPIO.PUD_UP)
 GPIO.setup(LED_PIN, GPIO.OUT)
@@ -87,13 +100,15 @@ def set_led(color):
 async def autolabel_workflow(sku):
     set_led((0,0,255))  # Blue: in progress
     stop_event = asyncio.Event()
-    frame_queues = [asyncio.Queue() for _ in CAM_IDS]
+    # Each camera captures and masks in its own process; feeds read frames back from shared memory
+    feeds = [CameraFeed(cam_id, frame_shape(config["camera"]), RING_SLOTS, framerate=config["camera"]["framerate"])
+             for cam_id in CAM_IDS]
     log_queue = asyncio.Queue()
     tasks = []
     
-    for i, cam_id in enumerate(CAM_IDS):
-        tasks.append(asyncio.create_task(capture_frames(cam_id, frame_queues[i], stop_event, log_queue)))
-        tasks.append(asyncio.create_task(track_and_save(cam_id, frame_queues[i], stop_event, sku, log_queue)))
+    for cam_id, feed in zip(CAM_IDS, feeds):
+        feed.start()
+        tasks.append(asyncio.create_task(track_and_save(cam_id, feed, stop_event, sku, log_queue)))
     
     try:
         await asyncio.wait_for(asyncio.gather(*tasks), timeout=TIMEOUT)
@@ -109,65 +124,71 @@ async def autolabel_workflow(sku):
         # Proper cleanup
         for task in tasks:
             task.cancel()
+        for feed in feeds:
+            if feed.dropped:
+                print(f"Camera {feed.cam_id}: tracker skipped {feed.dropped} frames")
+            feed.stop()
 
 
-# ML setup
-processor = DetrImageProcessor.from_pretrained("facebook/detr-resnet-50")
-model = DetrForObjectDetection.from_pretrained("facebook/detr-resnet-50")
-model.eval()
+# ML runs in the long-lived inference worker (inference_worker.py); we only connect to it
+detector = InferenceClient(config.get("inference", {}))
+detector.connect()
 
 # Video storage
 os.makedirs(config["camera"]["storage_path"], exist_ok=True)
 
-# Detect objects
-def detect_objects(frame):
-    inputs = processor(images=frame, return_tensors="pt")
-    outputs = model(**inputs)
-    target_sizes = torch.tensor([frame.shape[:2]])
-    results = processor.post_process_object_detection(outputs, target_sizes=target_sizes)[0]
-    detected_objects = []
-    for score, label, box in zip(results["scores"], results["labels"], results["boxes"]):
-        if score > 0.7 and model.config.id2label[label.item()] in config["inventory"]:
-            detected_objects.append(model.config.id2label[label.item()])
-    return detected_objects
-
-# Main loop
-def main():
-    transaction_id = None
-    initial_inventory = set()
-    video_writer = None
-    while True:
-        if GPIO.input(PIR_PIN) or GPIO.input(SIGNAL_PIN):  # Motion or unlock signal
-            camera1.start()
-            camera2.start()
-            if GPIO.input(SIGNAL_PIN):  # Unlock triggered
-                transaction_id = str(time.time())
-                video_path = f"{config['camera']['storage_path']}/{transaction_id}.h264"
-                video_writer = cv2.VideoWriter(video_path, cv2.VideoWriter_fourcc(*'X264'), 
-                                              config["camera"]["framerate"], config["camera"]["resolution"])
-                frame1 = camera1.capture_array()
-                initial_inventory = set(detect_objects(frame1))
-            frame1 = camera1.capture_array()
-            frame2 = camera2.capture_array()
-            if video_writer:
-                video_writer.write(frame1)  # Save primary camera feed
-            if not GPIO.input(SIGNAL_PIN) and transaction_id:  # Door closed
-                final_inventory = set(detect_objects(frame1))
-                removed_items = list(initial_inventory - final_inventory)
-                video_writer.release()
-                camera1.stop()
-                camera2.stop()
-                return transaction_id, removed_items
-            time.sleep(0.1)
-        else:
-            time.sleep(0.5)
+# Removed-item decisions: camera votes on the fast path, clip re-inference when ambiguous
+reconcile_config = config.get("reconcile", {})
+reconciler = Reconciler(
+    config["inventory"],
+    scale_tolerance=reconcile_config.get("scale_tolerance", 5.0),
+    margin=reconcile_config.get("margin", 1.0),
+)
+SLOW_PATH_THRESHOLD = reconcile_config.get("slow_threshold", 0.5)
+SLOW_PATH_SAMPLES = reconcile_config.get("slow_samples", 8)
+SLOW_PATH_WEIGHT = reconcile_config.get("slow_weight", 2.0)
 
+# Weight fusion happens on the server (reconcile_with_weight): the load cell is on
+# the ESP32, and its delta_mass reaches the server in the door event but never the
+# Pi. The Pi decides from camera votes, escalating to the clip when they disagree.
+
+# Detect objects: one batched forward pass for every frame given, results in input order
+def detect_frames(frames, threshold=None):
+    return detector.labels_per_frame(frames, threshold)
+
+def detect_objects(frame, threshold=None):
+    return detect_frames([frame], threshold)[0]
+
+# Main loop: one transaction per unlock
+def main():
+    frames_before = scheduler.wait_for_unlock()  # last warm frames, taken before the door opened
+    transaction_id = str(time.time())
+    video_path = f"{config['camera']['storage_path']}/{transaction_id}.h264"
+    video_writer = cv2.VideoWriter(video_path, cv2.VideoWriter_fourcc(*'X264'),
+                                   config["camera"]["framerate"], config["camera"]["resolution"])
+    preroll = scheduler.record(video_writer.write)  # Save primary camera feed, pre-roll first
+    logging.info(f"Transaction {transaction_id}: recording with {preroll} pre-roll frames")
+    initial_counts = [Counter(labels) for labels in detect_frames(frames_before)]
+    frames_after = scheduler.wait_for_close()
+    scheduler.finish()
+    video_writer.release()
+    final_counts = [Counter(labels) for labels in detect_frames(frames_after)]
+    votes = [removed_counts(before, after) for before, after in zip(initial_counts, final_counts)]
+    decision = reconciler.decide(votes)
+    if decision.escalate:
+        logging.info(f"Transaction {transaction_id}: {decision.reason}; re-running detection on the clip")
+        slow_vote = reinfer_clip(video_path, lambda frame: detect_objects(frame, SLOW_PATH_THRESHOLD),
+                                 samples=SLOW_PATH_SAMPLES)
+        decision = reconciler.decide(votes + [slow_vote],
+                                     vote_weights=[1.0] * len(votes) + [SLOW_PATH_WEIGHT])
+    return transaction_id, decision.item_list()
+
+scheduler.start()
 try:
     while True:
         transaction_id, removed_items = main()
         # Signal ESP32 with results (via GPIO or serial, simplified here)
         logging.info(f"Transaction {transaction_id}: Removed {removed_items}")
 except KeyboardInterrupt:
-    camera1.stop()
-    camera2.stop()
+    scheduler.close()
     GPIO.cleanup()
@@ -0,0 +1,149 @@
+"""
+reconcile.py - Fuse camera counts and the weight delta into one removed-item basket
+
+main() used to diff two *sets* of labels from one camera, so two colas taken
+looked like one. Here each camera votes with per-class counts (before minus
+after, as Counters), and the load cell's delta_mass, when we have it, is
+checked against the catalog weights. Every basket the votes allow is scored:
+
+    cost = sum over cameras of |quantity - camera count|, times the camera weight
+         + weight_factor * (weight error / allowed tolerance) ** 2
+
+The cheapest basket wins on the fast path if it fits the weight and beats
+the runner-up by `margin`. Otherwise the decision comes back with
+escalate=True. The caller then re-runs detection on the recorded clip with
+the slower settings (reinfer_clip) and decides again with that result as an
+extra, heavier vote. Most transactions never pay for the second pass.
+"""
+
+import itertools
+import logging
+import math
+from collections import Counter
+from typing import Callable, Dict, List, Mapping, NamedTuple, Optional, Sequence, Tuple
+
+
+class Decision(NamedTuple):
+    items: Dict[str, int]  # sku -> quantity removed
+    cost: float
+    escalate: bool  # too close to call; re-run detection on the clip
+    reason: str
+
+    def item_list(self) -> List[str]:
+        """Flat list with one entry per unit, the shape the server expects."""
+        return [sku for sku, quantity in self.items.items() for _ in range(quantity)]
+
+
+def removed_counts(before: Mapping[str, int], after: Mapping[str, int]) -> Counter:
+    """Per-class units that disappeared; Counter subtraction drops anything that grew."""
+    return Counter(before) - Counter(after)
+
+
+class Reconciler:
+    """Scores candidate baskets from camera votes and the weight delta"""
+
+    def __init__(self, inventory: Mapping[str, Mapping], scale_tolerance: float = 5.0,
+                 weight_factor: float = 1.0, margin: float = 1.0, max_combinations: int = 4096):
+        self.weights = {sku: float(entry.get("weight", 0)) for sku, entry in inventory.items()}
+        self.tolerances = {sku: float(entry.get("tolerance", 5)) for sku, entry in inventory.items()}
+        self.scale_tolerance = scale_tolerance
+        self.weight_factor = weight_factor
+        self.margin = margin
+        self.max_combinations = max_combinations
+        self.fast = 0
+        self.escalated = 0
+
+    def weight_error(self, items: Mapping[str, int], delta_mass: float) -> float:
+        """Weight misfit in tolerances: <= 1 means the basket explains delta_mass."""
+        expected = sum(self.weights.get(sku, 0.0) * quantity for sku, quantity in items.items())
+        variance = sum(self.tolerances.get(sku, 0.0) ** 2 * quantity for sku, quantity in items.items())
+        return abs(delta_mass - expected) / (math.sqrt(variance) + self.scale_tolerance)
+
+    def _choices(self, votes: Sequence[Mapping[str, int]], use_weight: bool) -> Dict[str, List[int]]:
+        choices = {}
+        for sku in sorted({sku for vote in votes for sku in vote}):
+            counts = {vote.get(sku, 0) for vote in votes}
+            if use_weight:
+                # The scale can settle an occluded unit either way
+                counts.add(max(counts) + 1)
+                counts.add(max(min(counts) - 1, 0))
+            choices[sku] = sorted(counts)
+        return choices
+
+    def decide(self, votes: Sequence[Mapping[str, int]], delta_mass: Optional[float] = None,
+               vote_weights: Optional[Sequence[float]] = None) -> Decision:
+        """Pick the basket the camera votes and the weight agree on best."""
+        vote_weights = list(vote_weights or [1.0] * len(votes))
+        use_weight = delta_mass is not None
+        choices = self._choices(votes, use_weight)
+        if not choices:
+            if use_weight and self.weight_error({}, delta_mass) > 1.0:
+                return Decision({}, 0.0, True, f"cameras saw nothing but {delta_mass:.0f} g is missing")
+            return Decision({}, 0.0, False, "nothing removed")
+
+        combinations = 1
+        for counts in choices.values():
+            combinations *= len(counts)
+        if combinations > self.max_combinations:
+            return Decision({}, math.inf, True, f"{combinations} candidate baskets")
+
+        skus = list(choices)
+        scored: List[Tuple[float, Dict[str, int], float]] = []
+        for quantities in itertools.product(*(choices[sku] for sku in skus)):
+            items = {sku: quantity for sku, quantity in zip(skus, quantities) if quantity}
+            cost = sum(
+                weight * sum(abs(items.get(sku, 0) - vote.get(sku, 0)) for sku in skus)
+                for vote, weight in zip(votes, vote_weights)
+            )
+            misfit = self.weight_error(items, delta_mass) if use_weight else 0.0
+            cost += self.weight_factor * misfit ** 2
+            scored.append((cost, items, misfit))
+        scored.sort(key=lambda entry: entry[0])
+
+        cost, items, misfit = scored[0]
+        if misfit > 1.0:
+            reason = f"best basket is {misfit:.1f} tolerances off the weight"
+        elif len(scored) > 1 and scored[1][0] - cost < self.margin:
+            reason = f"runner-up {scored[1][1]} within {self.margin} of {items}"
+        else:
+            self.fast += 1
+            return Decision(items, cost, False, "fast path")
+        self.escalated += 1
+        return Decision(items, cost, True, reason)
+
+
+def reinfer_clip(video_path: str, detect: Callable, samples: int = 8, edge_fraction: float = 0.25) -> Counter:
+    """
+    Slow path: count each class on several frames from the start and the end of
+    the recorded clip, take the per-class median at each end, and return the
+    difference. Medians ride out frames where a hand hides a product.
+    """
+    import cv2
+
+    capture = cv2.VideoCapture(str(video_path))
+    total = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+    if total <= 0:
+        capture.release()
+        logging.warning(f"Clip {video_path} has no frames; slow path has nothing to add")
+        return Counter()
+
+    edge = max(1, int(total * edge_fraction))
+    per_end = max(1, samples // 2)
+
+    def end_counts(first: int, last: int) -> Counter:
+        step = max(1, (last - first) // per_end)
+        frames = []
+        for index in range(first, last, step):
+            capture.set(cv2.CAP_PROP_POS_FRAMES, index)
+            ok, frame = capture.read()
+            if ok:
+                frames.append(Counter(detect(frame)))
+        if not frames:
+            return Counter()
+        skus = {sku for counts in frames for sku in counts}
+        return Counter({sku: sorted(counts[sku] for counts in frames)[len(frames) // 2] for sku in skus})
+
+    try:
+        return removed_counts(end_counts(0, edge), end_counts(total - edge, total))
+    finally:
+        capture.release()
@@ -0,0 +1,215 @@
+"""
+session.py - Event-driven camera sessions for the Pi
+
+The PIR and unlock pins raise GPIO edge callbacks. The callbacks only put
+(pin, level) on a queue, and SessionScheduler blocks on that queue, so
+nothing sleeps in a polling loop and an edge is handled as soon as it
+arrives.
+
+Cameras have three states:
+- COLD: stopped.
+- WARM: started by the first PIR edge. They run at `warm_framerate` while a
+  CameraStream thread per camera keeps the last `preroll` frames.
+- ACTIVE: on the unlock edge the frame rate goes up to `framerate`. Nothing
+  is started, so the door opening never waits on a camera. The newest
+  pre-roll frames serve as the before-image, and record() writes the
+  pre-roll into the clip ahead of live frames.
+
+Cameras go back to WARM when the door closes, and to COLD after
+`idle_timeout` seconds with the PIR low.
+
+Edges also queue up while the caller is busy, e.g. running detection. Each
+wait first drains what is queued and then trusts the pin's current level.
+After that, a signal edge only counts if it changes the level already seen.
+A stale unlock edge left over from the last session therefore never starts
+a phantom transaction.
+
+The clip is written at `framerate`. Pre-roll frames captured at the warm
+rate are repeated framerate / warm_framerate times so the pre-roll plays
+back at real speed. The clip keeps a single frame rate for every consumer,
+reinfer_clip included.
+"""
+import logging
+import queue
+import threading
+import time
+from collections import deque
+
+COLD, WARM, ACTIVE = "cold", "warm", "active"
+
+
+class CameraStream(threading.Thread):
+    """Captures one camera continuously; keeps the last `preroll` frames and feeds an optional sink"""
+
+    def __init__(self, camera, name, preroll=15, repeat=1):
+        super().__init__(name=f"stream-{name}", daemon=True)
+        self.camera = camera
+        self.repeat = repeat  # clip frames per captured frame at the current rate
+        self.frames = deque(maxlen=max(1, preroll))  # (frame, repeat) pairs
+        self._cond = threading.Condition()
+        self._sink = None
+        self.running = True
+
+    def run(self):
+        while self.running:
+            frame = self.camera.capture_array()
+            with self._cond:
+                self.frames.append((frame, self.repeat))
+                if self._sink is not None:
+                    self._sink(frame)
+                self._cond.notify_all()
+
+    def latest(self, timeout=2.0):
+        """Newest frame, waiting for the first one after a cold start; None if none arrives."""
+        with self._cond:
+            self._cond.wait_for(lambda: self.frames, timeout)
+            return self.frames[-1][0] if self.frames else None
+
+    def record(self, sink):
+        """Write the pre-roll to `sink`, then every new frame, with no gap between them."""
+        with self._cond:
+            for frame, repeat in self.frames:
+                for _ in range(repeat):
+                    sink(frame)
+            self._sink = sink
+            return len(self.frames)
+
+    def detach(self):
+        with self._cond:
+            self._sink = None
+
+
+class SessionScheduler:
+    """Turns PIR and unlock edges into camera sessions: warm on motion, full rate while unlocked"""
+
+    def __init__(self, gpio, cameras, pir_pin, signal_pin, framerate, warm_framerate=5,
+                 preroll=15, idle_timeout=30.0, bouncetime=50):
+        self.gpio = gpio
+        self.cameras = cameras
+        self.pir_pin = pir_pin
+        self.signal_pin = signal_pin
+        self.framerate = framerate
+        self.warm_framerate = warm_framerate
+        self.preroll = preroll
+        self.idle_timeout = idle_timeout
+        self.bouncetime = bouncetime
+        self.state = COLD
+        self.streams = []
+        self._events = queue.Queue()
+        self._idle_since = None
+        self._signal = 0  # unlock level as last acted on
+
+    def start(self):
+        for pin in (self.pir_pin, self.signal_pin):
+            self.gpio.add_event_detect(pin, self.gpio.BOTH, callback=self._edge, bouncetime=self.bouncetime)
+        if self.gpio.input(self.pir_pin):
+            self._warm()
+
+    def _edge(self, pin):
+        # RPi.GPIO callback thread: hand the edge over and return at once
+        self._events.put((pin, self.gpio.input(pin)))
+
+    def _set_rate(self, framerate):
+        for camera in self.cameras:
+            camera.set_controls({"FrameRate": framerate})
+        repeat = max(1, round(self.framerate / framerate))
+        for stream in self.streams:
+            stream.repeat = repeat
+
+    def _warm(self):
+        if self.state == COLD:
+            for camera in self.cameras:
+                camera.start()
+            self.streams = [CameraStream(camera, i, self.preroll) for i, camera in enumerate(self.cameras)]
+            self._set_rate(self.warm_framerate)
+            for stream in self.streams:
+                stream.start()
+            self.state = WARM
+            logging.info("Cameras warm")
+        self._idle_since = None if self.gpio.input(self.pir_pin) else time.monotonic()
+
+    def _cool(self):
+        for stream in self.streams:
+            stream.running = False
+        for stream in self.streams:
+            stream.join(timeout=1.0)
+        for camera in self.cameras:
+            camera.stop()
+        self.streams = []
+        self.state = COLD
+        self._idle_since = None
+        logging.info("Cameras cold")
+
+    def _next_event(self):
+        """Next (pin, level); on idle timeout cools the cameras and keeps waiting."""
+        while True:
+            timeout = None
+            if self.state == WARM and self._idle_since is not None:
+                timeout = max(0.0, self._idle_since + self.idle_timeout - time.monotonic())
+            try:
+                return self._events.get(timeout=timeout)
+            except queue.Empty:
+                self._cool()
+
+    def _on_motion(self, level):
+        if level:
+            self._warm()
+        elif self.state == WARM:
+            self._idle_since = time.monotonic()
+
+    def _sync(self):
+        """Apply queued edges, then take the unlock level from the pin itself."""
+        while True:
+            try:
+                pin, level = self._events.get_nowait()
+            except queue.Empty:
+                break
+            if pin == self.pir_pin:
+                self._on_motion(level)
+        self._signal = self.gpio.input(self.signal_pin)
+
+    def _wait_signal(self, level):
+        """Block until the unlock level is ``level``, handling motion meanwhile."""
+        self._sync()
+        while self._signal != level:
+            pin, value = self._next_event()
+            if pin == self.pir_pin:
+                self._on_motion(value)
+            elif value != self._signal:  # a repeat of the level we already saw is stale
+                self._signal = value
+
+    def latest(self):
+        """Newest frame from each camera."""
+        return [stream.latest() for stream in self.streams]
+
+    def wait_for_unlock(self):
+        """Block until the unlock edge; returns each camera's last frame from before it."""
+        self._wait_signal(1)
+        self._warm()
+        before = self.latest()
+        self._set_rate(self.framerate)
+        self.state = ACTIVE
+        return before
+
+    def record(self, sink):
+        """Send the primary camera's pre-roll and then its live frames to `sink`; returns the pre-roll length."""
+        return self.streams[0].record(sink)
+
+    def wait_for_close(self):
+        """Block until the door signal drops; returns each camera's frame at that moment."""
+        self._wait_signal(0)
+        return self.latest()
+
+    def finish(self):
+        """End the session: stop recording and drop back to the warm frame rate."""
+        for stream in self.streams:
+            stream.detach()
+        self._set_rate(self.warm_framerate)
+        self.state = WARM
+        self._idle_since = None if self.gpio.input(self.pir_pin) else time.monotonic()
+
+    def close(self):
+        for pin in (self.pir_pin, self.signal_pin):
+            self.gpio.remove_event_detect(pin)
+        if self.state != COLD:
+            self._cool()
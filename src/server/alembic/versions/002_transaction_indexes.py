@@ -0,0 +1,29 @@
+"""Index transactions for device, status and payment intent lookups
+
+Revision ID: 002
+Revises: 001
+Create Date: 2025-02-10 09:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '002'
+down_revision = '001'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_transactions_device_id_created_at', 'transactions', ['device_id', 'created_at'], unique=False)
+    op.create_index('ix_transactions_status_created_at', 'transactions', ['status', 'created_at'], unique=False)
+    op.create_index('ix_transactions_payment_intent_id', 'transactions', ['payment_intent_id'], unique=False)
+    op.create_index('ix_transaction_items_transaction_id', 'transaction_items', ['transaction_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_transaction_items_transaction_id', table_name='transaction_items')
+    op.drop_index('ix_transactions_payment_intent_id', table_name='transactions')
+    op.drop_index('ix_transactions_status_created_at', table_name='transactions')
+    op.drop_index('ix_transactions_device_id_created_at', table_name='transactions')
@@ -2,8 +2,7 @@ import stripe
 from paho.mqtt import client as mqtt_client
 import yaml
 import os
-import hmac
-import hashlib
+import sys
 import logging
 from pywebpush import webpush, WebPushException
 import logging
@@ -14,16 +13,31 @@ from dotenv import load_dotenv
 import gspread
 from google.oauth2.service_account import Credentials
 import datetime
+from decimal import Decimal
 from collections import Counter
+from pathlib import Path
 import aiosqlite
 import json
 import asyncio
-from concurrent.futures import ThreadPoolExecutor
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
-from database import get_db, create_tables, async_session_maker
+from sqlalchemy.exc import IntegrityError
+import queries
+import line_items
+from database import get_db, get_read_db, create_tables, async_session_maker, pool_stats
+from ingest import MqttIngest
+from device_registry import DeviceRegistry, machine_topic, topic_machine, wildcard_topic
+from payments import PaymentExecutor
+from intent_pool import IntentPool
+from catalog import Catalog, SkuRecord, DEFAULT_TOLERANCE, to_cents
+from basket import BasketSolver
+from sheets_sync import ConfigFileWriter, ProductSheetSync
+from sales_log import SalesLogBatcher
 from models import Transaction, Device, Product, TransactionItem, TransactionStatus, PaymentStatus
 
+sys.path.append(str(Path(__file__).resolve().parents[2]))
+from VisionVend.utils.security import EnvelopeError, KeyRing, Signer, Verifier
+from VisionVend.utils import wire
+
 def send_notification(payload):
     logging.info(f"[Dummy] send_notification called with: {payload}")
 
@@ -50,14 +64,52 @@ CONFIG_FILE_PATH = "../config/config.yaml"
 with open(CONFIG_FILE_PATH, "r") as f:
     config = yaml.safe_load(f)
 
+# Pricing reads immutable snapshots of this; the Sheets sync thread publishes new ones
+catalog = Catalog.from_inventory(config.get("inventory"))
+
+# Explains door delta_mass in catalog SKUs; tables are rebuilt only when the catalog changes
+basket_config = config.get("basket", {})
+basket_solver = BasketSolver(
+    max_items=basket_config.get("max_items", 8),
+    scale_tolerance=basket_config.get("scale_tolerance", 5.0),
+    ambiguity_margin=basket_config.get("ambiguity_margin", 0.5),
+)
+WEIGHT_FALLBACK = basket_config.get("weight_fallback", True)
+basket_checks = Counter()
+
 stripe.api_key = os.getenv("STRIPE_API_KEY") or config["stripe"]["api_key"]
+stripe_account = os.getenv("STRIPE_CONNECT_ACCOUNT_ID") or config["stripe"].get("connect_account_id")
+payments_config = config["stripe"].get("executor", {})
+intent_pool_config = config["stripe"].get("intent_pool", {})
+PREAUTH_AMOUNT_CENTS = 100  # Smallest pre-auth amount, adjusted at capture
+MIN_CHARGE_CENTS = 50       # Stripe's minimum charge for USD
 mqtt_broker = config["mqtt"]["broker"]
 mqtt_port = config["mqtt"]["port"]
 mqtt_client_id = config["mqtt"]["client_id"]
 unlock_topic = config["mqtt"]["unlock_topic"]
 status_topic = config["mqtt"]["status_topic"]
 door_topic = config["mqtt"]["door_topic"]
-hmac_secret = config["mqtt"]["hmac_secret"]
+message_keys = KeyRing.from_config(config["mqtt"])
+signer = Signer(message_keys)
+verifier = Verifier(
+    message_keys,
+    max_skew=config["mqtt"].get("max_clock_skew", 60),
+    accept_legacy=config["mqtt"].get("accept_legacy_hmac", False),
+)
+ingest_config = config["mqtt"].get("ingest", {})
+
+# Stripe calls run on a bounded worker pool, never on the event loop
+payments = PaymentExecutor(
+    max_workers=payments_config.get("max_workers", 8),
+    per_account_limit=payments_config.get("per_account_limit", 4),
+    account=stripe_account,
+)
+intent_pool = IntentPool(
+    payments,
+    PREAUTH_AMOUNT_CENTS,
+    size=intent_pool_config.get("size", 2),
+    max_age=intent_pool_config.get("max_age", 3600),
+)
 
 # --- Google Sheets Integration START ---
 # Get Google Sheet ID from env, or parse from share link
@@ -100,68 +152,72 @@ if GSHEET_ENABLED:
         logging.error(f"Failed to initialize Google Sheets client: {e}. Disabling GSheet integration.")
         GSHEET_ENABLED = False
 
-def products_to_config():
-    global config 
-    if not GSHEET_ENABLED or not PROD_TAB:
+sheets_config = config.get("google_sheets", {})
+product_sync = None
+config_writer = ConfigFileWriter(CONFIG_FILE_PATH)
+if GSHEET_ENABLED:
+    product_sync = ProductSheetSync(
+        PROD_TAB,
+        SHEET,
+        min_interval=sheets_config.get("sync_interval", 30),
+        max_interval=sheets_config.get("max_sync_interval", 300),
+    )
+
+def apply_product_diff(diff):
+    """Apply changed Products rows to the catalog and persist config.yaml if it changed."""
+    current = catalog.snapshot()
+    upserts = []
+    for sku, (_, name, price, weight, *_) in diff.upserts.items():
+        try:
+            previous = current.get(sku)
+            upserts.append(SkuRecord(
+                sku=sku,
+                price_cents=to_cents(price),
+                weight=float(weight),
+                tolerance=previous.tolerance if previous else DEFAULT_TOLERANCE,
+            ))
+        except (ValueError, ArithmeticError):
+            logging.warning(f"Bad numeric value in Google Sheet row with SKU={sku}; skipped")
+
+    if diff.complete:
+        # Full read of the sheet: it is the whole catalog, anything not in it is gone
+        snapshot = catalog.publish(upserts)
+        logging.info(f"Catalog replaced from Google Sheets ({len(snapshot)} SKUs)")
+    else:
+        snapshot = catalog.apply(upserts, diff.removed)
+        logging.info(f"Catalog updated from Google Sheets: {len(upserts)} changed, {len(diff.removed)} removed ({len(snapshot)} SKUs)")
+
+    # Dump a copy so the shared config dict is never mutated from this thread
+    if config_writer.write({**config, "inventory": snapshot.to_inventory()}):
+        logging.info(f"config.yaml updated with inventory from Google Sheets ({len(snapshot)} SKUs)")
+
+def products_to_config(force=False):
+    if not GSHEET_ENABLED or not product_sync:
         logging.warning("Google Sheets not enabled or Product Tab not available. Skipping products_to_config.")
         return
 
     logging.info("Attempting to sync products from Google Sheets...")
     try:
-        rows = PROD_TAB.get_all_values()[1:]  
-        inv = {}
-        for sku, name, price, weight, *_ in rows:
-            if not sku:  
-                continue
-            try:
-                inv[sku] = {
-                    "price": float(price),
-                    "weight": float(weight),
-                    "tolerance": config.get("inventory", {}).get(sku, {}).get("tolerance", 5) 
-                }
-            except ValueError:
-                logging.warning(f"Bad numeric value in Google Sheet row with SKU={sku}; skipped")
-
-        config["inventory"] = inv
-        
-        with open(CONFIG_FILE_PATH, "w") as f:
-            yaml.dump(config, f, sort_keys=False) 
-        
-        logging.info(f"config.yaml updated with inventory from Google Sheets ({len(inv)} SKUs)")
+        diff = product_sync.poll(force=force)
+        if diff:
+            apply_product_diff(diff)
     except Exception as e:
         logging.error(f"Error in products_to_config: {e}")
 
-def periodic_sync(interval=30):
-    while True:
-        products_to_config()
-        time.sleep(interval)
-
-def append_sale_row(sku: str, qty: int, tx_id: str):
-    if not GSHEET_ENABLED or not SALES_TAB:
-        logging.warning("Google Sheets not enabled or Sales Tab not available. Skipping append_sale_row.")
-        return
-    try:
-        now_iso = datetime.datetime.utcnow().isoformat(" ", timespec="seconds")
-        SALES_TAB.append_row([now_iso, sku, -abs(qty), tx_id], value_input_option="USER_ENTERED")
-        logging.info(f"Appended sale to Google Sheet: TX_ID={tx_id}, SKU={sku}, QTY={-abs(qty)}")
-    except Exception as e:
-        logging.error(f"Error in append_sale_row: {e}")
-
-# Create a thread pool for synchronous Google Sheets operations
-executor = ThreadPoolExecutor(max_workers=1)
+def periodic_sync():
+    # Adaptive interval: backs off while the sheet is quiet, resets on change
+    product_sync.run_forever(apply_product_diff)
 
-async def append_sale_row_async(sku: str, qty: int, tx_id: str):
-    """Asynchronously appends a sale row to Google Sheets by running the synchronous gspread call in a thread pool."""
-    if not GSHEET_ENABLED or not SALES_TAB:
-        return
-    
-    loop = asyncio.get_event_loop()
-    # Use run_in_executor to run the blocking I/O operation in a separate thread
-    await loop.run_in_executor(
-        executor,
-        append_sale_row, # The original synchronous function
-        sku, qty, tx_id
+# Sales rows go through a local write-ahead log and are flushed in batches with append_rows
+sales_log = None
+if GSHEET_ENABLED:
+    sales_log = SalesLogBatcher(
+        SALES_TAB,
+        sheets_config.get("sales_wal_path", "sales_log.wal"),
+        batch_size=sheets_config.get("sales_batch_size", 100),
+        flush_interval=sheets_config.get("sales_flush_interval", 5),
     )
+sales_log_task = None
 
 # --- Google Sheets Integration END ---
 
@@ -171,52 +227,73 @@ async def append_sale_row_async(sku: str, qty: int, tx_id: str):
 async def startup():
     await create_tables()
     logging.info("Database tables created.")
+    await device_registry.load()
+    await device_registry.ensure_default()
+    intent_pool.warm(device_registry.active_device_ids())
 
-async def get_default_device(db: AsyncSession) -> Device:
-    """Get or create default device"""
-    result = await db.execute(select(Device).where(Device.device_id == "default"))
-    device = result.scalar_one_or_none()
-    
-    if not device:
-        device = Device(
-            device_id="default",
-            name="Main Vending Machine",
-            location="Default Location"
-        )
-        db.add(device)
-        await db.commit()
-        await db.refresh(device)
-    
-    return device
+# The configured topics name the default device's machine; other devices use case/<device_id>/...
+device_registry = DeviceRegistry(async_session_maker, default_machine_id=topic_machine(unlock_topic),
+                                 ttl=config.get("server", {}).get("device_cache_ttl", 30))
+door_subscription = wildcard_topic(door_topic)
 
 # --- Database Integration END ---
 
 # MQTT client setup
 mqtt = mqtt_client.Client(mqtt_client_id)
+
+def on_connect(client, userdata, flags, rc):
+    if rc == 0:
+        # Subscribing here (instead of once at import) restores the subscription after reconnects
+        client.subscribe(door_subscription)
+        logging.info(f"Subscribed to {door_subscription}")
+    else:
+        logging.warning(f"MQTT connection refused with code {rc}")
+
+mqtt.on_connect = on_connect
 try:
     mqtt.connect(mqtt_broker, mqtt_port)
     logging.info(f"Connected to MQTT broker at {mqtt_broker}:{mqtt_port}")
 except Exception as e:
     logging.warning(f"Could not connect to MQTT broker: {e}. Running without MQTT.")
 
-# Validate MQTT payload
-def validate_hmac(payload, received_hmac):
-    computed_hmac = hmac.new(hmac_secret.encode(), payload, hashlib.sha256).hexdigest()
-    return computed_hmac == received_hmac
+def reconcile_with_weight(transaction_id: str, items: list, delta_mass: float, prices) -> list:
+    """Fuse the vision basket with the weight change; use the weight alone if vision saw nothing."""
+    if items:
+        counts = Counter(items)
+        fit = basket_solver.evaluate(counts, delta_mass, prices)
+        basket_checks["checked"] += 1
+        if fit is None or fit.score <= 1.0:
+            return items
+        basket_checks["mismatched"] += 1
+        fused = basket_solver.fuse(counts, delta_mass, prices)
+        if fused is None:
+            logging.warning(f"Transaction {transaction_id}: vision basket is {fit.error:+.0f} g off the measured "
+                            f"{delta_mass:.0f} g and no basket fits the weight unambiguously; keeping {dict(counts)}")
+            return items
+        basket_checks["corrected"] += 1
+        logging.warning(f"Transaction {transaction_id}: vision basket {dict(counts)} is {fit.error:+.0f} g off the "
+                        f"measured {delta_mass:.0f} g; charging {dict(fused.items)} instead")
+        return [sku for sku, quantity in fused.items for _ in range(quantity)]
+    if not WEIGHT_FALLBACK:
+        return items
+    guess = basket_solver.infer(delta_mass, prices)
+    if guess is None or not guess.items:
+        return items
+    basket_checks["weight_fallback"] += 1
+    logging.info(f"Transaction {transaction_id}: no items from vision; {delta_mass:.0f} g matches {dict(guess.items)}")
+    return [sku for sku, quantity in guess.items for _ in range(quantity)]
 
 # MQTT message handling
-async def process_mqtt_message(payload_str: str, mqtt_client_ref):
+async def process_mqtt_message(event: wire.DoorEvent, mqtt_client_ref, topic: str = ""):
     # This function contains the async logic previously in on_message
-    transaction_id, items_str, delta_mass_str = payload_str.split(":") # payload_str is already validated
-    items = items_str.split(",") if items_str else []
-    items = [item.strip() for item in items if item.strip()]
-    # delta_mass = float(delta_mass_str) # Not used directly in this logic path after split
+    transaction_id = event.transaction_id
+    items = [sku for sku, quantity in event.items for _ in range(quantity)]
+    machine_id = topic_machine(topic) if topic else None
+    reply_topic = machine_topic(status_topic, machine_id) if machine_id else status_topic
 
     async with async_session_maker() as db:
         try:
-            result = await db.execute(
-                select(Transaction).where(Transaction.transaction_id == transaction_id)
-            )
+            result = await db.execute(queries.transaction_by_external_id(transaction_id))
             transaction_record = result.scalar_one_or_none()
         except Exception as e:
             logging.error(f"Error fetching transaction {transaction_id} from DB: {e}")
@@ -233,29 +310,36 @@ async def process_mqtt_message(payload_str: str, mqtt_client_ref):
             logging.warning(f"Transaction {transaction_id} already processed or in unexpected state: {current_status}. Ignoring.")
             return
 
-        # Ensure config is accessible; it's global so it should be fine.
-        total = sum(config.get("inventory", {}).get(item, {"price": 0})["price"] for item in items)
+        # One snapshot per event keeps the whole basket priced against a consistent catalog
+        prices = catalog.snapshot()
+        items = reconcile_with_weight(transaction_id, items, event.delta_mass, prices)
+        unknown_items = prices.unknown(items)
+        if unknown_items:
+            logging.warning(f"Transaction {transaction_id} contains SKUs missing from the catalog: {unknown_items}")
+        basket = Counter(items)
+        total_cents = prices.total_cents(items)
+        total = Decimal(total_cents) / 100
         items_json = json.dumps(items)
         new_status = ''
 
         try:
             if items and payment_intent_id:
-                total_cents = int(total * 100)
-                stripe.PaymentIntent.modify(payment_intent_id, amount=max(total_cents, 50))
-                stripe.PaymentIntent.capture(payment_intent_id)
+                await payments.capture(
+                    payment_intent_id,
+                    max(total_cents, MIN_CHARGE_CENTS),
+                    transaction_id,
+                    authorized_cents=PREAUTH_AMOUNT_CENTS,
+                )
                 send_notification({"title": "Receipt", "body": f"Items: {', '.join(items)}, Total: ${total:.2f}"})
                 new_status = TransactionStatus.CAPTURED
-                if GSHEET_ENABLED:
-                    item_counts = Counter(items)
-                    # Create a list of async tasks for appending sales data
-                    tasks = []
-                    for sku_item, qty_removed in item_counts.items():
-                        tasks.append(append_sale_row_async(sku_item, qty_removed, transaction_id))
-                    # Run all sheet-appending tasks concurrently
-                    await asyncio.gather(*tasks)
-                    logging.info(f"Finished logging {len(tasks)} item types to Google Sheets for transaction {transaction_id}.")
+                if sales_log:
+                    queued = await sales_log.record(transaction_id, basket)
+                    logging.info(f"Queued {queued} sale row(s) for Google Sheets for transaction {transaction_id}.")
+                transaction_record = await line_items.record_line_items(db, transaction_record, basket, prices)
+                # Captured baskets live in transaction_items; the blob stays only if that write failed
+                items_json = transaction_record.items_json
             elif payment_intent_id:
-                stripe.PaymentIntent.cancel(payment_intent_id)
+                await payments.cancel(payment_intent_id, transaction_id)
                 send_notification({"title": "No Charge", "body": "No items removed"})
                 new_status = TransactionStatus.CANCELLED
             else:
@@ -289,80 +373,257 @@ async def process_mqtt_message(payload_str: str, mqtt_client_ref):
         finally:
             # Publish status via MQTT client passed as reference
             if new_status == TransactionStatus.ERROR:
-                mqtt_client_ref.publish(status_topic, f"{transaction_id}:ERROR")
+                mqtt_client_ref.publish(reply_topic, signer.sign(wire.encode(wire.Result(transaction_id, wire.ERROR))))
             if new_status == TransactionStatus.CAPTURED:
-                if GSHEET_ENABLED:
-                    logging.info(f"Logging {len(item_counts)} sale(s) to Google Sheets for transaction {transaction_id}...")
-                    for sku, qty in item_counts.items():
-                        await append_sale_row_async(sku, qty, transaction_id)
-                mqtt_client_ref.publish(status_topic, f"{transaction_id}:CAPTURED:{total:.2f}")
+                mqtt_client_ref.publish(reply_topic, signer.sign(wire.encode(wire.Result(transaction_id, wire.CAPTURED, total_cents))))
             elif new_status == TransactionStatus.CANCELLED:
-                mqtt_client_ref.publish(status_topic, f"{transaction_id}:CANCELLED")
+                mqtt_client_ref.publish(reply_topic, signer.sign(wire.encode(wire.Result(transaction_id, wire.CANCELLED))))
+
+# Door events currently being processed; guards against duplicate (QoS 1 redelivered)
+# messages for the same transaction being handled by two ingest workers at once
+_inflight_transactions = set()
+
+async def handle_door_event(event: wire.DoorEvent, mqtt_client_ref, topic: str):
+    transaction_id = event.transaction_id
+    if transaction_id in _inflight_transactions:
+        logging.warning(f"Duplicate door event for transaction {transaction_id} while it is in flight. Ignoring.")
+        return
+    _inflight_transactions.add(transaction_id)
+    try:
+        await process_mqtt_message(event, mqtt_client_ref, topic)
+    finally:
+        _inflight_transactions.discard(transaction_id)
+
+door_ingest = MqttIngest(
+    handle_door_event,
+    queue_size=ingest_config.get("queue_size", 1000),
+    workers=ingest_config.get("workers", 4),
+    put_timeout=ingest_config.get("put_timeout", 5),
+)
+
+def decode_door_event(payload: bytes) -> wire.DoorEvent:
+    try:
+        wire.message_type(payload)
+    except wire.WireError:
+        # "transaction_id:items_str:delta_mass" from firmware that predates the wire format
+        return wire.parse_legacy_door(payload.decode())
+    event = wire.decode(payload)
+    if not isinstance(event, wire.DoorEvent):
+        raise wire.WireError(f"Expected a door event, got {type(event).__name__}")
+    return event
 
 def on_message(client, userdata, msg):
-    if msg.topic == door_topic:
-        payload, received_hmac = msg.payload.decode().split("|")
-        if validate_hmac(payload, received_hmac):
-            # payload is "transaction_id:items_str:delta_mass"
-            # Schedule the async processing part
-            asyncio.create_task(process_mqtt_message(payload, client)) # Pass client for publishing status
-        else:
-            logging.warning(f"Invalid HMAC for message on {door_topic}: {msg.payload.decode()}")
+    # Runs on the paho network thread: validate cheaply, then hand off to the event loop
+    if mqtt_client.topic_matches_sub(door_subscription, msg.topic):
+        try:
+            payload = verifier.open(msg.payload)
+        except EnvelopeError as e:
+            logging.warning(f"Rejected message on {msg.topic}: {e}")
+            return
+        try:
+            event = decode_door_event(payload)
+        except (wire.WireError, UnicodeDecodeError) as e:
+            logging.warning(f"Malformed door event on {msg.topic}: {e}")
+            return
+        door_ingest.submit(event, client, msg.topic) # Pass client and topic for publishing status
 
 mqtt.on_message = on_message
-mqtt.subscribe(door_topic)
 
 class UnlockRequest(BaseModel):
     id: str = None
+    device_id: str = None
 
 @app.on_event("startup")
 async def startup_event():
+    global sales_log_task
     if GSHEET_ENABLED:
         # Initial sync on startup
-        products_to_config() 
+        products_to_config(force=True) 
         # Start background thread for periodic sync
         sync_thread = threading.Thread(target=periodic_sync, daemon=True)
         sync_thread.start()
         logging.info("Periodic Google Sheets sync thread started.")
+        sales_log_task = asyncio.create_task(sales_log.run())
     else:
         logging.warning("Google Sheets integration is disabled. Periodic sync will not run.")
     
     # Database is initialized in startup event handler
 
+    # Consumers must be bound to the running loop before paho starts delivering messages
+    await door_ingest.start()
+    mqtt.loop_start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    # loop_stop() joins paho's network thread; a submit() in flight needs this loop,
+    # so refuse new messages and join off the loop
+    door_ingest.close()
+    await asyncio.to_thread(mqtt.loop_stop)
+    await door_ingest.stop()
+    await intent_pool.close()
+    payments.shutdown()
+    if sales_log:
+        await sales_log.close()
+        if sales_log_task:
+            await sales_log_task
+
+@app.get("/stats/ingest")
+async def ingest_stats():
+    return door_ingest.stats()
+
+@app.get("/stats/payments")
+async def payment_stats():
+    return payments.stats()
+
+@app.get("/stats/sales-log")
+async def sales_log_stats():
+    return sales_log.stats() if sales_log else {"enabled": False}
+
+@app.get("/stats/devices")
+async def device_stats():
+    return device_registry.stats()
+
+@app.get("/stats/intent-pool")
+async def intent_pool_stats():
+    return intent_pool.stats()
+
+@app.get("/stats/signing")
+async def signing_stats():
+    return verifier.stats()
+
+@app.get("/stats/basket")
+async def basket_stats():
+    return {**basket_solver.stats(), **basket_checks}
+
+@app.get("/stats/db")
+async def db_stats():
+    return pool_stats()
+
+REPORT_MAX_ROWS = 500
+
+@app.get("/stats/transactions/{device_id}")
+async def device_transaction_report(device_id: str, hours: float = 24, limit: int = 100,
+                                    db: AsyncSession = Depends(get_read_db)):
+    """A machine's recent transactions, newest first. Reporting read: served by the replica when one is set."""
+    device = await device_registry.resolve(device_id)
+    if device is None:
+        raise HTTPException(status_code=404, detail={"status": "error", "message": "Unknown device"})
+    since = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(hours=hours)
+    result = await db.execute(queries.device_transactions_since(device.pk, since, max(1, min(limit, REPORT_MAX_ROWS))))
+    return [
+        {
+            "transaction_id": transaction.transaction_id,
+            "status": transaction.status,
+            "total": float(transaction.total_amount) if transaction.total_amount is not None else None,
+            "created_at": transaction.created_at.isoformat() if transaction.created_at else None,
+        }
+        for transaction in result.scalars()
+    ]
+
+# Unlock requests currently being served, so a double tap waits for the first one
+_pending_unlocks = {}
+
+async def existing_unlock(db: AsyncSession, transaction_id: str):
+    result = await db.execute(queries.transaction_by_external_id(transaction_id))
+    transaction = result.scalar_one_or_none()
+    if transaction is None:
+        return None
+    return {"status": "success", "transaction_id": transaction_id, "transaction_status": transaction.status}
+
 @app.post("/unlock")
 async def unlock(request: Request, db: AsyncSession = Depends(get_db)):
     body = await request.json()
     transaction_id = body.get("id") if body and body.get("id") else os.urandom(16).hex()
+
+    # Repeated calls with the same id are answered from the first one, never unlock twice
+    pending = _pending_unlocks.get(transaction_id)
+    if pending is not None:
+        return await asyncio.shield(pending)
+    future = asyncio.get_running_loop().create_future()
+    _pending_unlocks[transaction_id] = future
     try:
-        payment_intent = stripe.PaymentIntent.create(
-            amount=100,  # Smallest pre-auth amount, will be adjusted
-            currency="usd",
-            payment_method_types=["card_present"], # Assuming card_present for tap
-            capture_method="manual",
-            metadata={"transaction_id": transaction_id} # Link Stripe PI to our ID
-        )
-        
-        # Get default device
-        device = await get_default_device(db)
-        
-        # Create transaction
-        transaction = Transaction(
-            transaction_id=transaction_id,
-            device_id=device.id,
-            payment_intent_id=payment_intent.id,
-            status=TransactionStatus.PENDING_ITEMS
-        )
-        db.add(transaction)
-        await db.commit()
-        logging.info(f"Transaction {transaction_id} created in DB with PaymentIntent {payment_intent.id}")
-
-        # Prepare and send MQTT message to unlock door
-        message_to_sign = f"{transaction_id}:{payment_intent.id}"
-        hmac_val = hmac.new(hmac_secret.encode(), message_to_sign.encode(), hashlib.sha256).hexdigest()
-        mqtt.publish(unlock_topic, f"{message_to_sign}|{hmac_val}")
-        return {"status": "success", "transaction_id": transaction_id}
-    except stripe.error.StripeError as e:
-        raise HTTPException(status_code=400, detail={"status": "error", "message": str(e)})
+        response = None
+        if body and body.get("id"):
+            response = await existing_unlock(db, transaction_id)
+        if response is None:
+            device = await device_registry.resolve(body.get("device_id") if body else None)
+            if device is None:
+                raise HTTPException(status_code=404, detail={"status": "error", "message": "Unknown device"})
+            if not device.is_active:
+                raise HTTPException(status_code=403, detail={"status": "error", "message": f"Device {device.device_id} is inactive"})
+            response = await start_unlock(db, transaction_id, device)
+        future.set_result(response)
+        return response
+    except Exception as e:
+        future.set_exception(e)
+        raise
+    finally:
+        _pending_unlocks.pop(transaction_id, None)
+        if not future.done():
+            future.cancel()
+        elif not future.cancelled():
+            future.exception()  # mark retrieved when nobody else was waiting
+
+async def start_unlock(db: AsyncSession, transaction_id: str, device):
+    transaction = Transaction(
+        transaction_id=transaction_id,
+        device_id=device.pk,
+        status=TransactionStatus.PENDING_ITEMS
+    )
+    pooled_intent = intent_pool.take(device.device_id, active=device.is_active)
+    payment_intent = pooled_intent
+    try:
+        if pooled_intent is not None:
+            transaction.payment_intent_id = pooled_intent.id
+            db.add(transaction)
+            await db.commit()
+        else:
+            # Pool empty: create the intent while the row is inserted, then link them
+            db.add(transaction)
+            created, committed = await asyncio.gather(
+                intent_pool.create_for(transaction_id, device.device_id),
+                db.commit(),
+                return_exceptions=True,
+            )
+            if not isinstance(created, BaseException):
+                payment_intent = created
+            if isinstance(committed, BaseException):
+                raise committed
+            if payment_intent is None:
+                # Drop the row so a retry with the same id starts over
+                await db.delete(transaction)
+                await db.commit()
+                raise created
+            transaction.payment_intent_id = payment_intent.id
+            await db.commit()
+    except IntegrityError:
+        # Same id inserted concurrently by another worker process. An inline intent
+        # was created under the same idempotency key, so it is the winner's too: keep it.
+        await db.rollback()
+        if pooled_intent is not None:
+            intent_pool.put_back(device.device_id, pooled_intent)
+        previous = await existing_unlock(db, transaction_id)
+        if previous:
+            return previous
+        raise
+    except BaseException as e:
+        # Any other failure, cancellation included: the door stays shut, so the intent is unused
+        if pooled_intent is not None:
+            intent_pool.put_back(device.device_id, pooled_intent)
+        elif payment_intent is not None:
+            intent_pool.discard(payment_intent)
+        if isinstance(e, stripe.error.StripeError):
+            raise HTTPException(status_code=400, detail={"status": "error", "message": str(e)})
+        raise
+    logging.info(f"Transaction {transaction_id} created in DB with PaymentIntent {payment_intent.id}")
+
+    # Prepare and send MQTT message to unlock door
+    message = wire.encode(wire.Unlock(transaction_id, payment_intent.id))
+    mqtt.publish(machine_topic(unlock_topic, device_registry.machine_for(device.device_id)), signer.sign(message))
+
+    if pooled_intent is not None:
+        intent_pool.attach(pooled_intent, transaction_id, device.device_id)
+    return {"status": "success", "transaction_id": transaction_id}
 
 # Save payment method endpoint
 @app.post("/save-payment")
@@ -372,9 +633,9 @@ async def save_payment(request: Request):
         payment_method_id = data.get("paymentMethodId")
         if not payment_method_id:
             return JSONResponse(status_code=400, content={"status": "error", "message": "Missing paymentMethodId"})
-        customer = stripe.Customer.create()
-        stripe.PaymentMethod.attach(payment_method_id, customer=customer.id)
-        stripe.Customer.modify(customer.id, invoice_settings={"default_payment_method": payment_method_id})
+        customer = await payments.run(stripe.Customer.create)
+        await payments.run(stripe.PaymentMethod.attach, payment_method_id, customer=customer.id)
+        await payments.run(stripe.Customer.modify, customer.id, invoice_settings={"default_payment_method": payment_method_id})
         return {"status": "success", "customer_id": customer.id}
     except stripe.error.StripeError as e:
         logging.error(f"Stripe error: {e}")
@@ -0,0 +1,104 @@
+"""
+backfill_items.py - Convert legacy items_json blobs into TransactionItem rows
+
+Walks captured transactions that still carry items_json in primary-key order,
+chunk by chunk. Each chunk is written and committed on its own: the line items
+are inserted and the blobs cleared in the same commit, so the job can be
+stopped and re-run at any point without duplicating rows.
+
+Usage (from src/server):
+    python backfill_items.py [--chunk-size 500] [--dry-run]
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+from collections import Counter
+from typing import Optional
+
+import yaml
+from sqlalchemy import insert, update
+
+import queries
+from catalog import Catalog, to_cents
+from database import async_session_maker
+from line_items import item_rows, resolve_products
+from models import Transaction, TransactionItem
+
+logging.basicConfig(level=logging.INFO)
+
+CONFIG_FILE_PATH = "../config/config.yaml"
+
+
+def parse_items(items_json: Optional[str]):
+    """
+    Basket and known unit prices from an items_json blob.
+
+    The server stored a list of SKU strings; rows carried over by migrate.py
+    hold dicts with id/price/quantity instead.
+    """
+    counts = Counter()
+    unit_cents = {}
+    for item in json.loads(items_json or "[]"):
+        if isinstance(item, dict):
+            sku = item.get("id") or f"product_{item.get('name', 'unknown')}"
+            counts[sku] += int(item.get("quantity", 1))
+            if "price" in item:
+                unit_cents[sku] = to_cents(item["price"])
+        else:
+            counts[str(item)] += 1
+    return counts, unit_cents
+
+
+async def backfill(chunk_size: int = 500, dry_run: bool = False) -> int:
+    with open(CONFIG_FILE_PATH, "r") as f:
+        prices = Catalog.from_inventory(yaml.safe_load(f).get("inventory")).snapshot()
+
+    converted = 0
+    last_pk = 0
+    while True:
+        async with async_session_maker() as db:
+            chunk = (await db.execute(queries.captured_with_items_json(last_pk, chunk_size))).all()
+            if not chunk:
+                break
+            last_pk = chunk[-1].id
+
+            baskets = {}
+            for row in chunk:
+                try:
+                    baskets[row.id] = parse_items(row.items_json)
+                except (ValueError, TypeError) as e:
+                    logging.warning(f"Skipping transaction pk={row.id}: unreadable items_json ({e})")
+
+            all_skus = {sku for counts, _ in baskets.values() for sku in counts}
+            product_ids = await resolve_products(db, all_skus, prices)
+            rows = []
+            for transaction_pk, (counts, unit_cents) in baskets.items():
+                unit_cents = {sku: unit_cents.get(sku, prices.price_cents(sku)) for sku in counts}
+                rows.extend(item_rows(transaction_pk, counts, unit_cents, product_ids))
+
+            if dry_run:
+                await db.rollback()
+            else:
+                if rows:
+                    await db.execute(insert(TransactionItem), rows)
+                await db.execute(
+                    update(Transaction)
+                    .where(Transaction.id.in_(list(baskets)))
+                    .values(items_json=None)
+                )
+                await db.commit()
+            converted += len(baskets)
+            logging.info(f"{'Would convert' if dry_run else 'Converted'} {len(baskets)} transaction(s) "
+                         f"into {len(rows)} line item(s), up to pk={last_pk}")
+    return converted
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill transaction_items from items_json")
+    parser.add_argument("--chunk-size", type=int, default=500)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+    total = asyncio.run(backfill(args.chunk_size, args.dry_run))
+    logging.info(f"Backfill finished: {total} transaction(s)")
@@ -0,0 +1,234 @@
+"""
+basket.py - Infer what left the cabinet from the measured weight change
+
+Door events carry delta_mass, the baseline weight minus the weight after the
+door shut. BasketSolver turns that number into the item multisets whose
+catalog weights explain it within the per-SKU tolerances. It is used for two
+things: fusing the basket vision reported with the weight (fuse), and
+standing in for vision when vision reported nothing but the shelf clearly got
+lighter (infer). The server is the only place both signals meet: the load
+cell sits on the ESP32 and its delta_mass never reaches the Pi.
+
+The search is a bounded knapsack over whole grams. For every suffix of the
+SKU list and every item count k <= max_items, the solver keeps one Python int
+used as a bitset: bit w is set when exactly k items from that suffix can
+weigh w grams. The tables depend only on the catalog, so they are built once
+per catalog snapshot. Answering a query is then a masked bit test per k,
+followed by a walk that only enters branches whose remainder is known to be
+reachable, so it never dead-ends. Candidates are enumerated fewest items and
+closest weight first, up to max_candidates, so a 60-SKU catalog solves in a
+couple of milliseconds.
+"""
+
+import math
+import time
+from typing import Any, Dict, List, Mapping, NamedTuple, Optional, Tuple
+
+from catalog import CatalogSnapshot
+
+
+class BasketCandidate(NamedTuple):
+    """One multiset of SKUs and how well it explains the measured delta"""
+    items: Tuple[Tuple[str, int], ...]  # (sku, quantity) pairs
+    weight: float  # expected grams from the catalog
+    error: float  # measured minus expected grams
+    score: float  # |error| over the allowed tolerance; <= 1 is a match
+
+    def count(self) -> int:
+        return sum(quantity for _, quantity in self.items)
+
+
+class _Tables:
+    __slots__ = ("snapshot", "version", "skus", "weights", "tolerances", "units", "suffix", "max_tolerance")
+
+    def __init__(self, snapshot: CatalogSnapshot, max_items: int, resolution: float):
+        self.snapshot = snapshot
+        self.version = snapshot.version
+        # Heavy items first: the walk then spends its quantity budget where it matters
+        records = sorted((r for r in snapshot if r.weight > 0), key=lambda r: -r.weight)
+        self.skus = [r.sku for r in records]
+        self.weights = [r.weight for r in records]
+        self.tolerances = [r.tolerance for r in records]
+        self.units = [max(1, int(round(r.weight / resolution))) for r in records]
+        self.max_tolerance = max(self.tolerances, default=0.0)
+
+        # suffix[i][k]: bit w set if exactly k items from skus[i:] sum to w units
+        empty = [1] + [0] * max_items
+        suffix = [empty]
+        for unit in reversed(self.units):
+            row = list(suffix[-1])
+            for k in range(1, max_items + 1):
+                row[k] |= row[k - 1] << unit
+            suffix.append(row)
+        suffix.reverse()
+        self.suffix = suffix
+
+
+class BasketSolver:
+    """Enumerates the baskets that fit a weight delta, with tables cached per catalog snapshot"""
+
+    def __init__(self, max_items: int = 8, resolution: float = 1.0, scale_tolerance: float = 5.0,
+                 top_k: int = 5, max_candidates: int = 64, ambiguity_margin: float = 0.5):
+        self.max_items = max_items
+        self.resolution = resolution
+        self.scale_tolerance = scale_tolerance  # grams of noise the load cell adds on its own
+        self.top_k = top_k
+        self.max_candidates = max_candidates
+        self.ambiguity_margin = ambiguity_margin
+        self._tables: Optional[_Tables] = None
+        self.solves = 0
+        self.table_builds = 0
+        self.solve_seconds = 0.0
+
+    def _tables_for(self, snapshot: CatalogSnapshot) -> _Tables:
+        tables = self._tables
+        if tables is None or tables.snapshot is not snapshot:
+            # Built off to the side and swapped in whole, like catalog snapshots
+            tables = _Tables(snapshot, self.max_items, self.resolution)
+            self._tables = tables
+            self.table_builds += 1
+        return tables
+
+    def _allowed(self, tables: _Tables, chosen: List[Tuple[int, int]]) -> float:
+        variance = sum(quantity * tables.tolerances[i] ** 2 for i, quantity in chosen)
+        return math.sqrt(variance) + self.scale_tolerance
+
+    def _walk(self, tables: _Tables, i: int, k: int, target: int,
+              chosen: List[Tuple[int, int]], out: List[List[Tuple[int, int]]]) -> None:
+        if len(out) >= self.max_candidates:
+            return
+        if k == 0:
+            out.append(list(chosen))
+            return
+        unit = tables.units[i]
+        below = tables.suffix[i + 1]
+        for quantity in range(min(k, target // unit), -1, -1):
+            rest = target - quantity * unit
+            if not (below[k - quantity] >> rest) & 1:
+                continue
+            if quantity:
+                chosen.append((i, quantity))
+            self._walk(tables, i + 1, k - quantity, rest, chosen, out)
+            if quantity:
+                chosen.pop()
+
+    def _candidate(self, tables: _Tables, chosen: List[Tuple[int, int]], delta_mass: float) -> BasketCandidate:
+        weight = sum(tables.weights[i] * quantity for i, quantity in chosen)
+        error = delta_mass - weight
+        return BasketCandidate(
+            items=tuple((tables.skus[i], quantity) for i, quantity in chosen),
+            weight=weight,
+            error=error,
+            score=abs(error) / self._allowed(tables, chosen),
+        )
+
+    def solve(self, delta_mass: float, snapshot: CatalogSnapshot) -> List[BasketCandidate]:
+        """Best-first list of baskets that explain ``delta_mass`` grams (at most top_k)."""
+        return self._matches(delta_mass, snapshot)[:self.top_k]
+
+    def _matches(self, delta_mass: float, snapshot: CatalogSnapshot) -> List[BasketCandidate]:
+        started = time.perf_counter()
+        tables = self._tables_for(snapshot)
+        found: List[BasketCandidate] = []
+        if abs(delta_mass) <= self.scale_tolerance:
+            found.append(BasketCandidate((), 0.0, delta_mass, abs(delta_mass) / self.scale_tolerance))
+
+        if delta_mass > 0 and tables.skus:
+            top = tables.suffix[0]
+            target = delta_mass / self.resolution
+            matches: List[List[Tuple[int, int]]] = []
+            # Fewest items and closest weights first, so the candidate cap cuts the unlikely tail
+            for k in range(1, self.max_items + 1):
+                # Widest band any k-item basket could be accepted in, plus rounding slack
+                slack = (math.sqrt(k) * tables.max_tolerance + self.scale_tolerance
+                         + k * self.resolution / 2) / self.resolution
+                low = max(0, int(math.floor(target - slack)))
+                band = (top[k] >> low) & ((1 << (int(math.ceil(target + slack)) - low + 1)) - 1)
+                sums = []
+                while band:
+                    bit = band & -band
+                    band ^= bit
+                    sums.append(low + bit.bit_length() - 1)
+                for units in sorted(sums, key=lambda u: abs(u - target)):
+                    self._walk(tables, 0, k, units, [], matches)
+                    if len(matches) >= self.max_candidates:
+                        break
+            for chosen in matches:
+                candidate = self._candidate(tables, chosen, delta_mass)
+                if candidate.score <= 1.0:
+                    found.append(candidate)
+
+        found.sort(key=lambda c: (c.score, c.count()))
+        self.solves += 1
+        self.solve_seconds += time.perf_counter() - started
+        return found
+
+    def infer(self, delta_mass: float, snapshot: CatalogSnapshot) -> Optional[BasketCandidate]:
+        """
+        The single best basket, or None when nothing fits or the runner-up is too close to call.
+
+        Any match with fewer items beats one with more: five bags of chips landing
+        within tolerance of one cola is far less likely than the cola. Only
+        baskets of the same size compete on score.
+        """
+        candidates = self._matches(delta_mass, snapshot)
+        if not candidates:
+            return None
+        fewest = min(candidate.count() for candidate in candidates)
+        tied = [candidate for candidate in candidates if candidate.count() == fewest]
+        if len(tied) > 1 and tied[1].score - tied[0].score < self.ambiguity_margin:
+            return None
+        return tied[0]
+
+    def evaluate(self, items: Mapping[str, int], delta_mass: float,
+                 snapshot: CatalogSnapshot) -> Optional[BasketCandidate]:
+        """Score a basket reported by vision against the delta; None if a SKU has no weight."""
+        tables = self._tables_for(snapshot)
+        index = {sku: i for i, sku in enumerate(tables.skus)}
+        chosen = []
+        for sku, quantity in items.items():
+            if quantity <= 0:
+                continue
+            if sku not in index:
+                return None
+            chosen.append((index[sku], quantity))
+        return self._candidate(tables, chosen, delta_mass)
+
+    def fuse(self, items: Mapping[str, int], delta_mass: float,
+             snapshot: CatalogSnapshot) -> Optional[BasketCandidate]:
+        """
+        Camera plus weight: the basket the weight allows that is closest to what vision counted.
+
+        A vision basket that already fits the weight is kept as is. Otherwise the
+        weight matches compete on how many units they differ from the vision
+        counts, then on fewest items and score, as in infer(). Returns None when
+        no basket fits the weight or the two best are too close to call.
+        """
+        vision = self.evaluate(items, delta_mass, snapshot)
+        if vision is not None and vision.score <= 1.0:
+            return vision
+        counts = {sku: quantity for sku, quantity in items.items() if quantity > 0}
+
+        def distance(candidate: BasketCandidate) -> int:
+            found = dict(candidate.items)
+            return sum(abs(found.get(sku, 0) - counts.get(sku, 0)) for sku in set(found) | set(counts))
+
+        ranked = sorted(self._matches(delta_mass, snapshot),
+                        key=lambda c: (distance(c), c.count(), c.score))
+        if not ranked:
+            return None
+        best = ranked[0]
+        if (len(ranked) > 1 and (distance(ranked[1]), ranked[1].count()) == (distance(best), best.count())
+                and ranked[1].score - best.score < self.ambiguity_margin):
+            return None
+        return best
+
+    def stats(self) -> Dict[str, Any]:
+        tables = self._tables
+        return {
+            "catalog_version": tables.version if tables else None,
+            "skus": len(tables.skus) if tables else 0,
+            "table_builds": self.table_builds,
+            "solves": self.solves,
+            "avg_solve_ms": round(self.solve_seconds / self.solves * 1000, 3) if self.solves else 0.0,
+        }
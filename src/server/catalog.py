@@ -0,0 +1,133 @@
+"""
+catalog.py - In-memory price/weight catalog
+
+The catalog is published as immutable snapshots. Writers (the Google Sheets
+sync thread) build a complete new snapshot and swap it in with a single
+reference assignment; readers (the pricing path) grab the current snapshot
+once per event and do plain dict lookups against it, so they never take a
+lock and never observe a half-updated inventory.
+"""
+
+import threading
+from collections import Counter
+from decimal import Decimal, ROUND_HALF_UP
+from types import MappingProxyType
+from typing import Any, Dict, Iterable, Iterator, List, Mapping, NamedTuple, Optional
+
+DEFAULT_TOLERANCE = 5
+
+
+def to_cents(price: Any) -> int:
+    """Convert a price in dollars (float, str or Decimal) to integer cents."""
+    return int((Decimal(str(price)) * 100).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+class SkuRecord(NamedTuple):
+    """Per-SKU catalog entry. Weight and tolerance are in grams."""
+    sku: str
+    price_cents: int
+    weight: float
+    tolerance: float
+
+
+class CatalogSnapshot:
+    """Immutable view of the catalog at one point in time"""
+
+    __slots__ = ("version", "_records")
+
+    def __init__(self, records: Mapping[str, SkuRecord], version: int = 0):
+        self.version = version
+        self._records = MappingProxyType(dict(records))
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def __contains__(self, sku: str) -> bool:
+        return sku in self._records
+
+    def __iter__(self) -> Iterator[SkuRecord]:
+        return iter(self._records.values())
+
+    def get(self, sku: str) -> Optional[SkuRecord]:
+        return self._records.get(sku)
+
+    def price_cents(self, sku: str) -> int:
+        record = self._records.get(sku)
+        return record.price_cents if record else 0
+
+    def total_cents(self, items: Iterable[str]) -> int:
+        """Price a whole basket; quantities are folded first so each SKU is looked up once."""
+        records = self._records
+        return sum(
+            records[sku].price_cents * qty
+            for sku, qty in Counter(items).items()
+            if sku in records
+        )
+
+    def unknown(self, items: Iterable[str]) -> List[str]:
+        """SKUs in the basket that the catalog has no record for."""
+        return sorted({sku for sku in items if sku not in self._records})
+
+    def to_inventory(self) -> Dict[str, Dict[str, Any]]:
+        """Render in the config.yaml ``inventory`` format."""
+        return {
+            record.sku: {
+                "price": record.price_cents / 100,
+                "weight": record.weight,
+                "tolerance": record.tolerance,
+            }
+            for record in self._records.values()
+        }
+
+
+class Catalog:
+    """Holds the current CatalogSnapshot and publishes replacements atomically"""
+
+    def __init__(self, snapshot: Optional[CatalogSnapshot] = None):
+        self._snapshot = snapshot or CatalogSnapshot({})
+        self._write_lock = threading.Lock()
+
+    @classmethod
+    def from_inventory(cls, inventory: Optional[Mapping[str, Mapping[str, Any]]]) -> "Catalog":
+        catalog = cls()
+        catalog.publish(records_from_inventory(inventory or {}))
+        return catalog
+
+    def snapshot(self) -> CatalogSnapshot:
+        """Current snapshot. Lock-free: a single attribute read."""
+        return self._snapshot
+
+    def publish(self, records: Iterable[SkuRecord]) -> CatalogSnapshot:
+        """Replace the whole catalog with ``records``."""
+        with self._write_lock:
+            snapshot = CatalogSnapshot(
+                {record.sku: record for record in records},
+                version=self._snapshot.version + 1,
+            )
+            self._snapshot = snapshot
+        return snapshot
+
+    def apply(self, upserts: Iterable[SkuRecord] = (), removed: Iterable[str] = ()) -> CatalogSnapshot:
+        """Publish a new snapshot with ``upserts`` added/replaced and ``removed`` SKUs dropped."""
+        with self._write_lock:
+            records = dict(self._snapshot._records)
+            for sku in removed:
+                records.pop(sku, None)
+            for record in upserts:
+                records[record.sku] = record
+            snapshot = CatalogSnapshot(records, version=self._snapshot.version + 1)
+            self._snapshot = snapshot
+        return snapshot
+
+
+def records_from_inventory(inventory: Mapping[str, Mapping[str, Any]]) -> List[SkuRecord]:
+    """Build SkuRecords from a config.yaml ``inventory`` mapping."""
+    return [
+        SkuRecord(
+            sku=sku,
+            price_cents=to_cents(entry.get("price", 0)),
+            weight=float(entry.get("weight", 0)),
+            tolerance=float(entry.get("tolerance", DEFAULT_TOLERANCE)),
+        )
+        for sku, entry in inventory.items()
+    ]
@@ -1,18 +1,128 @@
 import os
+import re
+import time
+from collections import deque
+from pathlib import Path
+
+import yaml
+from sqlalchemy import event, exc
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from models import Base
 
-DATABASE_URL = os.getenv("DATABASE_URL", "sqlite+aiosqlite:///./visionvend.db")
+CONFIG_PATH = os.getenv("CONFIG_PATH", str(Path(__file__).resolve().parents[2] / "config" / "production.yaml"))
+DEFAULT_DATABASE_URL = "sqlite+aiosqlite:///./visionvend.db"
 
-engine = create_async_engine(
-    DATABASE_URL,
-    echo=True if os.getenv("DEBUG") == "true" else False,
-)
+# ${VAR} / ${VAR:-default}; the default may not contain another placeholder,
+# so nested references resolve innermost-first over repeated passes.
+_ENV_PATTERN = re.compile(r"\$\{(\w+)(?::-([^${}]*))?\}")
+
+def _expand_env(value):
+    """Expand ${VAR:-default} in a parsed config value. Runs after YAML parsing, so a
+    secret containing ':', '#' or quotes ends up verbatim in the string."""
+    if isinstance(value, dict):
+        return {key: _expand_env(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_expand_env(item) for item in value]
+    if not isinstance(value, str):
+        return value
+    while True:
+        expanded = _ENV_PATTERN.sub(lambda m: os.getenv(m.group(1)) or (m.group(2) or ""), value)
+        if expanded == value:
+            return expanded
+        value = expanded
+
+def load_database_settings(path=CONFIG_PATH):
+    """`database` section of the deployment config, with ${VAR:-default} references expanded."""
+    try:
+        with open(path, "r") as f:
+            settings = _expand_env((yaml.safe_load(f) or {}).get("database") or {})
+    except FileNotFoundError:
+        settings = {}
+    settings["url"] = os.getenv("DATABASE_URL") or settings.get("url") or DEFAULT_DATABASE_URL
+    settings["read_url"] = os.getenv("DATABASE_READ_URL") or settings.get("read_url") or None
+    return settings
+
+def _async_url(url):
+    """Map plain driver URLs (e.g. postgresql://) onto their asyncio drivers."""
+    url = make_url(url)
+    if url.drivername in ("postgresql", "postgres", "postgresql+psycopg2"):
+        url = url.set(drivername="postgresql+asyncpg")
+    elif url.drivername == "sqlite":
+        url = url.set(drivername="sqlite+aiosqlite")
+    return url
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """Queue pool that records how long each checkout waited for a connection"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkout_waits = deque(maxlen=1000)
+        self.checkout_timeouts = 0
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            self.checkout_timeouts += 1
+            raise
+        finally:
+            self.checkout_waits.append(time.perf_counter() - started)
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    # WAL lets readers proceed while a writer commits; busy_timeout makes
+    # concurrent writers wait for the lock instead of failing immediately.
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA busy_timeout=5000")
+    cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+
+def build_engine(url, settings):
+    url = _async_url(url)
+    kwargs = {
+        "echo": True if os.getenv("DEBUG") == "true" else bool(settings.get("echo", False)),
+    }
+    is_sqlite = url.get_backend_name() == "sqlite"
+    in_memory = is_sqlite and url.database in (None, "", ":memory:")
+    if not in_memory:
+        # In-memory SQLite keeps its single StaticPool connection; everything else gets a sized pool
+        kwargs.update(
+            poolclass=TimedQueuePool,
+            pool_size=int(settings.get("pool_size", 10)),
+            max_overflow=int(settings.get("max_overflow", 20)),
+            pool_timeout=float(settings.get("pool_timeout", 30)),
+            pool_recycle=int(settings.get("pool_recycle", 1800)),
+            pool_pre_ping=not is_sqlite,
+        )
+    if url.drivername == "postgresql+asyncpg" and settings.get("ssl_require"):
+        kwargs["connect_args"] = {"ssl": "require"}
+
+    engine = create_async_engine(url, **kwargs)
+    if is_sqlite:
+        event.listen(engine.sync_engine, "connect", _set_sqlite_pragmas)
+    return engine
+
+settings = load_database_settings()
+DATABASE_URL = settings["url"]
+
+engine = build_engine(DATABASE_URL, settings)
+
+# Reporting queries can go to a read replica; without one they share the primary
+read_engine = build_engine(settings["read_url"], settings) if settings["read_url"] else engine
 
 async_session_maker = async_sessionmaker(
     engine, class_=AsyncSession, expire_on_commit=False
 )
 
+read_session_maker = async_sessionmaker(
+    read_engine, class_=AsyncSession, expire_on_commit=False
+)
+
 async def create_tables():
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
@@ -22,4 +132,37 @@ async def get_db():
         try:
             yield session
         finally:
-            await session.close()
\ No newline at end of file
+            await session.close()
+
+async def get_read_db():
+    async with read_session_maker() as session:
+        try:
+            yield session
+        finally:
+            await session.close()
+
+def _pool_stats(engine):
+    pool = engine.sync_engine.pool
+    if not isinstance(pool, TimedQueuePool):
+        return {"pool": type(pool).__name__}
+    capacity = pool.size() + max(pool._max_overflow, 0)
+    waits = sorted(pool.checkout_waits)
+    def pct(p):
+        return round(waits[min(len(waits) - 1, int(p / 100 * len(waits)))] * 1000, 3) if waits else 0.0
+    return {
+        "pool": type(pool).__name__,
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "overflow": pool.overflow(),
+        "capacity": capacity,
+        "saturation": round(pool.checkedout() / capacity, 3) if capacity else 0.0,
+        "checkout_timeouts": pool.checkout_timeouts,
+        "checkout_wait_ms": {"p50": pct(50), "p99": pct(99), "max": pct(100)},
+    }
+
+def pool_stats():
+    """Connection pool saturation and checkout wait times for the primary and replica engines."""
+    stats = {"primary": _pool_stats(engine)}
+    if read_engine is not engine:
+        stats["replica"] = _pool_stats(read_engine)
+    return stats
@@ -0,0 +1,194 @@
+"""
+device_registry.py - In-process device lookup
+
+/unlock used to SELECT (and sometimes INSERT + COMMIT) the device row on every
+request. DeviceRegistry loads the devices table once at start-up and resolves
+device_id -> devices.id from memory afterwards. A cache miss re-reads the
+row under a lock. Only the configured default device is ever created, at
+start-up. Device ids arrive on the unauthenticated /unlock endpoint, so an
+unknown id resolves to None and is never inserted or cached. Any flush that
+inserts, updates or deletes a Device through the ORM invalidates the cached
+entry, so the next lookup re-reads it.
+
+That listener only sees this process. Changes made by another uvicorn worker,
+or by migrate/admin scripts, reach the cache through `ttl`: an entry older
+than that is re-read on its next lookup, so a deactivated machine stops
+unlocking within `ttl` seconds everywhere.
+
+Each machine talks on its own MQTT topics, ``case/<MACHINE_ID>/cmd|door|status``.
+The device_id is used as the machine id, except for the default device. That
+one keeps the machine id already baked into the configured topics.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Callable, Dict, NamedTuple, Optional
+
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError
+
+import queries
+from models import Device
+
+DEFAULT_DEVICE_ID = "default"
+TOPIC_PREFIX = "case"
+
+
+class DeviceEntry(NamedTuple):
+    pk: int
+    device_id: str
+    is_active: bool
+
+
+def topic_machine(topic: str) -> Optional[str]:
+    """Machine id from a ``case/<MACHINE_ID>/...`` topic, or None if it doesn't match."""
+    parts = topic.split("/")
+    if len(parts) >= 3 and parts[0] == TOPIC_PREFIX and parts[1]:
+        return parts[1]
+    return None
+
+
+def machine_topic(template: str, machine_id: str) -> str:
+    """Rewrite the machine segment of a ``case/<MACHINE_ID>/...`` topic."""
+    parts = template.split("/")
+    parts[1] = machine_id
+    return "/".join(parts)
+
+
+def wildcard_topic(template: str) -> str:
+    """Subscription matching the same leaf topic on every machine, e.g. ``case/+/door``."""
+    return machine_topic(template, "+")
+
+
+class DeviceRegistry:
+    """Cache of devices keyed by device_id, with MQTT machine-id routing"""
+
+    def __init__(self, session_maker, default_machine_id: Optional[str] = None,
+                 default_device_id: str = DEFAULT_DEVICE_ID, ttl: float = 30.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.session_maker = session_maker
+        self.default_device_id = default_device_id
+        self.default_machine_id = default_machine_id or default_device_id
+        self.ttl = ttl
+        self._clock = clock
+
+        self._devices: Dict[str, DeviceEntry] = {}
+        self._expires: Dict[str, float] = {}
+        self._lock = asyncio.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.invalidations = 0
+
+        for change in ("after_insert", "after_update", "after_delete"):
+            event.listen(Device, change, self._on_device_change)
+
+    def _on_device_change(self, mapper, connection, target):
+        # Runs inside the flush, possibly before a rollback: drop rather than
+        # overwrite, and let the next lookup read the committed state.
+        self.invalidate(target.device_id)
+        for device_id, entry in list(self._devices.items()):
+            if entry.pk == target.id:
+                self.invalidate(device_id)
+
+    def invalidate(self, device_id: Optional[str] = None):
+        """Forget one device, or every device when device_id is None."""
+        if device_id is None:
+            self._devices.clear()
+            self._expires.clear()
+            self.invalidations += 1
+        elif self._devices.pop(device_id, None) is not None:
+            self._expires.pop(device_id, None)
+            self.invalidations += 1
+
+    def _cache(self, entry: DeviceEntry) -> None:
+        self._devices[entry.device_id] = entry
+        self._expires[entry.device_id] = self._clock() + self.ttl
+
+    def _cached(self, device_id: str) -> Optional[DeviceEntry]:
+        """Cached entry if it is still fresh; an expired one is dropped."""
+        entry = self._devices.get(device_id)
+        if entry is not None and self._clock() >= self._expires.get(device_id, 0.0):
+            del self._devices[device_id]
+            self._expires.pop(device_id, None)
+            self.expired += 1
+            return None
+        return entry
+
+    async def load(self) -> int:
+        """(Re)load every device row into the cache."""
+        async with self.session_maker() as db:
+            result = await db.execute(queries.all_devices())
+            self._devices, self._expires = {}, {}
+            for row in result:
+                self._cache(DeviceEntry(row.id, row.device_id, row.is_active is not False))
+        logging.info(f"Device registry loaded {len(self._devices)} device(s)")
+        return len(self._devices)
+
+    def get(self, device_id: str) -> Optional[DeviceEntry]:
+        return self._cached(device_id)
+
+    async def resolve(self, device_id: Optional[str] = None) -> Optional[DeviceEntry]:
+        """Cached entry for device_id, reading the row on a miss; None if there is no such device."""
+        device_id = device_id or self.default_device_id
+        entry = self._cached(device_id)
+        if entry is not None:
+            self.hits += 1
+            return entry
+
+        async with self._lock:
+            entry = self._cached(device_id)
+            if entry is not None:
+                self.hits += 1
+                return entry
+            self.misses += 1
+            entry = await self._fetch(device_id)
+            if entry is not None:
+                self._cache(entry)
+            return entry
+
+    async def _fetch(self, device_id: str) -> Optional[DeviceEntry]:
+        async with self.session_maker() as db:
+            device = (await db.execute(queries.device_by_external_id(device_id))).scalar_one_or_none()
+            if device is None:
+                return None
+            return DeviceEntry(device.id, device.device_id, device.is_active is not False)
+
+    async def ensure_default(self) -> DeviceEntry:
+        """Create the configured default device if the table doesn't have it yet."""
+        device_id = self.default_device_id
+        async with self._lock:
+            entry = self._cached(device_id) or await self._fetch(device_id)
+            if entry is None:
+                entry = await self._create(device_id)
+            self._cache(entry)
+            return entry
+
+    async def _create(self, device_id: str) -> DeviceEntry:
+        async with self.session_maker() as db:
+            device = Device(device_id=device_id, name="Main Vending Machine", location="Default Location")
+            db.add(device)
+            try:
+                await db.commit()
+                logging.info(f"Registered default device {device_id}")
+            except IntegrityError:
+                # Another process inserted it first
+                await db.rollback()
+                device = (await db.execute(queries.device_by_external_id(device_id))).scalar_one()
+            return DeviceEntry(device.id, device.device_id, device.is_active is not False)
+
+    def active_device_ids(self):
+        return [entry.device_id for entry in self._devices.values() if entry.is_active]
+
+    def machine_for(self, device_id: str) -> str:
+        return self.default_machine_id if device_id == self.default_device_id else device_id
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "devices": len(self._devices),
+            "hits": self.hits,
+            "misses": self.misses,
+            "expired": self.expired,
+            "invalidations": self.invalidations,
+        }
@@ -0,0 +1,196 @@
+"""
+ingest.py - MQTT ingestion stage for door events
+
+paho-mqtt delivers messages on its own network thread. MqttIngest hands them
+into the FastAPI event loop through a bounded asyncio.Queue and drains that
+queue with a fixed pool of consumer tasks. When the queue is full the paho
+thread blocks (up to put_timeout), which stops it reading from the socket and
+pushes backpressure onto the broker instead of silently dropping events.
+
+The wait is still bounded on the paho side (put_timeout plus a margin), so a
+blocked event loop can never wedge the network thread. Call close() before
+stopping the paho loop: it refuses new messages, so shutdown never waits on a
+submit that needs the very loop it is blocking.
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+# handler(payload, client, topic)
+Handler = Callable[[Any, Any, str], Awaitable[None]]
+
+
+def _percentile(samples, pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class _Handoff:
+    """Outcome of one cross-thread put, settled exactly once by whichever side gets there first"""
+
+    __slots__ = ("_lock", "queued")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.queued = None  # None until settled, then True (queued) or False (dropped)
+
+    def settle(self, queued: bool) -> bool:
+        with self._lock:
+            if self.queued is None:
+                self.queued = queued
+            return self.queued
+
+
+class MqttIngest:
+    """Bounded, thread-safe handoff from the paho network thread to asyncio consumers"""
+
+    def __init__(self, handler: Handler, queue_size: int = 1000, workers: int = 4,
+                 put_timeout: float = 5.0, latency_window: int = 1000, loop_margin: float = 1.0):
+        self.handler = handler
+        self.queue_size = queue_size
+        self.workers = workers
+        self.put_timeout = put_timeout
+        self.loop_margin = loop_margin  # extra wait for the loop itself to pick the put up
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks = []
+        self._accepting = False
+
+        self.received = 0
+        self.processed = 0
+        self.failed = 0
+        self.dropped = 0
+        self._queue_waits = deque(maxlen=latency_window)
+        self._latencies = deque(maxlen=latency_window)
+
+    async def start(self):
+        """Bind to the running event loop and spawn the consumer pool."""
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._tasks = [
+            asyncio.create_task(self._consume(i), name=f"mqtt-ingest-{i}")
+            for i in range(self.workers)
+        ]
+        self._accepting = True
+        logging.info(f"MQTT ingest started ({self.workers} workers, queue size {self.queue_size})")
+
+    def close(self):
+        """Refuse new messages from now on. Safe from any thread; queued ones still drain in stop()."""
+        self._accepting = False
+
+    async def stop(self, drain_timeout: float = 10.0):
+        """Give queued events a chance to finish, then cancel the consumers."""
+        self.close()
+        if self._queue is not None:
+            try:
+                await asyncio.wait_for(self._queue.join(), timeout=drain_timeout)
+            except asyncio.TimeoutError:
+                logging.warning(f"MQTT ingest stopped with {self._queue.qsize()} event(s) still queued")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._loop = None
+
+    def submit(self, payload: Any, client: Any, topic: str = "") -> bool:
+        """Enqueue a message from any thread. Returns False if it had to be dropped."""
+        if not self._accepting or self._loop is None or self._queue is None:
+            self.dropped += 1
+            logging.error(f"MQTT ingest not running; dropping message: {payload}")
+            return False
+
+        self.received += 1
+
+        if threading.get_ident() == self._loop_thread_id:
+            # Called from the event loop itself; blocking here would deadlock.
+            item = (time.monotonic(), payload, client, topic, None)
+            try:
+                self._queue.put_nowait(item)
+                return True
+            except asyncio.QueueFull:
+                self.dropped += 1
+                logging.error(f"MQTT ingest queue full; dropping message: {payload}")
+                return False
+
+        # Queued vs dropped is settled once, under the handoff's lock, by the put or by
+        # this thread giving up; an abandoned put that lands anyway is skipped by the
+        # consumers, so a message is never both handled and counted as dropped.
+        handoff = _Handoff()
+        item = (time.monotonic(), payload, client, topic, handoff)
+        future = asyncio.run_coroutine_threadsafe(self._put(item, handoff), self._loop)
+        try:
+            future.result(timeout=self.put_timeout + self.loop_margin)
+        except FutureTimeoutError:
+            # The loop itself is stuck (e.g. in shutdown); never block paho on it
+            future.cancel()
+            if not handoff.settle(False):
+                self.dropped += 1
+                logging.error(f"MQTT ingest event loop unresponsive; dropping message: {payload}")
+                return False
+        if handoff.queued:
+            return True
+        self.dropped += 1
+        logging.error(f"MQTT ingest queue full for {self.put_timeout}s; dropping message: {payload}")
+        return False
+
+    async def _put(self, item, handoff: _Handoff) -> None:
+        if handoff.queued is not None:
+            return  # the submitter already gave up
+        try:
+            await asyncio.wait_for(self._queue.put(item), timeout=self.put_timeout)
+        except asyncio.TimeoutError:
+            handoff.settle(False)
+        else:
+            handoff.settle(True)
+
+    async def _consume(self, worker_id: int):
+        while True:
+            enqueued_at, payload, client, topic, handoff = await self._queue.get()
+            if handoff is not None and not handoff.settle(True):
+                self._queue.task_done()  # landed after its submitter counted it as dropped
+                continue
+            started_at = time.monotonic()
+            try:
+                await self.handler(payload, client, topic)
+            except Exception as e:
+                self.failed += 1
+                logging.error(f"MQTT ingest worker {worker_id} failed on message {payload}: {e}")
+            finally:
+                finished_at = time.monotonic()
+                self._queue_waits.append(started_at - enqueued_at)
+                self._latencies.append(finished_at - enqueued_at)
+                self.processed += 1
+                self._queue.task_done()
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth, counters and latency percentiles (milliseconds)."""
+        return {
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "queue_size": self.queue_size,
+            "workers": self.workers,
+            "received": self.received,
+            "processed": self.processed,
+            "failed": self.failed,
+            "dropped": self.dropped,
+            "queue_wait_ms": {
+                "p50": round(_percentile(self._queue_waits, 50) * 1000, 2),
+                "p99": round(_percentile(self._queue_waits, 99) * 1000, 2),
+            },
+            "latency_ms": {
+                "p50": round(_percentile(self._latencies, 50) * 1000, 2),
+                "p95": round(_percentile(self._latencies, 95) * 1000, 2),
+                "p99": round(_percentile(self._latencies, 99) * 1000, 2),
+                "max": round(max(self._latencies, default=0.0) * 1000, 2),
+            },
+        }
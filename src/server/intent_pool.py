@@ -0,0 +1,171 @@
+"""
+intent_pool.py - Pre-created PaymentIntents for the unlock fast path
+
+Creating a PaymentIntent is a full Stripe round trip, and /unlock used to make
+it while the customer stood at the fridge. IntentPool keeps a few
+manual-capture intents ready for each device. /unlock takes one from memory,
+and the pool refills in the background. The transaction id is attached to the
+intent's metadata after the door is already open.
+
+The devices passed to warm() get a pool at startup. A device added later
+gets one on its first take(), if the caller has checked that it is active;
+that request still misses and creates its intent inline. Any other device_id
+gets no pool and always misses, so an unknown device never makes the pool
+create intents.
+
+Pooled intents older than max_age are cancelled instead of handed out. On
+shutdown, intents that were never used are cancelled.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Set, Tuple
+
+from payments import PaymentExecutor
+
+
+class IntentPool:
+    """Per-device pool of ready-to-use manual-capture PaymentIntents"""
+
+    def __init__(self, payments: PaymentExecutor, amount_cents: int, size: int = 2,
+                 max_age: float = 3600, currency: str = "usd",
+                 payment_method_types=("card_present",)):
+        self.payments = payments
+        self.amount_cents = amount_cents
+        self.size = size
+        self.max_age = max_age
+        self.currency = currency
+        self.payment_method_types = list(payment_method_types)
+
+        self._pools: Dict[str, Deque[Tuple[float, Any]]] = {}
+        self._devices: Set[str] = set()
+        self._refilling: Set[str] = set()
+        self._tasks: Set[asyncio.Task] = set()
+
+        self.hits = 0
+        self.misses = 0
+        self.created = 0
+        self.expired = 0
+
+    def _params(self, metadata: Dict[str, str]) -> Dict[str, Any]:
+        return {
+            "amount": self.amount_cents,
+            "currency": self.currency,
+            "payment_method_types": self.payment_method_types,
+            "capture_method": "manual",
+            "metadata": metadata,
+        }
+
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    def take(self, device_id: str, active: bool = False) -> Optional[Any]:
+        """A fresh pooled intent for device_id, or None if the pool is empty. No I/O.
+
+        active=True means the caller has checked the device is known and active; a
+        device without a pool yet gets one, filled for the next request.
+        """
+        if device_id not in self._devices:
+            self.misses += 1
+            if active and self.size > 0:
+                self.warm([device_id])
+            return None
+        pool = self._pools.get(device_id)
+        now = time.monotonic()
+        while pool:
+            created_at, intent = pool.popleft()
+            if now - created_at <= self.max_age:
+                self.hits += 1
+                self.refill(device_id)
+                return intent
+            self.expired += 1
+            self.discard(intent)
+        self.misses += 1
+        self.refill(device_id)
+        return None
+
+    def put_back(self, device_id: str, intent: Any):
+        """Return an intent that was taken but not used."""
+        self._pools.setdefault(device_id, deque()).appendleft((time.monotonic(), intent))
+
+    def discard(self, intent: Any):
+        """Cancel an intent that will not be used, in the background."""
+        self._spawn(self._discard(intent))
+
+    async def create_for(self, transaction_id: str, device_id: str) -> Any:
+        """Slow path: create an intent inline, keyed on the transaction for idempotency."""
+        return await self.payments.create_intent(
+            transaction_id,
+            **self._params({"transaction_id": transaction_id, "device_id": device_id}),
+        )
+
+    def attach(self, intent: Any, transaction_id: str, device_id: str):
+        """Record the transaction on a pooled intent's metadata, off the request path."""
+        async def _attach():
+            try:
+                await self.payments.update_metadata(
+                    intent.id, transaction_id, {"transaction_id": transaction_id, "device_id": device_id}
+                )
+            except Exception as e:
+                logging.warning(f"Could not attach transaction {transaction_id} to PaymentIntent {intent.id}: {e}")
+        self._spawn(_attach())
+
+    def refill(self, device_id: str):
+        """Top the device's pool back up to size in the background."""
+        if self.size <= 0 or device_id not in self._devices or device_id in self._refilling:
+            return
+        self._refilling.add(device_id)
+        self._spawn(self._refill(device_id))
+
+    async def _refill(self, device_id: str):
+        pool = self._pools.setdefault(device_id, deque())
+        try:
+            while len(pool) < self.size:
+                key = f"pool:{device_id}:{os.urandom(8).hex()}"
+                intent = await self.payments.create_intent(key, **self._params({"device_id": device_id}))
+                if self.size <= 0:  # closed while the request was in flight
+                    await self._discard(intent)
+                    return
+                pool.append((time.monotonic(), intent))
+                self.created += 1
+        except Exception as e:
+            logging.warning(f"PaymentIntent pool refill for device {device_id} failed: {e}")
+        finally:
+            self._refilling.discard(device_id)
+
+    async def _discard(self, intent: Any):
+        try:
+            await self.payments.cancel(intent.id, f"pool:{intent.id}")
+        except Exception as e:
+            logging.warning(f"Could not cancel pooled PaymentIntent {intent.id}: {e}")
+
+    def warm(self, device_ids):
+        """Keep pools for these devices (and only these) and start filling them."""
+        self._devices.update(device_ids)
+        for device_id in device_ids:
+            self.refill(device_id)
+
+    async def close(self):
+        """Cancel unused pooled intents and wait for background work to finish."""
+        intents = [intent for pool in self._pools.values() for _, intent in pool]
+        self._pools.clear()
+        self._devices.clear()
+        self.size = 0
+        await asyncio.gather(*(self._discard(intent) for intent in intents), *self._tasks,
+                             return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "size": self.size,
+            "ready": {device_id: len(pool) for device_id, pool in self._pools.items()},
+            "hits": self.hits,
+            "misses": self.misses,
+            "created": self.created,
+            "expired": self.expired,
+        }
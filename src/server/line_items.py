@@ -0,0 +1,104 @@
+"""
+line_items.py - Normalized TransactionItem writes
+
+A captured basket is stored as one TransactionItem row per SKU rather than a
+JSON blob on the transaction, so sales reports can aggregate in SQL. Unit
+prices come from the same catalog snapshot the charge was computed from, and
+all rows for a basket go out in a single executemany INSERT.
+"""
+
+import json
+import logging
+from collections import Counter
+from decimal import Decimal
+from typing import Any, Dict, List, Mapping
+
+from sqlalchemy import insert
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import queries
+from catalog import CatalogSnapshot
+from models import Product, Transaction, TransactionItem
+
+
+def _price(cents: int) -> Decimal:
+    return Decimal(cents) / 100
+
+
+def _insert_missing_products(dialect_name: str):
+    """INSERT that skips SKUs another worker created in the meantime."""
+    if dialect_name == "postgresql":
+        return postgresql.insert(Product).on_conflict_do_nothing(index_elements=["sku"])
+    if dialect_name == "sqlite":
+        return sqlite.insert(Product).on_conflict_do_nothing(index_elements=["sku"])
+    return insert(Product)
+
+
+async def resolve_products(db: AsyncSession, skus, prices: CatalogSnapshot) -> Dict[str, int]:
+    """Map SKUs to products.id, creating any product rows that don't exist yet."""
+    skus = sorted(set(skus))
+    if not skus:
+        return {}
+    result = await db.execute(queries.products_by_sku(skus))
+    product_ids = {product.sku: product.id for product in result.scalars()}
+
+    missing = [sku for sku in skus if sku not in product_ids]
+    if missing:
+        await db.execute(_insert_missing_products(db.bind.dialect.name), [
+            {"sku": sku, "name": sku, "price": _price(prices.price_cents(sku))}
+            for sku in missing
+        ])
+        result = await db.execute(queries.products_by_sku(missing))
+        product_ids.update({product.sku: product.id for product in result.scalars()})
+    return product_ids
+
+
+def item_rows(transaction_pk: int, counts: Mapping[str, int], unit_cents: Mapping[str, int],
+              product_ids: Mapping[str, int]) -> List[Dict[str, Any]]:
+    rows = []
+    for sku, quantity in counts.items():
+        unit_price = _price(unit_cents[sku])
+        rows.append({
+            "transaction_id": transaction_pk,
+            "product_id": product_ids[sku],
+            "quantity": quantity,
+            "unit_price": unit_price,
+            "subtotal": unit_price * quantity,
+        })
+    return rows
+
+
+async def write_items(db: AsyncSession, transaction_pk: int, counts: Mapping[str, int],
+                      prices: CatalogSnapshot) -> int:
+    """Insert one TransactionItem per SKU in ``counts``. Does not commit."""
+    if not counts:
+        return 0
+    product_ids = await resolve_products(db, counts, prices)
+    unit_cents = {sku: prices.price_cents(sku) for sku in counts}
+    rows = item_rows(transaction_pk, counts, unit_cents, product_ids)
+    await db.execute(insert(TransactionItem), rows)
+    return len(rows)
+
+
+async def record_line_items(db: AsyncSession, transaction_record: Transaction, basket: Counter,
+                            prices: CatalogSnapshot) -> Transaction:
+    """
+    Write the captured basket as TransactionItem rows.
+
+    The charge has already gone through at this point, so a failed insert must
+    not turn into an ERROR status: the session is rolled back, the basket is
+    kept in items_json instead, and backfill_items.py normalizes it later.
+    """
+    transaction_pk = transaction_record.id
+    try:
+        written = await write_items(db, transaction_pk, basket, prices)
+        transaction_record.items_json = None
+        logging.info(f"Recorded {written} line item(s) for transaction {transaction_record.transaction_id}.")
+        return transaction_record
+    except Exception as e:
+        logging.error(f"Could not write line items for transaction pk={transaction_pk}; keeping items_json: {e}")
+        await db.rollback()
+        transaction_record = await db.get(Transaction, transaction_pk)
+        transaction_record.items_json = json.dumps(list(basket.elements()))
+        return transaction_record
@@ -2,7 +2,7 @@ from datetime import datetime
 from decimal import Decimal
 from enum import Enum
 from typing import Optional, List
-from sqlalchemy import Column, Integer, String, DateTime, Text, Boolean, ForeignKey, Numeric, Table
+from sqlalchemy import Column, Integer, String, DateTime, Text, Boolean, ForeignKey, Numeric, Table, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
@@ -81,6 +81,12 @@ class Transaction(Base):
     device = relationship("Device", back_populates="transactions")
     items = relationship("TransactionItem", back_populates="transaction")
 
+    __table_args__ = (
+        Index("ix_transactions_device_id_created_at", "device_id", "created_at"),
+        Index("ix_transactions_status_created_at", "status", "created_at"),
+        Index("ix_transactions_payment_intent_id", "payment_intent_id"),
+    )
+
 class TransactionItem(Base):
     __tablename__ = "transaction_items"
     
@@ -94,6 +100,10 @@ class TransactionItem(Base):
     transaction = relationship("Transaction", back_populates="items")
     product = relationship("Product", back_populates="transaction_items")
 
+    __table_args__ = (
+        Index("ix_transaction_items_transaction_id", "transaction_id"),
+    )
+
 class User(Base):
     __tablename__ = "users"
     
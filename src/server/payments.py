@@ -0,0 +1,124 @@
+"""
+payments.py - Stripe execution subsystem
+
+stripe-python is a blocking HTTP client. PaymentExecutor runs every Stripe call
+on a bounded thread pool so a slow round trip never stalls the event loop, caps
+the number of in-flight calls per Stripe account, and attaches idempotency keys
+derived from our transaction id so retries can't double-charge.
+"""
+
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+import stripe
+
+
+class PaymentExecutor:
+    """Bounded worker pool for Stripe API calls"""
+
+    def __init__(self, max_workers: int = 8, per_account_limit: int = 4,
+                 account: Optional[str] = None):
+        self.max_workers = max_workers
+        self.per_account_limit = per_account_limit
+        self.account = account or None
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="stripe")
+        self._limits: Dict[Optional[str], asyncio.Semaphore] = {}
+
+        self.in_flight = 0
+        self.calls = 0
+        self.errors = 0
+
+    def _limit(self, account: Optional[str]) -> asyncio.Semaphore:
+        semaphore = self._limits.get(account)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.per_account_limit)
+            self._limits[account] = semaphore
+        return semaphore
+
+    def _request_options(self, account: Optional[str], idempotency_key: Optional[str] = None) -> Dict[str, Any]:
+        options = {}
+        if account:
+            options["stripe_account"] = account
+        if idempotency_key:
+            options["idempotency_key"] = idempotency_key
+        return options
+
+    async def run(self, func: Callable, *args, account: Optional[str] = None, **kwargs):
+        """Run a blocking Stripe call on the pool, respecting the per-account cap."""
+        account = account or self.account
+        async with self._limit(account):
+            self.in_flight += 1
+            self.calls += 1
+            try:
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(self._pool, functools.partial(func, *args, **kwargs))
+            except stripe.error.StripeError:
+                self.errors += 1
+                raise
+            finally:
+                self.in_flight -= 1
+
+    async def create_intent(self, transaction_id: str, account: Optional[str] = None, **params):
+        """Create a PaymentIntent; repeated calls for the same transaction return the same intent."""
+        account = account or self.account
+        options = self._request_options(account, f"{transaction_id}:create")
+        return await self.run(stripe.PaymentIntent.create, account=account, **params, **options)
+
+    async def capture(self, payment_intent_id: str, amount_cents: int, transaction_id: str,
+                      authorized_cents: Optional[int] = None, account: Optional[str] = None):
+        """
+        Settle a manual-capture PaymentIntent for amount_cents.
+
+        When the amount fits inside the authorization a single capture with
+        amount_to_capture is enough; otherwise the modify and capture calls are
+        issued back to back on one worker instead of two separate hops.
+        """
+        account = account or self.account
+
+        def _settle():
+            if authorized_cents is not None and amount_cents <= authorized_cents:
+                return stripe.PaymentIntent.capture(
+                    payment_intent_id,
+                    amount_to_capture=amount_cents,
+                    **self._request_options(account, f"{transaction_id}:capture:{amount_cents}"),
+                )
+            stripe.PaymentIntent.modify(
+                payment_intent_id,
+                amount=amount_cents,
+                **self._request_options(account, f"{transaction_id}:modify:{amount_cents}"),
+            )
+            return stripe.PaymentIntent.capture(
+                payment_intent_id,
+                **self._request_options(account, f"{transaction_id}:capture"),
+            )
+
+        return await self.run(_settle, account=account)
+
+    async def cancel(self, payment_intent_id: str, transaction_id: str, account: Optional[str] = None):
+        """Release the authorization on a PaymentIntent."""
+        account = account or self.account
+        options = self._request_options(account, f"{transaction_id}:cancel")
+        return await self.run(stripe.PaymentIntent.cancel, payment_intent_id, account=account, **options)
+
+    async def update_metadata(self, payment_intent_id: str, transaction_id: str,
+                              metadata: Dict[str, str], account: Optional[str] = None):
+        """Replace metadata on a PaymentIntent, e.g. to link a pre-created intent to its transaction."""
+        account = account or self.account
+        options = self._request_options(account, f"{transaction_id}:metadata")
+        return await self.run(stripe.PaymentIntent.modify, payment_intent_id, metadata=metadata,
+                              account=account, **options)
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_workers": self.max_workers,
+            "per_account_limit": self.per_account_limit,
+            "in_flight": self.in_flight,
+            "calls": self.calls,
+            "errors": self.errors,
+        }
+
@@ -0,0 +1,73 @@
+"""
+queries.py - SELECT statements issued by the server
+
+Every read the server makes against the transaction tables is built here so
+tests/test_query_plans.py can EXPLAIN each one and fail the build when a
+statement stops using an index. Add new queries to this module (and an
+example to the test) rather than inlining select() calls in the handlers.
+"""
+
+from datetime import datetime
+
+from sqlalchemy import Select, select
+
+from models import Device, Product, Transaction, TransactionItem, TransactionStatus
+
+
+def all_devices() -> Select:
+    """Every device's key columns, for DeviceRegistry.load. Reads the whole (small) table on purpose."""
+    return select(Device.id, Device.device_id, Device.is_active)
+
+
+def device_by_external_id(device_id: str) -> Select:
+    return select(Device).where(Device.device_id == device_id)
+
+
+def transaction_by_external_id(transaction_id: str) -> Select:
+    return select(Transaction).where(Transaction.transaction_id == transaction_id)
+
+
+def transaction_by_payment_intent(payment_intent_id: str) -> Select:
+    return select(Transaction).where(Transaction.payment_intent_id == payment_intent_id)
+
+
+def device_transactions_since(device_pk: int, since: datetime, limit: int = 100) -> Select:
+    """A device's transactions, newest first. Served by (device_id, created_at)."""
+    return (
+        select(Transaction)
+        .where(Transaction.device_id == device_pk, Transaction.created_at >= since)
+        .order_by(Transaction.created_at.desc())
+        .limit(limit)
+    )
+
+
+def transactions_by_status_before(status: str, before: datetime, limit: int = 100) -> Select:
+    """Oldest transactions in ``status`` created before ``before``. Served by (status, created_at)."""
+    return (
+        select(Transaction)
+        .where(Transaction.status == status, Transaction.created_at < before)
+        .order_by(Transaction.created_at)
+        .limit(limit)
+    )
+
+
+def captured_with_items_json(after_pk: int, limit: int = 500) -> Select:
+    """Next chunk of captured transactions still carrying an items_json blob, by primary key."""
+    return (
+        select(Transaction.id, Transaction.items_json)
+        .where(
+            Transaction.status == TransactionStatus.CAPTURED,
+            Transaction.items_json.is_not(None),
+            Transaction.id > after_pk,
+        )
+        .order_by(Transaction.id)
+        .limit(limit)
+    )
+
+
+def transaction_items(transaction_pk: int) -> Select:
+    return select(TransactionItem).where(TransactionItem.transaction_id == transaction_pk)
+
+
+def products_by_sku(skus) -> Select:
+    return select(Product).where(Product.sku.in_(list(skus)))
@@ -0,0 +1,238 @@
+"""
+sales_log.py - Durable, batched SalesLog writer
+
+Shared by the server and inventory_managment_app/helper.py. Sales rows are
+appended to a local JSONL write-ahead log before anything else happens, then
+flushed to the SalesLog tab with a single ``append_rows`` call once
+``batch_size`` rows are pending or ``flush_interval`` seconds have passed.
+
+Rows are deduplicated by (tx_id, sku) against both pending rows and a bounded
+window of already-flushed keys. Both are rebuilt from the WAL on start-up, so
+a restart neither loses unflushed sales nor re-sends flushed ones.
+
+WAL writes and their fsync run on a dedicated thread, never on the event
+loop. An SD card fsync can take hundreds of milliseconds. Entries queued
+while a write is in progress are committed together by the next write
+(group commit): one fsync covers every record() call that arrived in the
+meantime. record() returns only after its rows are on disk.
+"""
+
+import asyncio
+import datetime
+import json
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+SaleKey = Tuple[str, str]
+
+
+class SalesLogBatcher:
+    """Write-ahead buffered, deduplicating batch writer for the SalesLog tab"""
+
+    def __init__(self, worksheet, wal_path: str, batch_size: int = 100,
+                 flush_interval: float = 5.0, dedupe_window: int = 5000):
+        self.worksheet = worksheet
+        self.wal_path = wal_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dedupe_window = dedupe_window
+
+        self._pending: "OrderedDict[SaleKey, List[Any]]" = OrderedDict()
+        self._flushed: "OrderedDict[SaleKey, None]" = OrderedDict()
+        self._wal_lines = 0
+        # One thread: flushes must never overlap or rows could be sent twice
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sales-log")
+        # One thread for the WAL too: appends stay in order and never race a compaction
+        self._wal_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sales-log-wal")
+        self._wal_queue: List[Dict[str, Any]] = []
+        self._wal_queue_lock = threading.Lock()
+        self._flush_lock = asyncio.Lock()
+        self._wake: Optional[asyncio.Event] = None
+        self._closed = False
+
+        self.api_calls = 0
+        self.rows_flushed = 0
+        self.duplicates = 0
+        self.last_error: Optional[str] = None
+
+        self._recover()
+
+    # -- write-ahead log ------------------------------------------------------
+
+    def _recover(self):
+        try:
+            with open(self.wal_path, "r") as f:
+                for line in f:
+                    self._wal_lines += 1
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # torn final line from a crash mid-write
+                    if "row" in entry:
+                        row = entry["row"]
+                        self._pending[(row[3], row[1])] = row
+                    elif "flushed" in entry:
+                        key = tuple(entry["flushed"])
+                        self._pending.pop(key, None)
+                        self._remember_flushed(key)
+        except FileNotFoundError:
+            return
+        if self._pending:
+            logging.info(f"Recovered {len(self._pending)} unflushed SalesLog row(s) from {self.wal_path}")
+
+    def _append_wal(self, entries: List[Dict[str, Any]]):
+        with open(self.wal_path, "a") as f:
+            for entry in entries:
+                f.write(json.dumps(entry) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self._wal_lines += len(entries)
+
+    def _commit_queued(self):
+        # WAL thread: whatever is queued by now goes out under a single fsync
+        with self._wal_queue_lock:
+            entries, self._wal_queue = self._wal_queue, []
+        if entries:
+            self._append_wal(entries)
+
+    async def _log(self, entries: List[Dict[str, Any]]):
+        """Durably append ``entries``, off the event loop and group-committed with concurrent callers."""
+        with self._wal_queue_lock:
+            self._wal_queue.extend(entries)
+        # FIFO single thread: this call, or one queued before it, writes our entries before it returns
+        await asyncio.get_running_loop().run_in_executor(self._wal_executor, self._commit_queued)
+
+    def _compact_wal(self, entries: List[Dict[str, Any]]):
+        """Rewrite the WAL with only what recovery still needs."""
+        directory = os.path.dirname(os.path.abspath(self.wal_path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".sales-log-", suffix=".wal")
+        try:
+            with os.fdopen(fd, "w") as f:
+                for entry in entries:
+                    f.write(json.dumps(entry) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.wal_path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        self._wal_lines = len(entries)
+
+    def _remember_flushed(self, key: SaleKey):
+        self._flushed[key] = None
+        self._flushed.move_to_end(key)
+        while len(self._flushed) > self.dedupe_window:
+            self._flushed.popitem(last=False)
+
+    # -- public API -----------------------------------------------------------
+
+    async def record(self, tx_id: str, item_counts: Mapping[str, int]) -> int:
+        """Durably queue one row per SKU of a transaction. Returns the number of new rows."""
+        now_iso = datetime.datetime.utcnow().isoformat(" ", timespec="seconds")
+        rows = []
+        for sku, qty in item_counts.items():
+            key = (tx_id, sku)
+            if key in self._pending or key in self._flushed:
+                self.duplicates += 1
+                logging.warning(f"Duplicate SalesLog row ignored: TX_ID={tx_id}, SKU={sku}")
+                continue
+            rows.append((key, [now_iso, sku, -abs(qty), tx_id]))
+        if not rows:
+            return 0
+
+        # Claimed before the write so a concurrent duplicate is caught; released if the write fails
+        for key, row in rows:
+            self._pending[key] = row
+        try:
+            await self._log([{"row": row} for _, row in rows])
+        except BaseException:
+            for key, _ in rows:
+                self._pending.pop(key, None)
+            raise
+        if self._wake is not None and len(self._pending) >= self.batch_size:
+            self._wake.set()
+        return len(rows)
+
+    async def flush(self) -> int:
+        """Send up to batch_size pending rows in one append_rows call."""
+        async with self._flush_lock:
+            return await self._flush_batch()
+
+    async def _flush_batch(self) -> int:
+        if not self._pending:
+            return 0
+        batch = list(self._pending.items())[:self.batch_size]
+        rows = [row for _, row in batch]
+
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(
+                self._executor,
+                lambda: self.worksheet.append_rows(rows, value_input_option="USER_ENTERED"),
+            )
+        except Exception as e:
+            self.last_error = str(e)
+            logging.error(f"SalesLog flush of {len(rows)} row(s) failed; will retry: {e}")
+            raise
+        finally:
+            self.api_calls += 1
+
+        for key, _ in batch:
+            self._pending.pop(key, None)
+            self._remember_flushed(key)
+        await self._log([{"flushed": list(key)} for key, _ in batch])
+        if self._wal_lines > 2 * (self.dedupe_window + len(self._pending)):
+            entries = [{"row": row} for row in self._pending.values()]
+            entries += [{"flushed": list(key)} for key in self._flushed]
+            await asyncio.get_running_loop().run_in_executor(self._wal_executor, self._compact_wal, entries)
+
+        self.rows_flushed += len(rows)
+        self.last_error = None
+        logging.info(f"Flushed {len(rows)} sale row(s) to Google Sheets")
+        return len(rows)
+
+    async def run(self):
+        """Flush loop: wakes on a full batch or every flush_interval seconds."""
+        self._wake = asyncio.Event()
+        if len(self._pending) >= self.batch_size:
+            self._wake.set()
+        while not self._closed:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                while self._pending:
+                    await self.flush()
+                    if len(self._pending) < self.batch_size:
+                        break
+            except Exception:
+                pass  # already logged; rows stay in the WAL for the next attempt
+
+    async def close(self):
+        """Stop the flush loop and push out whatever is pending."""
+        self._closed = True
+        if self._wake is not None:
+            self._wake.set()
+        try:
+            while self._pending:
+                await self.flush()
+        except Exception:
+            logging.warning(f"{len(self._pending)} SalesLog row(s) left in {self.wal_path} for next start-up")
+        self._executor.shutdown(wait=False)
+        self._wal_executor.shutdown(wait=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pending": len(self._pending),
+            "rows_flushed": self.rows_flushed,
+            "api_calls": self.api_calls,
+            "duplicates": self.duplicates,
+            "last_error": self.last_error,
+        }
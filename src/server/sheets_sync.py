@@ -0,0 +1,158 @@
+"""
+sheets_sync.py - Incremental Google Sheets product sync
+
+Shared by the server and inventory_managment_app/helper.py. Instead of pulling
+and rewriting everything on a fixed 30 s timer, ProductSheetSync:
+
+- asks Drive for the spreadsheet's modifiedTime first and skips the Sheets
+  read entirely when it hasn't moved,
+- hashes the catalog-relevant columns of each row and reports only the SKUs
+  that were added, changed or removed. The first poll, and every forced one,
+  has no baseline to diff against. It returns every row with
+  ``complete=True``, and the caller replaces its catalog wholesale, so SKUs
+  deleted from the sheet before start-up are dropped as well,
+- backs off geometrically while the sheet is quiet and snaps back to the
+  minimum interval as soon as something changes.
+
+ConfigFileWriter skips the disk write when the rendered YAML is byte-for-byte
+what is already on disk.
+"""
+
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence
+
+import yaml
+
+# SKU | Name | Price ($) | Weight (g) | Current Stock | Photo URL
+# Stock changes on every sale, so only the columns the catalog uses are hashed.
+DEFAULT_KEY_COLUMNS = (0, 2, 3)
+
+
+class SheetDiff(NamedTuple):
+    """Rows that changed since the previous poll, keyed by SKU; every row when complete"""
+    upserts: Dict[str, List[str]]
+    removed: List[str]
+    complete: bool = False
+
+    def __bool__(self) -> bool:
+        return bool(self.upserts or self.removed or self.complete)
+
+
+class ProductSheetSync:
+    """Change-detecting poller for the Products tab"""
+
+    def __init__(self, worksheet, spreadsheet=None, key_columns: Sequence[int] = DEFAULT_KEY_COLUMNS,
+                 min_interval: float = 30, max_interval: float = 300, backoff: float = 2.0):
+        self.worksheet = worksheet
+        self.spreadsheet = spreadsheet
+        self.key_columns = tuple(key_columns)
+        self.min_interval = min_interval
+        self.max_interval = max(max_interval, min_interval)
+        self.backoff = backoff
+        self.interval = min_interval
+
+        self._row_hashes: Dict[str, bytes] = {}
+        self._revision: Optional[str] = None
+        self._synced = False
+        self.sheet_reads = 0
+        self.revision_skips = 0
+
+    def _current_revision(self) -> Optional[str]:
+        """Spreadsheet modifiedTime from Drive metadata, or None if unavailable."""
+        if self.spreadsheet is None:
+            return None
+        try:
+            # A Drive metadata request each time; the lastUpdateTime attribute is cached at open
+            return self.spreadsheet.get_lastUpdateTime()
+        except Exception as e:
+            logging.debug(f"Could not read spreadsheet revision metadata: {e}")
+            return None
+
+    def _row_hash(self, row: List[str]) -> bytes:
+        fields = [row[i].strip() if i < len(row) else "" for i in self.key_columns]
+        return hashlib.blake2b("\x1f".join(fields).encode(), digest_size=16).digest()
+
+    def poll(self, force: bool = False) -> SheetDiff:
+        """Fetch the sheet if it may have changed and return the per-SKU diff."""
+        revision = self._current_revision()
+        if not force and revision is not None and revision == self._revision:
+            self.revision_skips += 1
+            return SheetDiff({}, [])
+
+        rows = self.worksheet.get_all_values()[1:]  # skip header
+        self.sheet_reads += 1
+        complete = force or not self._synced
+
+        hashes = {}
+        upserts = {}
+        for row in rows:
+            sku = row[0].strip() if row else ""
+            if not sku:  # ignore blank lines
+                continue
+            row_hash = self._row_hash(row)
+            hashes[sku] = row_hash
+            if complete or self._row_hashes.get(sku) != row_hash:
+                upserts[sku] = row
+        removed = [sku for sku in self._row_hashes if sku not in hashes]
+
+        self._row_hashes = hashes
+        self._revision = revision
+        self._synced = True
+        return SheetDiff(upserts, removed, complete)
+
+    def next_interval(self, changed: bool) -> float:
+        """Reset to the minimum after a change, otherwise back off towards the maximum."""
+        if changed:
+            self.interval = self.min_interval
+        else:
+            self.interval = min(self.interval * self.backoff, self.max_interval)
+        return self.interval
+
+    def run_forever(self, on_diff: Callable[[SheetDiff], None], stop_event: Optional[threading.Event] = None):
+        """Poll until stop_event is set, calling on_diff for every non-empty diff."""
+        stop_event = stop_event or threading.Event()
+        while not stop_event.is_set():
+            changed = False
+            try:
+                diff = self.poll()
+                if diff:
+                    on_diff(diff)
+                    changed = True
+            except Exception as e:
+                logging.error(f"Product sheet sync failed: {e}")
+            stop_event.wait(self.next_interval(changed))
+
+
+class ConfigFileWriter:
+    """Writes YAML atomically, and only when the content actually changed"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._digest: Optional[bytes] = None
+        try:
+            with open(path, "rb") as f:
+                self._digest = hashlib.blake2b(f.read(), digest_size=16).digest()
+        except OSError:
+            pass
+
+    def write(self, data) -> bool:
+        text = yaml.dump(data, sort_keys=False).encode()
+        digest = hashlib.blake2b(text, digest_size=16).digest()
+        if digest == self._digest:
+            return False
+
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".config-", suffix=".yaml")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(text)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        self._digest = digest
+        return True
@@ -0,0 +1,89 @@
+"""
+Export the saved RT-DETR model to ONNX (plus an int8 copy) for the Pi's ONNX Runtime backend
+
+Run after download_rt_detr.py. Writes model.onnx and model.int8.onnx next to
+the saved model in src/models/rtdetr. The batch dimension is dynamic, so the
+inference worker can send both cameras in one call. The int8 copy uses
+dynamic quantization: weights are stored as int8 and activations are
+quantized on the fly, which needs no calibration data.
+
+    python src/utils/export_rt_detr_onnx.py [--model-dir DIR] [--opset 17] [--no-quantize]
+"""
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+import torch
+from transformers import RTDetrV2ForObjectDetection
+
+
+class _Outputs(torch.nn.Module):
+    """Plain (logits, pred_boxes) tuple; the exporter can't trace HF ModelOutput objects"""
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, pixel_values):
+        outputs = self.model(pixel_values=pixel_values)
+        return outputs.logits, outputs.pred_boxes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--model-dir", default=os.path.join("src", "models", "rtdetr"))
+    parser.add_argument("--opset", type=int, default=17)
+    parser.add_argument("--no-quantize", action="store_true", help="skip writing model.int8.onnx")
+    args = parser.parse_args()
+
+    with open(os.path.join(args.model_dir, "preprocessor_config.json")) as f:
+        size = json.load(f).get("size") or {}
+    height, width = size.get("height", 640), size.get("width", 640)
+
+    print(f"Loading model from {args.model_dir}...")
+    model = RTDetrV2ForObjectDetection.from_pretrained(args.model_dir, local_files_only=True).eval()
+    dummy = torch.rand(1, 3, height, width)
+
+    onnx_path = os.path.join(args.model_dir, "model.onnx")
+    print(f"Exporting {height}x{width} graph to {onnx_path}...")
+    torch.onnx.export(
+        _Outputs(model),
+        (dummy,),
+        onnx_path,
+        input_names=["pixel_values"],
+        output_names=["logits", "pred_boxes"],
+        dynamic_axes={"pixel_values": {0: "batch"}, "logits": {0: "batch"}, "pred_boxes": {0: "batch"}},
+        opset_version=args.opset,
+    )
+
+    import onnxruntime
+    paths = [onnx_path]
+    if not args.no_quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        int8_path = os.path.join(args.model_dir, "model.int8.onnx")
+        print(f"Quantizing weights to int8: {int8_path}...")
+        quantize_dynamic(onnx_path, int8_path, weight_type=QuantType.QInt8)
+        paths.append(int8_path)
+
+    # Sanity check against PyTorch and a rough CPU latency figure for each graph
+    with torch.inference_mode():
+        reference = model(pixel_values=dummy).logits.numpy()
+    for path in paths:
+        session = onnxruntime.InferenceSession(path, providers=["CPUExecutionProvider"])
+        logits, _ = session.run(["logits", "pred_boxes"], {"pixel_values": dummy.numpy()})
+        started = time.perf_counter()
+        for _ in range(5):
+            session.run(["logits", "pred_boxes"], {"pixel_values": dummy.numpy()})
+        latency = (time.perf_counter() - started) / 5 * 1000
+        drift = float(np.max(np.abs(logits - reference)))
+        print(f"{os.path.basename(path)}: {os.path.getsize(path) / 1e6:.1f} MB, "
+              f"{latency:.0f} ms/frame, max logit drift vs PyTorch {drift:.3f}")
+
+    print(f"ONNX export complete in {args.model_dir}")
+
+
+if __name__ == "__main__":
+    main()
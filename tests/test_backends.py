@@ -0,0 +1,100 @@
+"""
+test_backends.py - Detector backend contract and RT-DETR post-processing
+
+numpy only: a fake backend reads a throwaway model directory, and
+post_process is fed hand-built logits and boxes.
+"""
+
+import json
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src" / "raspberry_pi"))
+
+from backends import DetectorBackend, create_backend, post_process  # noqa: E402
+
+LOGIT = {True: 5.0, False: -5.0}  # sigmoid ~0.993 / ~0.007
+
+
+def model_dir(tmp_path, do_normalize=False):
+    (tmp_path / "config.json").write_text(json.dumps({"id2label": {"0": "cola", "1": "chips"}}))
+    (tmp_path / "preprocessor_config.json").write_text(json.dumps({
+        "size": {"height": 32, "width": 48},
+        "do_normalize": do_normalize,
+        "image_mean": [0.5, 0.5, 0.5],
+        "image_std": [0.25, 0.25, 0.25],
+    }))
+    return tmp_path
+
+
+class FakeBackend(DetectorBackend):
+    name = "fake"
+
+    def forward(self, pixels):
+        return np.zeros((len(pixels), 2, 2), dtype=np.float32), np.zeros((len(pixels), 2, 4), dtype=np.float32)
+
+
+def test_forward_is_abstract(tmp_path):
+    with pytest.raises(TypeError):
+        DetectorBackend(model_dir(tmp_path))
+
+
+def test_backend_reads_the_saved_preprocessing(tmp_path):
+    backend = FakeBackend(model_dir(tmp_path))
+    assert backend.id2label == {0: "cola", 1: "chips"}
+    assert backend.input_size == (32, 48)
+    assert np.allclose(backend.mean, 0) and np.allclose(backend.std, 255)
+    normalized = FakeBackend(model_dir(tmp_path, do_normalize=True))
+    assert np.allclose(normalized.mean, 127.5) and np.allclose(normalized.std, 63.75)
+
+
+def test_create_backend_needs_a_saved_model(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        create_backend({"model_dir": str(tmp_path)})
+
+
+def logits_for(hits, queries=3, classes=2):
+    """N x Q x C logits with a confident score at each (image, query, class) in ``hits``."""
+    batch = 1 + max(image for image, _, _ in hits)
+    logits = np.full((batch, queries, classes), LOGIT[False], dtype=np.float32)
+    for image, query, label in hits:
+        logits[image, query, label] = LOGIT[True]
+    return logits
+
+
+def test_boxes_decode_to_source_pixels():
+    logits = logits_for([(0, 1, 1), (1, 0, 0)])
+    boxes = np.zeros((2, 3, 4), dtype=np.float32)
+    boxes[0, 1] = (0.5, 0.5, 0.2, 0.4)  # cx, cy, w, h
+    boxes[1, 0] = (0.25, 0.75, 0.5, 0.5)
+    results = list(post_process(logits, boxes, [(100, 200), (480, 640)], threshold=0.5))
+    scores, labels, xyxy = results[0]
+    assert labels.tolist() == [1]
+    assert np.allclose(xyxy, [[80, 30, 120, 70]])
+    scores, labels, xyxy = results[1]
+    assert labels.tolist() == [0]
+    assert np.allclose(xyxy, [[0, 240, 320, 480]])
+
+
+def test_threshold_and_score_order():
+    logits = logits_for([(0, 0, 0)])
+    logits[0, 1, 1] = 1.0  # sigmoid ~0.73
+    logits[0, 2, 0] = 0.0  # sigmoid 0.5, not above the threshold
+    boxes = np.full((1, 3, 4), 0.5, dtype=np.float32)
+    scores, labels, _ = next(post_process(logits, boxes, [(10, 10)], threshold=0.6))
+    assert labels.tolist() == [0, 1]
+    assert scores[0] > scores[1] > 0.6
+    scores, _, _ = next(post_process(logits, boxes, [(10, 10)], threshold=0.8))
+    assert len(scores) == 1
+
+
+def test_query_selection_caps_detections():
+    # RT-DETR is NMS-free: each query predicts one object, and top-Q selection
+    # over query/class pairs is the only pruning, so Q bounds the output
+    logits = np.full((1, 2, 3), LOGIT[True], dtype=np.float32)
+    boxes = np.full((1, 2, 4), 0.5, dtype=np.float32)
+    scores, labels, xyxy = next(post_process(logits, boxes, [(10, 10)], threshold=0.5))
+    assert len(scores) == 2 and xyxy.shape == (2, 4)
@@ -0,0 +1,94 @@
+"""
+test_basket.py - Weight-only basket inference
+
+Uses the shipped catalog (cola 355 g +/-5, chips 70 g +/-4), where one cola
+weighs about as much as five bags of chips.
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src" / "server"))
+
+from basket import BasketSolver  # noqa: E402
+from catalog import Catalog  # noqa: E402
+
+INVENTORY = {
+    "cola": {"weight": 355, "tolerance": 5, "price": 2.00},
+    "chips": {"weight": 70, "tolerance": 4, "price": 1.50},
+}
+
+
+@pytest.fixture
+def snapshot():
+    return Catalog.from_inventory(INVENTORY).snapshot()
+
+
+@pytest.fixture
+def solver():
+    return BasketSolver()
+
+
+@pytest.mark.parametrize("delta_mass, expected", [
+    (355.0, (("cola", 1),)),
+    (710.0, (("cola", 2),)),
+    (70.0, (("chips", 1),)),
+    (425.0, (("cola", 1), ("chips", 1))),
+    (140.0, (("chips", 2),)),
+])
+def test_infer_prefers_fewest_items(solver, snapshot, delta_mass, expected):
+    candidate = solver.infer(delta_mass, snapshot)
+    assert candidate is not None
+    assert candidate.items == expected
+
+
+def test_infer_nothing_taken(solver, snapshot):
+    assert solver.infer(1.5, snapshot).items == ()
+
+
+def test_infer_no_match(solver, snapshot):
+    assert solver.infer(250.0, snapshot) is None
+
+
+def test_infer_ambiguous_same_size(solver):
+    snapshot = Catalog.from_inventory({
+        "cola": {"weight": 355, "tolerance": 5},
+        "tea": {"weight": 356, "tolerance": 5},
+    }).snapshot()
+    assert solver.infer(355.5, snapshot) is None
+
+
+def test_solve_lists_larger_baskets_too(solver, snapshot):
+    baskets = [candidate.items for candidate in solver.solve(355.0, snapshot)]
+    assert (("cola", 1),) in baskets
+    assert (("chips", 5),) in baskets
+
+
+def test_evaluate_vision_basket(solver, snapshot):
+    assert solver.evaluate({"cola": 1}, 356.0, snapshot).score <= 1.0
+    assert solver.evaluate({"cola": 1}, 425.0, snapshot).score > 1.0
+    assert solver.evaluate({"water": 1}, 500.0, snapshot) is None
+
+
+def test_fuse_keeps_a_vision_basket_that_fits(solver, snapshot):
+    assert solver.fuse({"cola": 1}, 357.0, snapshot).items == (("cola", 1),)
+
+
+def test_fuse_corrects_a_miscount_from_the_weight(solver, snapshot):
+    # Vision counted one cola but two left the shelf
+    assert solver.fuse({"cola": 1}, 710.0, snapshot).items == (("cola", 2),)
+    # Vision saw chips where a cola was taken alongside them
+    assert solver.fuse({"chips": 2}, 425.0, snapshot).items == (("cola", 1), ("chips", 1))
+
+
+def test_fuse_prefers_the_basket_nearest_the_vision_counts(solver, snapshot):
+    # 355 g fits one cola or five chips; vision saw four chips, so five chips wins
+    assert solver.fuse({"chips": 4}, 355.0, snapshot).items == (("chips", 5),)
+    # With no vision counts to go on, the weight-only tie-break picks the fewest items
+    assert solver.fuse({}, 355.0, snapshot).items == (("cola", 1),)
+
+
+def test_fuse_without_a_weight_match(solver, snapshot):
+    assert solver.fuse({"cola": 1}, 250.0, snapshot) is None
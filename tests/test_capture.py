@@ -0,0 +1,145 @@
+"""
+test_capture.py - Mask cleaning, hand-region scheduling and CameraFeed masks
+
+Needs OpenCV and MediaPipe, like capture.py itself. MediaPipe is never run:
+roi_hands is replaced with a fixed polygon. capture.py's deployed import
+paths (VisionVend.config, VisionVend.raspberry_pi) are pointed at a minimal
+config and src/raspberry_pi while it loads.
+"""
+
+import asyncio
+import importlib
+import random
+import sys
+import types
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+cv2 = pytest.importorskip("cv2")
+pytest.importorskip("mediapipe")
+
+PI_DIR = Path(__file__).resolve().parents[1] / "src" / "raspberry_pi"
+sys.path.insert(0, str(PI_DIR))
+
+import frame_ring  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def capture():
+    package = types.ModuleType("VisionVend.raspberry_pi")
+    package.__path__ = [str(PI_DIR)]
+    fakes = {
+        "VisionVend.config": types.SimpleNamespace(config={"training": {"autolabel": {}}}),
+        "VisionVend.raspberry_pi": package,
+        "VisionVend.raspberry_pi.frame_ring": frame_ring,
+    }
+    saved = {name: sys.modules.get(name) for name in fakes}
+    sys.modules.update(fakes)
+    try:
+        sys.modules.pop("capture", None)
+        yield importlib.import_module("capture")
+    finally:
+        sys.modules.pop("capture", None)
+        for name, module in saved.items():
+            if module is None:
+                sys.modules.pop(name, None)
+            else:
+                sys.modules[name] = module
+
+
+def test_clean_mask_drops_small_blobs(capture):
+    mask = np.zeros((60, 80), dtype=np.uint8)
+    mask[10:30, 40:60] = 255  # 400 px
+    mask[50:53, 5:8] = 255  # 9 px of noise
+    cleaned, box = capture.clean_mask(mask, min_area=50)
+    assert box == (40, 10, 20, 20)
+    assert cleaned.dtype == np.uint8 and int(cleaned.sum()) == 400 * 255
+    assert not cleaned[50:53, 5:8].any()
+
+
+def test_clean_mask_with_nothing_left(capture):
+    mask = np.zeros((20, 20), dtype=np.uint8)
+    mask[2, 2] = 255
+    cleaned, box = capture.clean_mask(mask, min_area=10)
+    assert box is None and not cleaned.any()
+
+
+def test_mask_shape_scales_the_frame(capture):
+    assert capture.mask_shape((720, 1280, 3), 0.5) == (360, 640)
+    assert capture.mask_shape((3, 3, 3), 0.1) == (1, 1)
+
+
+@pytest.fixture
+def hands(capture, monkeypatch):
+    hand = np.array([[40, 40], [60, 40], [60, 60], [40, 60]], dtype=np.int32)  # full-resolution pixels
+    calls = []
+
+    def roi_hands(frame, region, scale, margin):
+        calls.append(region)
+        return [hand]
+
+    monkeypatch.setattr(capture, "roi_hands", roi_hands)
+    tracker = capture.HandRegionTracker(scale=0.5, every=3, margin=0.25, motion=6.0, max_age=10)
+    tracker.calls = calls
+    return tracker
+
+
+def test_no_motion_no_hands_never_detects(hands):
+    gray = np.zeros((50, 50), dtype=np.uint8)
+    assert not any(hands.due(gray, None) for _ in range(5))
+    assert hands.calls == []
+
+
+def test_still_hand_is_reused_until_max_age(hands):
+    gray = np.zeros((50, 50), dtype=np.uint8)
+    assert hands.due(gray, (15, 15, 10, 10))  # first motion is checked at once
+    hands.detect(np.zeros((100, 100, 3), dtype=np.uint8))
+    due = [hands.due(gray, None) for _ in range(10)]
+    assert due == [False] * 9 + [True]
+    assert hands.reused == 9
+
+
+def test_moving_hand_is_redetected_every_few_frames(hands):
+    gray = np.zeros((50, 50), dtype=np.uint8)
+    hands.due(gray, (15, 15, 10, 10))
+    hands.detect(np.zeros((100, 100, 3), dtype=np.uint8))
+    due = []
+    for i in range(4):
+        gray = np.full((50, 50), 40 * (i % 2), dtype=np.uint8)  # flickers inside the hand box
+        due.append(hands.due(gray, None))
+    assert due == [False, False, True, True]
+
+
+def test_fill_blanks_hands_in_mask_space(hands):
+    hands.due(np.zeros((50, 50), dtype=np.uint8), (15, 15, 10, 10))
+    hands.detect(np.zeros((100, 100, 3), dtype=np.uint8))
+    mask = hands.fill(np.full((50, 50), 255, dtype=np.uint8))
+    assert not mask[20:31, 20:31].any()
+    assert mask[0, 0] == 255 and mask[40, 40] == 255
+
+
+@pytest.fixture
+def feed(capture):
+    feed = capture.CameraFeed(random.randrange(10_000, 1_000_000), (40, 60, 3), slots=4, mask_scale=0.5)
+    yield feed
+    feed.ring.close()
+
+
+def test_feed_returns_the_small_mask_by_default(capture, feed):
+    small = np.zeros(feed.mask_shape, dtype=np.uint8)
+    small[5:10, 10:20] = 255
+    feed.ring.publish(np.zeros(feed.shape, dtype=np.uint8), small)
+    feed.ring.publish(np.zeros(feed.shape, dtype=np.uint8), small)
+
+    async def run():
+        frame, mask, hand_polys, W, H = await feed.get()
+        assert mask.shape == (20, 30) and (W, H) == (60, 40)
+        full = (await feed.get(full_mask=True))[1]
+        assert full.shape == (40, 60)
+        # crop_mask upsamples only the requested box, and agrees with the full mask
+        crop = feed.crop_mask(mask, 16, 6, 30, 20)
+        assert crop.shape == (20, 30)
+        assert np.array_equal(crop, full[6:26, 16:46])
+    asyncio.run(run())
@@ -0,0 +1,72 @@
+"""
+test_catalog.py - Copy-on-write catalog snapshots
+
+Readers hold on to a CatalogSnapshot while the sheet sync publishes new ones,
+so a published snapshot must never change underneath them.
+"""
+
+import sys
+import threading
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src" / "server"))
+
+from catalog import Catalog, SkuRecord, to_cents  # noqa: E402
+
+INVENTORY = {
+    "cola": {"weight": 355, "tolerance": 5, "price": 2.00},
+    "chips": {"weight": 70, "tolerance": 4, "price": 1.50},
+}
+
+
+@pytest.fixture
+def catalog():
+    return Catalog.from_inventory(INVENTORY)
+
+
+def test_prices_in_cents(catalog):
+    snapshot = catalog.snapshot()
+    assert snapshot.price_cents("cola") == 200
+    assert snapshot.total_cents(["cola", "chips", "chips", "water"]) == 500
+    assert snapshot.unknown(["cola", "water"]) == ["water"]
+    assert to_cents("0.295") == 30
+
+
+def test_apply_leaves_the_old_snapshot_untouched(catalog):
+    before = catalog.snapshot()
+    after = catalog.apply(upserts=[SkuRecord("cola", 250, 355.0, 5.0), SkuRecord("water", 100, 500.0, 5.0)],
+                          removed=["chips"])
+    assert catalog.snapshot() is after
+    assert after.version == before.version + 1
+    assert after.price_cents("cola") == 250 and "water" in after and "chips" not in after
+    assert before.price_cents("cola") == 200 and "chips" in before and "water" not in before
+
+
+def test_publish_replaces_everything(catalog):
+    before = catalog.snapshot()
+    after = catalog.publish([SkuRecord("water", 100, 500.0, 5.0)])
+    assert [record.sku for record in after] == ["water"]
+    assert after.version == before.version + 1
+    assert len(before) == 2
+
+
+def test_snapshot_records_are_read_only(catalog):
+    with pytest.raises(TypeError):
+        catalog.snapshot()._records["water"] = SkuRecord("water", 100, 500.0, 5.0)
+
+
+def test_concurrent_applies_each_bump_the_version(catalog):
+    start = catalog.snapshot().version
+    threads = [
+        threading.Thread(target=lambda i=i: catalog.apply(upserts=[SkuRecord(f"sku-{i}", i, 1.0, 1.0)]))
+        for i in range(20)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    snapshot = catalog.snapshot()
+    assert snapshot.version == start + 20
+    assert all(f"sku-{i}" in snapshot for i in range(20))
@@ -0,0 +1,123 @@
+"""
+test_database_settings.py - Database config loading and engine construction
+
+Covers the `database` section of production.yaml (env expansion and
+overrides), the async driver mapping and the pool chosen by build_engine.
+"""
+
+import asyncio
+import sys
+from pathlib import Path
+
+import pytest
+from sqlalchemy import text
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src" / "server"))
+
+from database import TimedQueuePool, _async_url, build_engine, load_database_settings  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def clean_env(monkeypatch):
+    for name in ("DATABASE_URL", "DATABASE_READ_URL", "DB_PASSWORD", "DB_HOST", "DB_POOL_SIZE", "DEBUG"):
+        monkeypatch.delenv(name, raising=False)
+
+
+def _config(tmp_path, body):
+    path = tmp_path / "production.yaml"
+    path.write_text(body)
+    return path
+
+
+def test_secret_is_expanded_verbatim(tmp_path, monkeypatch):
+    secret = "p:a#s's\"w ord"
+    monkeypatch.setenv("DB_PASSWORD", secret)
+    path = _config(tmp_path, 'database:\n  password: "${DB_PASSWORD}"\n  echo: false\n')
+
+    settings = load_database_settings(path)
+
+    assert settings["password"] == secret
+    assert settings["echo"] is False
+
+
+def test_only_the_database_section_is_expanded(tmp_path, monkeypatch):
+    monkeypatch.setenv("DB_PASSWORD", "x\n  injected: true")
+    path = _config(tmp_path, 'server:\n  token: "${DB_PASSWORD}"\ndatabase:\n  pool_size: 5\n')
+
+    settings = load_database_settings(path)
+
+    assert settings["pool_size"] == 5
+    assert "injected" not in settings
+
+
+def test_defaults_and_nested_references(tmp_path, monkeypatch):
+    path = _config(tmp_path, 'database:\n  pool_size: "${DB_POOL_SIZE:-10}"\n  host: "${DB_HOST:-${DB_FALLBACK:-localhost}}"\n')
+
+    assert load_database_settings(path)["pool_size"] == "10"
+    assert load_database_settings(path)["host"] == "localhost"
+
+    monkeypatch.setenv("DB_HOST", "db.internal")
+    assert load_database_settings(path)["host"] == "db.internal"
+
+
+def test_env_overrides_urls(tmp_path, monkeypatch):
+    path = _config(tmp_path, 'database:\n  url: "sqlite:///config.db"\n  read_url: ""\n')
+
+    settings = load_database_settings(path)
+    assert settings["url"] == "sqlite:///config.db"
+    assert settings["read_url"] is None
+
+    monkeypatch.setenv("DATABASE_URL", "postgresql://primary/vend")
+    monkeypatch.setenv("DATABASE_READ_URL", "postgresql://replica/vend")
+    settings = load_database_settings(path)
+    assert settings["url"] == "postgresql://primary/vend"
+    assert settings["read_url"] == "postgresql://replica/vend"
+
+
+def test_missing_file_uses_defaults(tmp_path):
+    settings = load_database_settings(tmp_path / "absent.yaml")
+
+    assert settings["url"] == "sqlite+aiosqlite:///./visionvend.db"
+    assert settings["read_url"] is None
+
+
+@pytest.mark.parametrize("url, driver", [
+    ("postgresql://u@h/db", "postgresql+asyncpg"),
+    ("postgres://u@h/db", "postgresql+asyncpg"),
+    ("postgresql+psycopg2://u@h/db", "postgresql+asyncpg"),
+    ("postgresql+asyncpg://u@h/db", "postgresql+asyncpg"),
+    ("sqlite:///vend.db", "sqlite+aiosqlite"),
+    ("sqlite+aiosqlite:///vend.db", "sqlite+aiosqlite"),
+])
+def test_async_url(url, driver):
+    assert _async_url(url).drivername == driver
+
+
+def test_file_sqlite_gets_a_sized_timed_pool(tmp_path):
+    async def run():
+        engine = build_engine(f"sqlite:///{tmp_path / 'vend.db'}", {"pool_size": "3", "max_overflow": 2})
+        try:
+            pool = engine.sync_engine.pool
+            assert isinstance(pool, TimedQueuePool)
+            assert pool.size() == 3
+            async with engine.connect() as conn:
+                mode = (await conn.execute(text("PRAGMA journal_mode"))).scalar()
+                foreign_keys = (await conn.execute(text("PRAGMA foreign_keys"))).scalar()
+            assert mode == "wal"
+            assert foreign_keys == 1
+            assert len(pool.checkout_waits) == 1
+        finally:
+            await engine.dispose()
+
+    asyncio.run(run())
+
+
+def test_in_memory_sqlite_keeps_its_default_pool():
+    async def run():
+        engine = build_engine("sqlite+aiosqlite:///:memory:", {"pool_size": 3})
+        try:
+            assert not isinstance(engine.sync_engine.pool, TimedQueuePool)
+        finally:
+            await engine.dispose()
+
+    asyncio.run(run())
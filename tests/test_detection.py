@@ -0,0 +1,110 @@
+"""
+test_detection.py - Batched detection for both cameras
+
+DetectionService runs on a fake backend. cv2 is replaced by a nearest-neighbour
+resize, and detection.py's deployed import path (VisionVend.raspberry_pi) is
+pointed at src/raspberry_pi while it loads.
+"""
+
+import importlib
+import json
+import sys
+import types
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+PI_DIR = Path(__file__).resolve().parents[1] / "src" / "raspberry_pi"
+sys.path.insert(0, str(PI_DIR))
+
+import backends  # noqa: E402
+
+
+def _resize(frame, size, dst=None, interpolation=None):
+    width, height = size
+    rows = np.arange(height) * frame.shape[0] // height
+    cols = np.arange(width) * frame.shape[1] // width
+    resized = frame[rows][:, cols]
+    if dst is None:
+        return resized
+    dst[...] = resized
+    return dst
+
+
+@pytest.fixture(scope="module")
+def detection():
+    package = types.ModuleType("VisionVend.raspberry_pi")
+    package.__path__ = [str(PI_DIR)]
+    fakes = {
+        "cv2": types.SimpleNamespace(resize=_resize, INTER_LINEAR=1),
+        "VisionVend.raspberry_pi": package,
+        "VisionVend.raspberry_pi.backends": backends,
+    }
+    saved = {name: sys.modules.get(name) for name in fakes}
+    sys.modules.update(fakes)
+    try:
+        sys.modules.pop("detection", None)
+        yield importlib.import_module("detection")
+    finally:
+        sys.modules.pop("detection", None)
+        for name, module in saved.items():
+            if module is None:
+                sys.modules.pop(name, None)
+            else:
+                sys.modules[name] = module
+
+
+class FakeBackend(backends.DetectorBackend):
+    """Sees one product per frame: cola on a dark frame, chips on a bright one."""
+
+    name = "fake"
+
+    def __init__(self, model_dir):
+        super().__init__(model_dir)
+        self.batches = []
+
+    def forward(self, pixels):
+        self.batches.append(len(pixels))
+        logits = np.full((len(pixels), 2, 2), -5.0, dtype=np.float32)
+        boxes = np.full((len(pixels), 2, 4), 0.5, dtype=np.float32)
+        for i, image in enumerate(pixels):
+            logits[i, 0, 1 if image.mean() > 0.5 else 0] = 5.0
+        return logits, boxes
+
+
+@pytest.fixture
+def backend(tmp_path):
+    (tmp_path / "config.json").write_text(json.dumps({"id2label": {"0": "cola", "1": "chips"}}))
+    (tmp_path / "preprocessor_config.json").write_text(json.dumps({"size": {"height": 8, "width": 8}}))
+    return FakeBackend(tmp_path)
+
+
+def frame(bright, shape=(48, 64, 3)):
+    return np.full(shape, 255 if bright else 0, dtype=np.uint8)
+
+
+def test_both_cameras_share_one_forward_pass(detection, backend):
+    service = detection.DetectionService(backend, max_batch=4)
+    camera1, camera2 = frame(False), frame(True, shape=(24, 32, 3))
+    found = service.detect([camera1, camera2])
+    assert backend.batches == [2]
+    assert [[d.label for d in dets] for dets in found] == [["cola"], ["chips"]]
+    # Boxes come back in each camera's own pixels
+    assert found[0][0].box == pytest.approx((16.0, 12.0, 48.0, 36.0))
+    assert found[1][0].box == pytest.approx((8.0, 6.0, 24.0, 18.0))
+
+
+def test_larger_inputs_split_into_batches_in_order(detection, backend):
+    service = detection.DetectionService(backend, max_batch=2)
+    frames = [frame(False), frame(True), frame(True), frame(False), frame(True)]
+    labels = service.labels_per_frame(frames)
+    assert backend.batches == [2, 2, 1]
+    assert labels == [["cola"], ["chips"], ["chips"], ["cola"], ["chips"]]
+    assert service.batches == 3 and service.frames == 5
+
+
+def test_label_filter_and_threshold(detection, backend):
+    service = detection.DetectionService(backend, labels={"chips"})
+    assert service.labels_per_frame([frame(False), frame(True)]) == [[], ["chips"]]
+    assert service.labels_per_frame([frame(True)], threshold=0.999) == [[]]
@@ -0,0 +1,144 @@
+"""
+test_device_registry.py - Device lookups behind /unlock
+
+Runs DeviceRegistry against a throwaway SQLite database. Changes made with a
+Core UPDATE skip the ORM listener, as a change from another worker would.
+"""
+
+import asyncio
+import sys
+from pathlib import Path
+
+from sqlalchemy import func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src" / "server"))
+
+from device_registry import DeviceRegistry, machine_topic, topic_machine, wildcard_topic  # noqa: E402
+from models import Base, Device  # noqa: E402
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+async def _registry(tmp_path, **kwargs):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'devices.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    session_maker = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    registry = DeviceRegistry(session_maker, **kwargs)
+    await registry.load()
+    return engine, session_maker, registry
+
+
+async def _device_count(session_maker):
+    async with session_maker() as db:
+        return (await db.execute(select(func.count(Device.id)))).scalar_one()
+
+
+def test_default_device_created_once(tmp_path):
+    async def run():
+        engine, session_maker, registry = await _registry(tmp_path)
+        first = await registry.ensure_default()
+        second = await registry.ensure_default()
+        assert first == second
+        assert await registry.resolve() == first
+        assert await _device_count(session_maker) == 1
+        await engine.dispose()
+    asyncio.run(run())
+
+
+def test_unknown_device_is_not_created(tmp_path):
+    async def run():
+        engine, session_maker, registry = await _registry(tmp_path)
+        await registry.ensure_default()
+        for i in range(20):
+            assert await registry.resolve(f"random-{i}") is None
+        assert await _device_count(session_maker) == 1
+        assert registry.stats()["devices"] == 1
+        await engine.dispose()
+    asyncio.run(run())
+
+
+def test_existing_device_resolved_from_db(tmp_path):
+    async def run():
+        engine, session_maker, registry = await _registry(tmp_path)
+        async with session_maker() as db:
+            db.add(Device(device_id="kiosk-2", name="Kiosk 2"))
+            await db.commit()
+        entry = await registry.resolve("kiosk-2")
+        assert entry is not None and entry.device_id == "kiosk-2"
+        assert await registry.resolve("kiosk-2") == entry
+        assert registry.hits == 1
+        await engine.dispose()
+    asyncio.run(run())
+
+
+def test_orm_change_invalidates_the_entry(tmp_path):
+    async def run():
+        engine, session_maker, registry = await _registry(tmp_path)
+        entry = await registry.ensure_default()
+        async with session_maker() as db:
+            device = await db.get(Device, entry.pk)
+            device.is_active = False
+            await db.commit()
+        assert registry.stats()["invalidations"] == 1
+        assert (await registry.resolve()).is_active is False
+        await engine.dispose()
+    asyncio.run(run())
+
+
+def test_change_from_another_process_is_seen_after_ttl(tmp_path):
+    async def run():
+        clock = Clock()
+        engine, session_maker, registry = await _registry(tmp_path, ttl=30.0, clock=clock)
+        await registry.ensure_default()
+        async with session_maker() as db:
+            await db.execute(update(Device).where(Device.device_id == "default").values(is_active=False))
+            await db.commit()
+        clock.now = 29.0
+        assert (await registry.resolve()).is_active is True  # still within the TTL
+        clock.now = 30.0
+        assert (await registry.resolve()).is_active is False
+        assert registry.stats()["expired"] == 1
+        await engine.dispose()
+    asyncio.run(run())
+
+
+def test_deleted_device_drops_out_after_ttl(tmp_path):
+    async def run():
+        clock = Clock()
+        engine, session_maker, registry = await _registry(tmp_path, ttl=5.0, clock=clock)
+        async with session_maker() as db:
+            db.add(Device(device_id="kiosk-2", name="Kiosk 2"))
+            await db.commit()
+        await registry.load()
+        assert registry.get("kiosk-2") is not None
+        async with session_maker() as db:
+            await db.execute(Device.__table__.delete().where(Device.device_id == "kiosk-2"))
+            await db.commit()
+        clock.now = 5.0
+        assert registry.get("kiosk-2") is None
+        assert await registry.resolve("kiosk-2") is None
+        await engine.dispose()
+    asyncio.run(run())
+
+
+def test_topic_routing():
+    assert topic_machine("case/kiosk-2/door") == "kiosk-2"
+    assert topic_machine("case//door") is None
+    assert topic_machine("other/kiosk-2/door") is None
+    assert topic_machine("case/kiosk-2") is None
+    assert machine_topic("case/abc123/cmd", "kiosk-2") == "case/kiosk-2/cmd"
+    assert wildcard_topic("case/abc123/door") == "case/+/door"
+
+
+def test_default_device_keeps_the_configured_machine_id():
+    registry = DeviceRegistry(None, default_machine_id="abc123")
+    assert registry.machine_for("default") == "abc123"
+    assert registry.machine_for("kiosk-2") == "kiosk-2"
@@ -0,0 +1,109 @@
+"""
+test_esp32_door.py - ESP32 door lifecycle task
+
+Runs src/esp32_s3/door.py under CPython: without uasyncio it falls back to
+asyncio, and the fake hall sensor has no irq(), so the task polls it every
+poll_interval as it does on boards without pin interrupts.
+"""
+
+import asyncio
+import importlib.util
+from pathlib import Path
+
+ESP32_DIR = Path(__file__).resolve().parents[1] / "src" / "esp32_s3"
+
+
+def _load(name):
+    spec = importlib.util.spec_from_file_location(f"esp32_{name}", ESP32_DIR / f"{name}.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+door = _load("door")
+
+
+class FakePin:
+    def __init__(self, level=0):
+        self.level = level
+        self.history = []
+
+    def value(self, level=None):
+        if level is None:
+            return self.level
+        self.level = level
+        self.history.append(level)
+
+
+class Rig:
+    def __init__(self, **kwargs):
+        self.lock = FakePin(0)
+        self.hall = FakePin(1)  # reads high while the door is shut
+        self.mass = 1000.0
+        self.closed = []
+        self.timed_out = []
+        self.states = []
+        self.controller = door.DoorController(
+            self.lock, self.hall, lambda: self.mass,
+            on_closed=lambda tx, delta: self.closed.append((tx, delta)),
+            on_timeout=self.timed_out.append,
+            on_state=lambda state, tx: self.states.append((state, tx)),
+            debounce=0, poll_interval=0.005, **kwargs)
+
+    async def settle(self):
+        await asyncio.sleep(0.03)
+
+
+def test_unlock_open_close_publishes_the_delta():
+    async def run():
+        rig = Rig(timeout=5)
+        task = asyncio.create_task(rig.controller.run())
+        assert rig.controller.request("tx-1")
+        await rig.settle()
+        assert rig.controller.state == door.UNLOCKED and rig.lock.level == 1
+        rig.hall.level = 0  # door opens
+        await rig.settle()
+        assert rig.controller.state == door.OPEN
+        rig.mass = 645.0
+        rig.hall.level = 1  # door shuts
+        await rig.settle()
+        assert rig.closed == [("tx-1", 355.0)]
+        assert rig.controller.state == door.IDLE and rig.lock.level == 0
+        assert [state for state, _ in rig.states] == [door.IDLE, door.UNLOCKED, door.OPEN, door.IDLE]
+        task.cancel()
+    asyncio.run(run())
+
+
+def test_duplicate_and_overflowing_unlocks_are_rejected():
+    rig = Rig(max_queue=2)
+    assert rig.controller.request("tx-1")
+    assert not rig.controller.request("tx-1")
+    assert rig.controller.request("tx-2")
+    assert not rig.controller.request("tx-3")
+    assert rig.controller.pending() == 2
+
+
+def test_door_never_opened_times_out_and_relocks():
+    async def run():
+        rig = Rig(timeout=0.05)
+        task = asyncio.create_task(rig.controller.run())
+        rig.controller.request("tx-1")
+        rig.controller.request("tx-2")
+        await asyncio.sleep(0.25)
+        assert rig.timed_out == ["tx-1", "tx-2"]  # queued sessions run back to back
+        assert rig.closed == [] and rig.controller.timeouts == 2
+        assert rig.lock.level == 0 and rig.controller.state == door.IDLE
+        task.cancel()
+    asyncio.run(run())
+
+
+def test_unlock_for_the_running_session_is_a_duplicate():
+    async def run():
+        rig = Rig(timeout=5)
+        task = asyncio.create_task(rig.controller.run())
+        rig.controller.request("tx-1")
+        await rig.settle()
+        assert rig.controller.transaction_id == "tx-1"
+        assert not rig.controller.request("tx-1")
+        task.cancel()
+    asyncio.run(run())
@@ -0,0 +1,80 @@
+"""
+test_esp32_telemetry.py - On-device telemetry windows
+
+Runs src/esp32_s3/telemetry.py under CPython. Its flat ``import wire`` is
+pointed at the ESP32 wire module while it loads, and windows are decoded with
+the server's wire module.
+"""
+
+import importlib.util
+import sys
+from pathlib import Path
+
+import pytest
+
+from VisionVend.utils import wire
+
+ESP32_DIR = Path(__file__).resolve().parents[1] / "src" / "esp32_s3"
+
+
+def _load(name, **deps):
+    saved = {dep: sys.modules.get(dep) for dep in deps}
+    sys.modules.update(deps)
+    try:
+        spec = importlib.util.spec_from_file_location(f"esp32_{name}", ESP32_DIR / f"{name}.py")
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        return module
+    finally:
+        for dep, module in saved.items():
+            if module is None:
+                sys.modules.pop(dep, None)
+            else:
+                sys.modules[dep] = module
+
+
+telemetry = _load("telemetry", wire=_load("wire"))
+
+
+@pytest.fixture
+def aggregator():
+    agg = telemetry.TelemetryAggregator(heartbeat=60, mass_delta=5.0, vcc_delta=0.05)
+    agg.add(False, 1000.0, 5.0)
+    agg.flush(now=0)
+    return agg
+
+
+def test_nothing_due_without_samples():
+    agg = telemetry.TelemetryAggregator()
+    assert not agg.due(now=0)
+    agg.add(False, 1000.0, 5.0)
+    assert agg.due(now=0)  # first window always goes out
+
+
+def test_quiet_machine_waits_for_the_heartbeat(aggregator):
+    aggregator.add(False, 1001.0, 5.01)
+    assert not aggregator.due(now=30)
+    assert aggregator.due(now=60)
+
+
+@pytest.mark.parametrize("door_open, mass, vcc", [
+    (True, 1000.0, 5.0),  # door opened
+    (False, 994.0, 5.0),  # weight moved
+    (False, 1000.0, 4.9),  # battery sagged
+])
+def test_change_publishes_before_the_heartbeat(aggregator, door_open, mass, vcc):
+    aggregator.add(door_open, mass, vcc)
+    assert aggregator.due(now=1)
+
+
+def test_window_aggregates_and_resets_after_flush(aggregator):
+    for mass, vcc in ((990.0, 4.9), (1010.0, 5.1), (1000.0, 5.0)):
+        aggregator.add(True, mass, vcc)
+    message = wire.decode(aggregator.flush(now=10))
+    assert message.door_open and message.samples == 3
+    assert message.mass == pytest.approx((990.0, 1010.0, 1000.0))
+    assert message.vcc == pytest.approx((4.9, 5.1, 5.0))
+    assert aggregator.mass.count == 0 and aggregator.vcc.low is None
+    assert not aggregator.due(now=11)
+    aggregator.add(True, 1001.0, 5.0)
+    assert not aggregator.due(now=11)  # compared against the mean just published
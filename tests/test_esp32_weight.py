@@ -0,0 +1,103 @@
+"""
+test_esp32_weight.py - Median + Kalman filtering of HX711 readings
+
+Runs src/esp32_s3/weight.py under CPython, which falls back to asyncio, with a
+fake HX711 that serves synthetic readings.
+"""
+
+import asyncio
+import importlib.util
+import itertools
+from pathlib import Path
+
+import pytest
+
+ESP32_DIR = Path(__file__).resolve().parents[1] / "src" / "esp32_s3"
+
+
+def _load(name):
+    spec = importlib.util.spec_from_file_location(f"esp32_{name}", ESP32_DIR / f"{name}.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+weight = _load("weight")
+
+
+class FakePin:
+    def __init__(self, level=0):
+        self.level = level
+
+    def value(self):
+        return self.level
+
+
+class FakeHX711:
+    def __init__(self, readings):
+        self.readings = iter(readings)
+
+    def read(self):
+        return next(self.readings)
+
+
+def noisy(level, spread=3.0):
+    """Endless readings around ``level``, alternating above and below it."""
+    return (level + spread * sign for sign in itertools.cycle((1, -1, 0.5, -0.5)))
+
+
+@pytest.fixture
+def sampler():
+    return weight.WeightSampler(None, FakePin(), window=5)
+
+
+def feed(sampler, readings, count):
+    for reading in itertools.islice(readings, count):
+        sampler.add(reading)
+
+
+def test_first_reading_seeds_the_estimate(sampler):
+    assert sampler.estimate() is None
+    sampler.add(1000.0)
+    assert sampler.estimate() == 1000.0  # no ramp up from zero
+
+
+def test_noise_is_smoothed(sampler):
+    feed(sampler, noisy(1000.0), 40)
+    assert sampler.estimate() == pytest.approx(1000.0, abs=1.0)
+
+
+def test_door_slam_spike_is_rejected(sampler):
+    feed(sampler, noisy(1000.0), 20)
+    for spike in (5000.0, -3000.0):
+        sampler.add(spike)
+        assert sampler.estimate() == pytest.approx(1000.0, abs=2.0)
+        feed(sampler, noisy(1000.0), 3)
+
+
+def test_step_change_settles_within_a_few_samples(sampler):
+    feed(sampler, noisy(1000.0), 30)
+    baseline = sampler.estimate()
+    feed(sampler, noisy(645.0), 6)  # a cola (355 g) leaves the shelf
+    assert sampler.estimate() == pytest.approx(645.0, abs=3.0)
+    assert baseline - sampler.estimate() == pytest.approx(355.0, abs=4.0)
+
+
+def test_poll_only_reads_when_data_is_ready():
+    dt = FakePin(level=1)
+    sampler = weight.WeightSampler(FakeHX711([1000.0, 1001.0]), dt)
+    assert not sampler.poll() and sampler.samples == 0
+    dt.level = 0
+    assert sampler.poll() and sampler.samples == 1
+
+
+def test_run_samples_until_stopped():
+    async def run():
+        sampler = weight.WeightSampler(FakeHX711(noisy(500.0)), FakePin(), period=0.001)
+        task = asyncio.create_task(sampler.run())
+        await asyncio.sleep(0.05)
+        sampler.stop()
+        await asyncio.wait_for(task, 1.0)
+        assert sampler.samples > 5
+        assert sampler.estimate() == pytest.approx(500.0, abs=3.0)
+    asyncio.run(run())
@@ -0,0 +1,108 @@
+"""
+test_frame_ring.py - Shared-memory frame ring
+
+Covers drop-oldest streaming, the per-slot seqlock, and attaching to the ring
+by name as a second process would.
+"""
+
+import sys
+import uuid
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src" / "raspberry_pi"))
+
+from frame_ring import HAND_POINTS, FrameRing  # noqa: E402
+
+SHAPE = (4, 6, 3)
+
+
+def _frame(value):
+    return np.full(SHAPE, value, dtype=np.uint8)
+
+
+@pytest.fixture
+def ring():
+    ring = FrameRing(f"vv-test-{uuid.uuid4().hex[:8]}", SHAPE, slots=4, create=True,
+                     masks=True, max_hands=2)
+    yield ring
+    ring.close()
+
+
+def test_reader_sees_frames_in_order(ring):
+    assert ring.next_seq(0) is None
+    for value in (1, 2, 3):
+        ring.publish(_frame(value))
+    seq, seen = 0, []
+    while (seq := ring.next_seq(seq)) is not None:
+        assert ring.valid(seq)
+        seen.append(int(ring.frame(seq)[0, 0, 0]))
+    assert seen == [1, 2, 3]
+
+
+def test_slow_reader_skips_to_the_oldest_frame_left(ring):
+    for value in range(1, 11):
+        ring.publish(_frame(value))
+    assert ring.head() == 10
+    assert ring.next_seq(0) == 7  # frames 1-6 were overwritten
+    assert not any(ring.valid(seq) for seq in range(1, 7))
+    assert all(ring.valid(seq) for seq in range(7, 11))
+    assert [int(ring.frame(seq)[0, 0, 0]) for seq in range(7, 11)] == [7, 8, 9, 10]
+
+
+def test_slot_is_invalid_while_being_overwritten(ring):
+    for value in range(1, 5):
+        ring.publish(_frame(value))
+    held = 1  # the slot the next publish reuses
+    view = ring.frame(held)
+    observed = {}
+
+    class Probe:
+        """Hand list that records what a reader sees mid-write."""
+
+        def __getitem__(self, index):
+            observed["old"] = ring.valid(held)
+            observed["new"] = ring.valid(5)
+            return []
+
+    assert ring.publish(_frame(5), hands=Probe()) == 5
+    assert observed == {"old": False, "new": False}
+    assert not ring.valid(held) and ring.valid(5)
+    assert int(view[0, 0, 0]) == 5  # the zero-copy view now holds the new frame
+
+
+def test_masks_and_hands_travel_with_the_frame(ring):
+    mask = np.zeros(SHAPE[:2], dtype=np.uint8)
+    mask[1, 2] = 255
+    polygon = np.arange(HAND_POINTS * 2, dtype=np.int32).reshape(HAND_POINTS, 2)
+    seq = ring.publish(_frame(9), mask=mask, hands=[polygon, polygon, polygon])
+    assert np.array_equal(ring.mask(seq), mask)
+    hands = ring.hands(seq)
+    assert len(hands) == 2  # capped at max_hands
+    assert np.array_equal(hands[0], polygon)
+
+
+def test_attached_ring_shares_frames(ring):
+    reader = FrameRing(ring.name, SHAPE, slots=4, masks=True, max_hands=2)
+    try:
+        seq = ring.publish(_frame(42))
+        assert reader.head() == seq and reader.valid(seq)
+        assert int(reader.frame(seq)[0, 0, 0]) == 42
+    finally:
+        reader.close()
+    with pytest.raises(ValueError):
+        FrameRing(ring.name, SHAPE, slots=64)
+
+
+def test_request_response_slots(ring):
+    slots = [ring.write(_frame(i)) for i in range(4)]
+    assert sorted(slots) == [0, 1, 2, 3]
+    with pytest.raises(RuntimeError):
+        ring.write(_frame(0))
+    ring.release(slots[0])
+    assert ring.write(_frame(7)) == slots[0]
+    assert int(ring.view(slots[0])[0, 0, 0]) == 7
+    with pytest.raises(ValueError):
+        ring.write(np.zeros((2, 2, 3), dtype=np.uint8))
@@ -0,0 +1,114 @@
+"""
+test_ingest.py - Backpressure and drop accounting in MqttIngest
+
+Messages are submitted from a separate thread, as paho-mqtt's network thread
+would submit them, while the consumers are held up by a gate.
+"""
+
+import asyncio
+import sys
+import threading
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src" / "server"))
+
+from ingest import MqttIngest  # noqa: E402
+
+
+class Gate:
+    """Handler that records payloads and blocks until opened."""
+
+    def __init__(self):
+        self.open = asyncio.Event()
+        self.seen = []
+
+    async def __call__(self, payload, client, topic):
+        await self.open.wait()
+        self.seen.append(payload)
+
+
+async def _started(handler, **kwargs):
+    ingest = MqttIngest(handler, workers=1, queue_size=1, **kwargs)
+    await ingest.start()
+    return ingest
+
+
+def test_full_queue_blocks_the_producer_instead_of_dropping():
+    async def run():
+        gate = Gate()
+        ingest = await _started(gate, put_timeout=5.0)
+        submits = [asyncio.to_thread(ingest.submit, i, None) for i in range(3)]
+        producers = asyncio.gather(*submits)
+        await asyncio.sleep(0.1)
+        assert not producers.done()  # one message being handled, one queued, one waiting
+        gate.open.set()
+        assert await producers == [True, True, True]
+        await ingest.stop()
+        assert sorted(gate.seen) == [0, 1, 2]
+        assert ingest.stats()["dropped"] == 0
+    asyncio.run(run())
+
+
+def test_put_timeout_drops_and_counts_once():
+    async def run():
+        gate = Gate()
+        ingest = await _started(gate, put_timeout=0.05)
+        assert await asyncio.to_thread(ingest.submit, "handled", None)
+        await asyncio.sleep(0.01)
+        assert await asyncio.to_thread(ingest.submit, "queued", None)
+        assert not await asyncio.to_thread(ingest.submit, "dropped", None)
+        gate.open.set()
+        await ingest.stop()
+        stats = ingest.stats()
+        assert gate.seen == ["handled", "queued"]
+        assert stats["received"] == 3 and stats["processed"] == 2 and stats["dropped"] == 1
+    asyncio.run(run())
+
+
+def test_submit_from_the_loop_never_blocks():
+    async def run():
+        gate = Gate()
+        ingest = await _started(gate)
+        assert ingest.submit("handled", None)
+        await asyncio.sleep(0.01)
+        assert ingest.submit("queued", None)
+        assert not ingest.submit("dropped", None)
+        gate.open.set()
+        await ingest.stop()
+        assert ingest.stats()["dropped"] == 1
+    asyncio.run(run())
+
+
+def test_submit_before_start_is_dropped():
+    ingest = MqttIngest(Gate())
+    assert not ingest.submit("early", None)
+    assert ingest.dropped == 1
+
+
+def test_blocked_loop_does_not_wedge_the_producer():
+    async def run():
+        gate = Gate()
+        ingest = await _started(gate, put_timeout=0.05, loop_margin=0.05)
+        result = {}
+        producer = threading.Thread(target=lambda: result.setdefault("queued", ingest.submit("late", None)))
+        producer.start()
+        producer.join(timeout=2.0)  # blocks the loop, as paho's loop_stop() join does
+        assert not producer.is_alive() and result["queued"] is False
+        await asyncio.sleep(0.05)  # the abandoned put is cancelled, not enqueued late
+        assert ingest.stats()["queue_depth"] == 0 and ingest.dropped == 1
+        gate.open.set()
+        await ingest.stop()
+        assert gate.seen == []
+    asyncio.run(run())
+
+
+def test_close_refuses_new_messages():
+    async def run():
+        gate = Gate()
+        gate.open.set()
+        ingest = await _started(gate)
+        ingest.close()
+        assert not await asyncio.to_thread(ingest.submit, "after close", None)
+        await ingest.stop()
+        assert gate.seen == [] and ingest.dropped == 1
+    asyncio.run(run())
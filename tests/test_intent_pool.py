@@ -0,0 +1,94 @@
+"""
+test_intent_pool.py - Pre-created PaymentIntent pool
+
+Runs IntentPool against an in-memory stand-in for PaymentExecutor.
+"""
+
+import asyncio
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src" / "server"))
+
+from intent_pool import IntentPool  # noqa: E402
+
+
+class FakePayments:
+    def __init__(self):
+        self.created = []
+        self.cancelled = []
+
+    async def create_intent(self, key, **params):
+        intent = SimpleNamespace(id=f"pi_{len(self.created)}", key=key)
+        self.created.append(intent)
+        return intent
+
+    async def cancel(self, payment_intent_id, transaction_id):
+        self.cancelled.append(payment_intent_id)
+
+
+async def _settle(pool):
+    while pool._tasks:
+        await asyncio.gather(*pool._tasks)
+
+
+def test_only_warmed_devices_are_pooled():
+    async def run():
+        payments = FakePayments()
+        pool = IntentPool(payments, amount_cents=1000, size=2)
+        pool.warm(["default"])
+        await _settle(pool)
+        assert len(payments.created) == 2
+
+        for i in range(10):
+            assert pool.take(f"random-{i}") is None
+        await _settle(pool)
+        assert len(payments.created) == 2
+        assert set(pool.stats()["ready"]) == {"default"}
+
+        intent = pool.take("default")
+        assert intent is not None
+        await _settle(pool)
+        assert len(payments.created) == 3  # refilled back to size
+        await pool.close()
+    asyncio.run(run())
+
+
+def test_active_device_is_pooled_after_its_first_miss():
+    async def run():
+        payments = FakePayments()
+        pool = IntentPool(payments, amount_cents=1000, size=2)
+        pool.warm(["default"])
+        await _settle(pool)
+
+        assert pool.take("added-later", active=True) is None
+        await _settle(pool)
+        assert pool.stats()["ready"]["added-later"] == 2
+        assert len(payments.created) == 4
+
+        assert pool.take("added-later", active=True) is not None
+        assert pool.take("inactive") is None
+        await _settle(pool)
+        assert "inactive" not in pool.stats()["ready"]
+        await pool.close()
+
+        assert pool.take("after-close", active=True) is None
+        await _settle(pool)
+        assert len(payments.created) == 5
+    asyncio.run(run())
+
+
+def test_discard_and_close_cancel_unused_intents():
+    async def run():
+        payments = FakePayments()
+        pool = IntentPool(payments, amount_cents=1000, size=1)
+        pool.warm(["default"])
+        await _settle(pool)
+        intent = pool.take("default")
+        pool.discard(intent)
+        await _settle(pool)
+        assert payments.cancelled == [intent.id]
+        await pool.close()
+        assert len(payments.cancelled) == 2
+    asyncio.run(run())
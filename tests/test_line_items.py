@@ -0,0 +1,84 @@
+"""
+test_line_items.py - Normalized line items for captured baskets
+
+Runs record_line_items against a throwaway SQLite database. A failed insert
+must roll back and keep the basket in items_json for backfill_items.py.
+"""
+
+import asyncio
+import json
+import sys
+from collections import Counter
+from pathlib import Path
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src" / "server"))
+
+import line_items  # noqa: E402
+from catalog import Catalog  # noqa: E402
+from models import Base, Device, Product, Transaction, TransactionItem  # noqa: E402
+
+PRICES = Catalog.from_inventory({
+    "cola": {"weight": 355, "price": 2.00},
+    "chips": {"weight": 70, "price": 1.50},
+}).snapshot()
+
+
+async def _database(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'items.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    session_maker = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    async with session_maker() as db:
+        device = Device(device_id="default", name="Default")
+        db.add(device)
+        await db.flush()
+        db.add(Transaction(transaction_id="tx-1", device_id=device.id, items_json='["cola"]'))
+        await db.commit()
+    return engine, session_maker
+
+
+async def _count(db, column):
+    return (await db.execute(select(func.count(column)))).scalar_one()
+
+
+def test_basket_written_as_rows(tmp_path):
+    async def run():
+        engine, session_maker = await _database(tmp_path)
+        async with session_maker() as db:
+            record = (await db.execute(select(Transaction))).scalar_one()
+            record = await line_items.record_line_items(db, record, Counter({"cola": 2, "chips": 1}), PRICES)
+            await db.commit()
+            assert record.items_json is None
+            rows = (await db.execute(select(TransactionItem))).scalars().all()
+            assert sorted((row.quantity, str(row.subtotal)) for row in rows) == [(1, "1.50"), (2, "4.00")]
+        await engine.dispose()
+    asyncio.run(run())
+
+
+def test_failed_insert_rolls_back_and_keeps_items_json(tmp_path, monkeypatch):
+    def broken_rows(*args):
+        raise RuntimeError("insert failed")
+
+    monkeypatch.setattr(line_items, "item_rows", broken_rows)
+
+    async def run():
+        engine, session_maker = await _database(tmp_path)
+        async with session_maker() as db:
+            record = (await db.execute(select(Transaction))).scalar_one()
+            record.status = "uncommitted"
+            basket = Counter({"cola": 2, "chips": 1})
+            record = await line_items.record_line_items(db, record, basket, PRICES)
+            assert sorted(json.loads(record.items_json)) == ["chips", "cola", "cola"]
+            assert record.status != "uncommitted"  # the session was rolled back
+            await db.commit()
+        async with session_maker() as db:
+            record = (await db.execute(select(Transaction))).scalar_one()
+            assert sorted(json.loads(record.items_json)) == ["chips", "cola", "cola"]
+            # Products created before the failure went with the rollback
+            assert await _count(db, Product.id) == 0
+            assert await _count(db, TransactionItem.id) == 0
+        await engine.dispose()
+    asyncio.run(run())
@@ -0,0 +1,77 @@
+"""
+test_query_plans.py - Query plan regression tests
+
+Runs EXPLAIN QUERY PLAN for every statement built in src/server/queries.py
+against a schema created from models.py and fails if any of them has to scan
+a whole table instead of searching an index.
+"""
+
+import inspect
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pytest
+from sqlalchemy import create_engine
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src" / "server"))
+
+import queries  # noqa: E402
+from models import Base  # noqa: E402
+
+NOW = datetime(2025, 1, 1, 12, 0, 0)
+
+# One representative call per query builder
+QUERY_EXAMPLES = {
+    "all_devices": (),
+    "device_by_external_id": ("default",),
+    "transaction_by_external_id": ("a1b2c3",),
+    "transaction_by_payment_intent": ("pi_123",),
+    "device_transactions_since": (1, NOW - timedelta(days=1)),
+    "transactions_by_status_before": ("pending_items", NOW - timedelta(minutes=15)),
+    "captured_with_items_json": (0,),
+    "transaction_items": (1,),
+    "products_by_sku": (["COKE", "CHIPS"],),
+}
+
+# Builders that read a whole table on purpose, mapped to the only table they may scan
+FULL_SCANS = {
+    "all_devices": "devices",
+}
+
+
+def query_builders():
+    return {
+        name: func
+        for name, func in inspect.getmembers(queries, inspect.isfunction)
+        if func.__module__ == queries.__name__ and not name.startswith("_")
+    }
+
+
+@pytest.fixture(scope="module")
+def engine(tmp_path_factory):
+    engine = create_engine(f"sqlite:///{tmp_path_factory.mktemp('plans') / 'plans.db'}")
+    Base.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+
+def explain(engine, statement):
+    compiled = statement.compile(dialect=engine.dialect, compile_kwargs={"render_postcompile": True})
+    params = tuple(compiled.params[name] for name in compiled.positiontup)
+    with engine.connect() as conn:
+        rows = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}", params).fetchall()
+    return [row[-1] for row in rows]
+
+
+def test_every_query_has_an_example():
+    assert set(query_builders()) == set(QUERY_EXAMPLES)
+
+
+@pytest.mark.parametrize("name", sorted(QUERY_EXAMPLES))
+def test_query_uses_index(engine, name):
+    statement = query_builders()[name](*QUERY_EXAMPLES[name])
+    plan = explain(engine, statement)
+    allowed = FULL_SCANS.get(name)
+    scans = [step for step in plan if step.startswith("SCAN ") and step.split()[1] != allowed]
+    assert not scans, f"{name} falls back to a full table scan: {plan}"
@@ -0,0 +1,127 @@
+"""
+test_reconcile.py - Pi-side removed-item decisions
+
+Reconciler fuses per-camera votes (and a weight delta, when one is given);
+reinfer_clip is driven through a fake cv2 module that serves synthetic frames.
+"""
+
+import sys
+import types
+from collections import Counter
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src" / "raspberry_pi"))
+
+from reconcile import Reconciler, reinfer_clip, removed_counts  # noqa: E402
+
+INVENTORY = {
+    "cola": {"weight": 355, "tolerance": 5},
+    "chips": {"weight": 70, "tolerance": 4},
+}
+
+
+@pytest.fixture
+def reconciler():
+    return Reconciler(INVENTORY)
+
+
+def test_removed_counts_keeps_units_that_disappeared():
+    before = {"cola": 3, "chips": 1}
+    after = {"cola": 1, "chips": 2, "tea": 1}
+    assert removed_counts(before, after) == Counter({"cola": 2})
+
+
+def test_cameras_and_weight_agree(reconciler):
+    decision = reconciler.decide([{"cola": 1}, {"cola": 1}], delta_mass=356.0)
+    assert decision.items == {"cola": 1} and not decision.escalate
+    assert decision.item_list() == ["cola"]
+
+
+def test_cameras_agree_without_weight(reconciler):
+    decision = reconciler.decide([{"cola": 2}, {"cola": 2}])
+    assert decision.items == {"cola": 2} and not decision.escalate
+
+
+def test_weight_outside_tolerance_escalates(reconciler):
+    decision = reconciler.decide([{"cola": 1}, {"cola": 1}], delta_mass=1000.0)
+    assert decision.escalate
+    assert "off the weight" in decision.reason
+
+
+def test_weight_breaks_a_camera_tie(reconciler):
+    votes = [{"cola": 1}, {"cola": 2}]  # one camera missed an occluded can
+    assert reconciler.decide(votes).escalate
+    decision = reconciler.decide(votes, delta_mass=710.0)
+    assert decision.items == {"cola": 2} and not decision.escalate
+
+
+def test_weight_adds_a_unit_no_camera_saw(reconciler):
+    decision = reconciler.decide([{"chips": 1}, {"chips": 1}], delta_mass=140.0)
+    assert decision.items == {"chips": 2}
+
+
+def test_nothing_seen_but_weight_missing(reconciler):
+    assert reconciler.decide([{}, {}]).items == {}
+    assert reconciler.decide([{}, {}], delta_mass=355.0).escalate
+
+
+def test_slow_vote_outweighs_the_fast_ones(reconciler):
+    votes = [{"cola": 1}, {"cola": 2}, {"cola": 2}]
+    decision = reconciler.decide(votes, vote_weights=[1.0, 1.0, 2.0])
+    assert decision.items == {"cola": 2} and not decision.escalate
+
+
+class FakeCapture:
+    """cv2.VideoCapture over a list of frames; each frame is its own label list."""
+
+    def __init__(self, frames):
+        self.frames = frames
+        self.position = 0
+        self.released = False
+
+    def get(self, prop):
+        return len(self.frames)
+
+    def set(self, prop, value):
+        self.position = int(value)
+
+    def read(self):
+        if self.position >= len(self.frames):
+            return False, None
+        frame = self.frames[self.position]
+        self.position += 1
+        return True, frame
+
+    def release(self):
+        self.released = True
+
+
+@pytest.fixture
+def fake_cv2(monkeypatch):
+    module = types.SimpleNamespace(CAP_PROP_FRAME_COUNT=7, CAP_PROP_POS_FRAMES=1, clips={}, captures=[])
+
+    def video_capture(path):
+        capture = FakeCapture(module.clips.get(path, []))
+        module.captures.append(capture)
+        return capture
+
+    module.VideoCapture = video_capture
+    monkeypatch.setitem(sys.modules, "cv2", module)
+    return module
+
+
+def test_reinfer_clip_takes_medians_at_each_end(fake_cv2):
+    start = [["cola", "cola", "chips"]] * 4
+    start[1] = ["chips"]  # a hand hides both colas in one frame
+    end = [["chips"]] * 4
+    fake_cv2.clips["clip.h264"] = start + [["cola"]] * 8 + end
+    removed = reinfer_clip("clip.h264", detect=lambda frame: frame, samples=8, edge_fraction=0.25)
+    assert removed == Counter({"cola": 2})
+    assert fake_cv2.captures[-1].released
+
+
+def test_reinfer_clip_on_an_empty_clip(fake_cv2):
+    assert reinfer_clip("empty.h264", detect=lambda frame: frame) == Counter()
+    assert fake_cv2.captures[-1].released
@@ -0,0 +1,78 @@
+"""
+test_sales_log.py - SalesLog write-ahead log and batching
+
+Uses a real WAL file under tmp_path and an in-memory worksheet.
+"""
+
+import asyncio
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src" / "server"))
+
+from sales_log import SalesLogBatcher  # noqa: E402
+
+
+class FakeWorksheet:
+    def __init__(self, fail=False):
+        self.rows = []
+        self.calls = 0
+        self.fail = fail
+
+    def append_rows(self, rows, value_input_option=None):
+        self.calls += 1
+        if self.fail:
+            raise RuntimeError("quota exceeded")
+        self.rows.extend(rows)
+
+
+def test_unflushed_rows_replay_after_restart(tmp_path):
+    wal = str(tmp_path / "sales.wal")
+
+    async def crash_before_flush():
+        batcher = SalesLogBatcher(FakeWorksheet(fail=True), wal)
+        assert await batcher.record("tx1", {"cola": 1, "chips": 2}) == 2
+        with pytest.raises(RuntimeError):
+            await batcher.flush()
+    asyncio.run(crash_before_flush())
+
+    sheet = FakeWorksheet()
+
+    async def restart():
+        batcher = SalesLogBatcher(sheet, wal)
+        assert batcher.stats()["pending"] == 2
+        assert await batcher.flush() == 2
+    asyncio.run(restart())
+    assert sorted((row[3], row[1], row[2]) for row in sheet.rows) == [("tx1", "chips", -2), ("tx1", "cola", -1)]
+
+    async def restart_again():
+        batcher = SalesLogBatcher(sheet, wal)
+        assert batcher.stats()["pending"] == 0
+        # Already flushed before the restart: still deduplicated
+        assert await batcher.record("tx1", {"cola": 1}) == 0
+    asyncio.run(restart_again())
+
+
+def test_duplicates_are_ignored(tmp_path):
+    async def run():
+        batcher = SalesLogBatcher(FakeWorksheet(), str(tmp_path / "sales.wal"))
+        results = await asyncio.gather(*(batcher.record("tx1", {"cola": 1}) for _ in range(3)))
+        assert sorted(results) == [0, 0, 1]
+        assert batcher.stats()["duplicates"] == 2
+    asyncio.run(run())
+
+
+def test_concurrent_records_share_fsyncs(tmp_path, monkeypatch):
+    wal = tmp_path / "sales.wal"
+    fsyncs = []
+    monkeypatch.setattr("sales_log.os.fsync", lambda fd: fsyncs.append(fd))
+
+    async def run():
+        batcher = SalesLogBatcher(FakeWorksheet(), str(wal))
+        await asyncio.gather(*(batcher.record(f"tx{i}", {"cola": 1}) for i in range(50)))
+        assert batcher.stats()["pending"] == 50
+    asyncio.run(run())
+    assert len(wal.read_text().splitlines()) == 50
+    assert len(fsyncs) < 50
@@ -0,0 +1,163 @@
+"""
+test_session.py - Event-driven Pi camera sessions
+
+Drives SessionScheduler with a fake GPIO module and fake cameras. Edges are
+delivered synchronously, as RPi.GPIO's callback thread would deliver them.
+"""
+
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src" / "raspberry_pi"))
+
+from session import ACTIVE, COLD, WARM, SessionScheduler  # noqa: E402
+
+PIR, SIGNAL = 17, 18
+
+
+class FakeGPIO:
+    BOTH = 3
+
+    def __init__(self):
+        self.levels = {PIR: 0, SIGNAL: 0}
+        self.callbacks = {}
+
+    def add_event_detect(self, pin, edge, callback, bouncetime):
+        self.callbacks[pin] = callback
+
+    def remove_event_detect(self, pin):
+        self.callbacks.pop(pin)
+
+    def input(self, pin):
+        return self.levels[pin]
+
+    def set(self, pin, level):
+        self.levels[pin] = level
+        self.callbacks[pin](pin)
+
+
+class FakeCamera:
+    def __init__(self):
+        self.rate = None
+        self.starts = 0
+        self.frames = 0
+        self.running = False
+
+    def set_controls(self, controls):
+        self.rate = controls["FrameRate"]
+
+    def start(self):
+        self.starts += 1
+        self.running = True
+
+    def stop(self):
+        self.running = False
+
+    def capture_array(self):
+        time.sleep(0.001)
+        self.frames += 1
+        return (self.rate, self.frames)
+
+
+@pytest.fixture
+def rig():
+    gpio = FakeGPIO()
+    cameras = [FakeCamera(), FakeCamera()]
+    scheduler = SessionScheduler(gpio, cameras, PIR, SIGNAL, framerate=30, warm_framerate=5,
+                                 preroll=4, idle_timeout=0.2, bouncetime=1)
+    scheduler.start()
+    yield gpio, cameras, scheduler
+    scheduler.close()
+
+
+def in_thread(func):
+    result = {}
+    thread = threading.Thread(target=lambda: result.setdefault("value", func()), daemon=True)
+    thread.start()
+    return thread, result
+
+
+def test_motion_warms_cameras_once(rig):
+    gpio, cameras, scheduler = rig
+    gpio.set(PIR, 1)
+    waiter, _ = in_thread(scheduler.wait_for_unlock)
+    gpio.set(PIR, 0)
+    gpio.set(PIR, 1)
+    time.sleep(0.05)
+    assert scheduler.state == WARM
+    assert [camera.starts for camera in cameras] == [1, 1]
+    assert cameras[0].rate == 5
+    gpio.set(SIGNAL, 1)
+    waiter.join(1)
+    assert scheduler.state == ACTIVE and cameras[0].rate == 30
+    assert [camera.starts for camera in cameras] == [1, 1]
+
+
+def test_idle_timeout_cools_cameras(rig):
+    gpio, cameras, scheduler = rig
+    gpio.set(PIR, 1)
+    waiter, _ = in_thread(scheduler.wait_for_unlock)
+    time.sleep(0.02)
+    gpio.set(PIR, 0)
+    time.sleep(0.4)
+    assert scheduler.state == COLD and not cameras[0].running
+    gpio.set(SIGNAL, 1)  # unlock without motion still works, from cold
+    waiter.join(1)
+    assert not waiter.is_alive() and scheduler.state == ACTIVE
+
+
+def test_door_closed_while_busy_is_not_a_new_unlock(rig):
+    gpio, cameras, scheduler = rig
+    gpio.set(PIR, 1)
+    gpio.set(SIGNAL, 1)
+    before = scheduler.wait_for_unlock()
+    assert len(before) == 2
+    # Door closes while detection runs: both edges are still queued
+    gpio.set(SIGNAL, 0)
+    assert len(scheduler.wait_for_close()) == 2
+    scheduler.finish()
+
+    waiter, _ = in_thread(scheduler.wait_for_unlock)
+    waiter.join(0.2)
+    assert waiter.is_alive(), "stale unlock edge started a phantom transaction"
+    gpio.set(SIGNAL, 1)
+    waiter.join(1)
+    assert not waiter.is_alive()
+
+
+def test_stale_repeat_edge_does_not_end_session(rig):
+    gpio, cameras, scheduler = rig
+    gpio.set(SIGNAL, 1)
+    scheduler.wait_for_unlock()
+    waiter, _ = in_thread(scheduler.wait_for_close)
+    scheduler._events.put((SIGNAL, 1))  # bounce of the level already seen
+    waiter.join(0.1)
+    assert waiter.is_alive()
+    gpio.set(SIGNAL, 0)
+    waiter.join(1)
+    assert not waiter.is_alive()
+
+
+def test_preroll_is_paced_to_the_clip_rate(rig):
+    gpio, cameras, scheduler = rig
+    gpio.set(PIR, 1)
+    time.sleep(0.05)  # fill the pre-roll at the warm rate
+    gpio.set(SIGNAL, 1)
+    scheduler.wait_for_unlock()
+    clip = []
+    preroll = scheduler.record(clip.append)
+    time.sleep(0.02)
+    gpio.set(SIGNAL, 0)
+    scheduler.wait_for_close()
+    scheduler.finish()
+    warm = [frame for frame in clip if frame[0] == 5]
+    assert preroll >= 1
+    # Each warm frame stands in for 30 / 5 clip frames
+    assert len(warm) % 6 == 0 and len(warm) >= 6
+    assert clip[-1][0] == 30
+    frames = [frame[1] for frame in clip]
+    assert frames == sorted(frames)  # pre-roll first, no gap or reordering
@@ -0,0 +1,87 @@
+"""
+test_sheets_sync.py - Incremental Products tab sync
+
+Drives ProductSheetSync with an in-memory worksheet and spreadsheet.
+"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src" / "server"))
+
+from sheets_sync import ProductSheetSync  # noqa: E402
+
+HEADER = ["SKU", "Name", "Price ($)", "Weight (g)", "Current Stock", "Photo URL"]
+
+
+class FakeWorksheet:
+    def __init__(self, rows):
+        self.rows = rows
+        self.reads = 0
+
+    def get_all_values(self):
+        self.reads += 1
+        return [HEADER] + [list(row) for row in self.rows]
+
+
+class FakeSpreadsheet:
+    def __init__(self):
+        self.revision = 1
+        self.lastUpdateTime = "cached at open"  # gspread never refreshes this attribute
+
+    def get_lastUpdateTime(self):
+        return f"2025-01-01T00:00:{self.revision:02d}Z"
+
+
+def test_first_poll_is_complete():
+    sheet = FakeWorksheet([["cola", "Cola", "2.00", "355", "10", ""]])
+    diff = ProductSheetSync(sheet).poll()
+    assert diff.complete
+    assert list(diff.upserts) == ["cola"]
+
+
+def test_changes_and_removals_after_first_poll():
+    sheet = FakeWorksheet([
+        ["cola", "Cola", "2.00", "355", "10", ""],
+        ["chips", "Chips", "1.50", "70", "4", ""],
+    ])
+    sync = ProductSheetSync(sheet)
+    sync.poll()
+
+    sheet.rows[0][4] = "9"  # stock is not hashed
+    assert not sync.poll()
+
+    sheet.rows[0][2] = "2.25"
+    del sheet.rows[1]
+    diff = sync.poll()
+    assert not diff.complete
+    assert list(diff.upserts) == ["cola"]
+    assert diff.removed == ["chips"]
+
+
+def test_forced_poll_returns_every_row():
+    sheet = FakeWorksheet([["cola", "Cola", "2.00", "355", "10", ""]])
+    sync = ProductSheetSync(sheet)
+    sync.poll()
+    diff = sync.poll(force=True)
+    assert diff.complete and list(diff.upserts) == ["cola"]
+
+
+def test_unchanged_revision_skips_the_read():
+    sheet = FakeWorksheet([["cola", "Cola", "2.00", "355", "10", ""]])
+    sync = ProductSheetSync(sheet, FakeSpreadsheet())
+    sync.poll()
+    assert not sync.poll()
+    assert sheet.reads == 1 and sync.revision_skips == 1
+
+
+def test_new_revision_reads_the_sheet_again():
+    sheet = FakeWorksheet([["cola", "Cola", "2.00", "355", "10", ""]])
+    spreadsheet = FakeSpreadsheet()
+    sync = ProductSheetSync(sheet, spreadsheet)
+    sync.poll()
+    sheet.rows[0][2] = "2.25"
+    spreadsheet.revision += 1
+    diff = sync.poll()
+    assert list(diff.upserts) == ["cola"] and diff.upserts["cola"][2] == "2.25"
+    assert sheet.reads == 2 and sync.revision_skips == 0
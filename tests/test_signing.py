@@ -0,0 +1,100 @@
+"""
+test_signing.py - Server and ESP32 message envelopes interoperate
+
+VisionVend/utils/security.py and its MicroPython port in
+src/esp32_s3/signing.py are maintained by hand. These tests sign on one side
+and verify on the other. They also check that both reject replays, stale
+timestamps and unknown keys.
+"""
+
+import importlib.util
+import time
+from pathlib import Path
+
+import pytest
+
+from VisionVend.utils.security import EnvelopeError, KeyRing, ReplayError, Signer, Verifier
+
+ESP32_DIR = Path(__file__).resolve().parents[1] / "src" / "esp32_s3"
+
+
+def _load(name):
+    spec = importlib.util.spec_from_file_location(f"esp32_{name}", ESP32_DIR / f"{name}.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+esp_signing = _load("signing")
+
+MQTT_CONFIG = {"hmac_key_id": 2, "hmac_keys": {1: "old-secret", 2: "current-secret"}}
+
+
+@pytest.fixture
+def server_keys():
+    return KeyRing.from_config(MQTT_CONFIG)
+
+
+@pytest.fixture
+def esp_keys():
+    return esp_signing.KeyRing.from_config(MQTT_CONFIG)
+
+
+def test_server_to_esp32(server_keys, esp_keys):
+    envelope = Signer(server_keys).sign(b"\x11unlock-payload")
+    assert esp_signing.Verifier(esp_keys).open(envelope) == b"\x11unlock-payload"
+
+
+def test_esp32_to_server(server_keys, esp_keys):
+    envelope = esp_signing.Signer(esp_keys).sign(b"\x12door-payload")
+    assert Verifier(server_keys).open(envelope) == b"\x12door-payload"
+
+
+def test_same_bytes_on_both_sides(server_keys, esp_keys):
+    envelope = Signer(server_keys).sign(b"payload", timestamp=1735689600, nonce=b"\x01" * 8)
+    header_and_payload = envelope[:-16]
+    assert esp_keys.mac(2, header_and_payload)[:16] == envelope[-16:]
+
+
+def test_rotated_key_still_verifies(esp_keys):
+    old_server_keys = KeyRing({1: "old-secret"}, active_key_id=1)
+    envelope = Signer(old_server_keys).sign(b"payload")
+    assert esp_signing.Verifier(esp_keys).open(envelope) == b"payload"
+
+
+def test_replay_rejected_on_both_sides(server_keys, esp_keys):
+    envelope = Signer(server_keys).sign(b"payload")
+    esp_verifier = esp_signing.Verifier(esp_keys)
+    esp_verifier.open(envelope)
+    with pytest.raises(esp_signing.EnvelopeError):
+        esp_verifier.open(envelope)
+
+    envelope = esp_signing.Signer(esp_keys).sign(b"payload")
+    server_verifier = Verifier(server_keys)
+    server_verifier.open(envelope)
+    with pytest.raises(ReplayError):
+        server_verifier.open(envelope)
+    assert server_verifier.stats()["replays"] == 1
+
+
+def test_stale_timestamp_rejected_on_both_sides(server_keys, esp_keys):
+    stale = int(time.time()) - 600
+    with pytest.raises(esp_signing.EnvelopeError):
+        esp_signing.Verifier(esp_keys).open(Signer(server_keys).sign(b"payload", timestamp=stale))
+    with pytest.raises(ReplayError):
+        Verifier(server_keys).open(Signer(server_keys).sign(b"payload", timestamp=stale))
+
+
+def test_unknown_key_id_rejected_on_both_sides(server_keys, esp_keys):
+    stranger = KeyRing({7: "someone-else"}, active_key_id=7)
+    with pytest.raises(esp_signing.EnvelopeError):
+        esp_signing.Verifier(esp_keys).open(Signer(stranger).sign(b"payload"))
+    with pytest.raises(EnvelopeError):
+        Verifier(server_keys).open(esp_signing.Signer(esp_signing.KeyRing({7: "someone-else"})).sign(b"payload"))
+
+
+def test_tampered_payload_rejected(server_keys, esp_keys):
+    envelope = bytearray(esp_signing.Signer(esp_keys).sign(b"payload"))
+    envelope[15] ^= 0x01
+    with pytest.raises(EnvelopeError):
+        Verifier(server_keys).open(bytes(envelope))
@@ -0,0 +1,91 @@
+"""
+test_wire.py - Server and ESP32 wire formats stay byte-compatible
+
+VisionVend/utils/wire.py and its MicroPython port in src/esp32_s3/wire.py are
+maintained by hand. These tests encode on one side and decode on the other,
+and check that truncated or out-of-range messages raise WireError.
+"""
+
+import importlib.util
+from pathlib import Path
+
+import pytest
+
+from VisionVend.utils import wire
+
+ESP32_DIR = Path(__file__).resolve().parents[1] / "src" / "esp32_s3"
+
+
+def _load(name):
+    spec = importlib.util.spec_from_file_location(f"esp32_{name}", ESP32_DIR / f"{name}.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+esp_wire = _load("wire")
+
+
+def test_esp32_door_event_decodes_on_server():
+    data = esp_wire.encode_door("tx-1", {"cola": 2, "chips": 1}, -425.5)
+    message = wire.decode(data)
+    assert message == wire.DoorEvent("tx-1", (("cola", 2), ("chips", 1)), -425.5)
+    assert wire.encode(message) == data
+
+
+def test_esp32_telemetry_decodes_on_server():
+    message = wire.decode(esp_wire.encode_telemetry(True, [12.5, -3.25], 4.987))
+    assert message == wire.Telemetry(True, 4.987, (12.5, -3.25))
+
+
+def test_esp32_telemetry_window_decodes_on_server():
+    data = esp_wire.encode_telemetry_window(False, 40, (1.5, 3.5, 2.5), (4.9, 5.1, 5.0))
+    message = wire.decode(data)
+    assert message == wire.TelemetryWindow(False, 40, (1.5, 3.5, 2.5), (4.9, 5.1, 5.0))
+    assert wire.encode(message) == data
+
+
+def test_server_messages_decode_on_esp32():
+    unlock = wire.encode(wire.Unlock("tx-1", "pi_123"))
+    assert esp_wire.decode(unlock) == (esp_wire.UNLOCK, "tx-1", "pi_123")
+    result = wire.encode(wire.Result("tx-1", wire.CAPTURED, 350))
+    assert esp_wire.decode(result) == (esp_wire.RESULT, "tx-1", esp_wire.CAPTURED, 350)
+    telemetry = wire.encode(wire.Telemetry(False, 5.0, (1.0,)))
+    assert esp_wire.decode(telemetry) == (esp_wire.TELEMETRY, False, 5.0, (1.0,))
+
+
+@pytest.mark.parametrize("data", [
+    wire.encode(wire.Unlock("tx-1", "pi_123")),
+    wire.encode(wire.DoorEvent("tx-1", (("cola", 1),), 355.0)),
+    wire.encode(wire.Result("tx-1", wire.CAPTURED, 350)),
+    wire.encode(wire.Telemetry(True, 5.0, (1.0, 2.0))),
+    wire.encode(wire.TelemetryWindow(True, 4, (1.0, 2.0, 1.5), (5.0, 5.0, 5.0))),
+])
+def test_truncated_message_raises_on_server(data):
+    for end in range(len(data)):
+        with pytest.raises(wire.WireError):
+            wire.decode(data[:end])
+
+
+@pytest.mark.parametrize("data", [
+    wire.encode(wire.Unlock("tx-1", "pi_123")),
+    wire.encode(wire.Result("tx-1", wire.CAPTURED, 350)),
+    wire.encode(wire.Telemetry(True, 5.0, (1.0, 2.0))),
+])
+def test_truncated_message_raises_on_esp32(data):
+    for end in range(len(data)):
+        with pytest.raises(esp_wire.WireError):
+            esp_wire.decode(data[:end])
+
+
+@pytest.mark.parametrize("quantity", [256, -1])
+def test_quantity_out_of_range_is_rejected(quantity):
+    with pytest.raises(wire.WireError):
+        wire.encode(wire.DoorEvent("tx-1", (("cola", quantity),), 0.0))
+    with pytest.raises(esp_wire.WireError):
+        esp_wire.encode_door("tx-1", {"cola": quantity}, 0.0)
+
+
+def test_quantity_at_the_limit_round_trips():
+    data = esp_wire.encode_door("tx-1", {"chips": 255}, 0.0)
+    assert wire.decode(data).items == (("chips", 255),)